@@ -1,6 +1,8 @@
 ﻿import base64
+import atexit
 import datetime
 import hashlib
+import heapq
 import io
 import json
 import logging
@@ -9,12 +11,19 @@ import os
 import random
 import re
 import shutil
+import sqlite3
 import string
+import sys
 import tempfile
 import threading
 import time
 import uuid
 import zipfile
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+from copy import deepcopy
 
 from flask import Flask, Response, g, has_request_context, jsonify, render_template, request, send_file, session
 from PIL import Image, UnidentifiedImageError
@@ -31,13 +40,18 @@ from poster_engine import (
     load_config,
     save_config,
     validate_content,
+    RENDER_QUALITY_LEVELS,
     PresetGenerator,
+    ShadowCache,
+    StageClock,
+    estimate_render_memory,
 )
 
 try:
-    from redis import Redis
+    from redis import ConnectionPool, Redis
     from redis.exceptions import RedisError
 except Exception:
+    ConnectionPool = None
     Redis = None
 
     class RedisError(Exception):
@@ -52,18 +66,57 @@ DATA_DIR = os.path.abspath(DATA_DIR)
 UPLOAD_DIR = os.path.join(DATA_DIR, "uploads")
 OUTPUT_DIR = os.path.join(DATA_DIR, "outputs")
 OUTPUT_META_PATH = os.path.join(DATA_DIR, "output_index.json")
+OUTPUT_INDEX_DB_PATH = os.path.join(DATA_DIR, "output_index.sqlite3")
+ACCOUNTS_DB_PATH = os.path.join(DATA_DIR, "accounts.sqlite3")
 USER_CONFIG_DIR = os.path.join(DATA_DIR, "user_configs")
+USER_TEMPLATE_DIR = os.path.join(DATA_DIR, "user_templates")
 USERS_PATH = os.path.join(DATA_DIR, "users.json")
 CONFIG_PATH = os.path.join(DATA_DIR, "web_config.json")
+PREVIEW_DISK_DIR = os.path.join(DATA_DIR, "preview_cache")
+ADMIN_JOB_DIR = os.path.join(DATA_DIR, "admin_jobs")
+BACKUP_MANIFEST_DIR = os.path.join(DATA_DIR, "backup_manifests")
+METRICS_DIR = os.path.join(DATA_DIR, "metrics")
+PROFILE_DIR = os.path.join(DATA_DIR, "profiles")
 MAX_SAVED_OUTPUTS_PER_USER = max(1, int(os.environ.get("POSTER_MAX_SAVED_OUTPUTS_PER_USER", "3")))
+OUTPUT_MAX_AGE_DAYS = max(0.0, float(os.environ.get("POSTER_OUTPUT_MAX_AGE_DAYS", "0")))
+OUTPUT_RETENTION_INTERVAL_SECONDS = max(5, int(os.environ.get("POSTER_OUTPUT_RETENTION_SECONDS", "60")))
+OUTPUT_RETENTION_BATCH_SIZE = 500
 MAX_UPLOAD_BYTES = 15 * 1024 * 1024
 ALLOWED_IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp"}
+# Already-compressed formats go into backups as ZIP_STORED; everything else is deflated.
+BACKUP_STORED_EXTENSIONS = ALLOWED_IMAGE_EXTENSIONS | {".gif", ".pdf", ".zip", ".gz"}
+BACKUP_STREAM_CHUNK_BYTES = 1024 * 1024
+BACKUP_MANIFEST_KEEP = max(2, int(os.environ.get("POSTER_BACKUP_MANIFEST_KEEP", "60")))
+EXPORT_STREAM_CHUNK_CHARS = 64 * 1024
+BACKUP_ID_RE = re.compile(r"^\d{8}_\d{6}_[0-9a-f]{6}$")
 PREVIEW_CACHE_TTL_SECONDS = max(30, int(os.environ.get("POSTER_PREVIEW_CACHE_TTL", "300")))
 PREVIEW_CACHE_PREFIX = os.environ.get("POSTER_PREVIEW_CACHE_PREFIX", "poster:preview")
+PREVIEW_CACHE_BLOB_PREFIX = f"{PREVIEW_CACHE_PREFIX}-blob"
+PREVIEW_CACHE_REF_MARKER = b"ref:"
+# Stored blobs start with a one-byte codec tag: b"Z" for zlib, b"R" for raw PNG bytes.
+PREVIEW_CACHE_MIN_COMPRESS_GAIN = 0.05
 PREVIEW_CACHE_MAX_LOCAL_ITEMS = max(16, int(os.environ.get("POSTER_PREVIEW_CACHE_LOCAL_MAX", "128")))
+PREVIEW_CACHE_MAX_LOCAL_BYTES = max(
+    1024 * 1024, int(os.environ.get("POSTER_PREVIEW_CACHE_LOCAL_MAX_BYTES", str(128 * 1024 * 1024)))
+)
+PREVIEW_CACHE_MAX_LOCAL_USER_ITEMS = max(1, int(os.environ.get("POSTER_PREVIEW_CACHE_LOCAL_USER_MAX", "16")))
+PREVIEW_CACHE_MAX_LOCAL_USER_BYTES = max(
+    256 * 1024, int(os.environ.get("POSTER_PREVIEW_CACHE_LOCAL_USER_MAX_BYTES", str(24 * 1024 * 1024)))
+)
+PREVIEW_CACHE_DISK_ENABLED = str(os.environ.get("POSTER_PREVIEW_CACHE_DISK", "0")).strip().lower() in {"1", "true", "yes", "on"}
+PREVIEW_CACHE_DISK_MAX_BYTES = max(
+    16 * 1024 * 1024, int(os.environ.get("POSTER_PREVIEW_CACHE_DISK_MAX_BYTES", str(512 * 1024 * 1024)))
+)
+PREVIEW_CACHE_DISK_JANITOR_SECONDS = max(5, int(os.environ.get("POSTER_PREVIEW_CACHE_DISK_JANITOR_SECONDS", "60")))
+REDIS_MAX_CONNECTIONS = max(2, int(os.environ.get("POSTER_REDIS_MAX_CONNECTIONS", "32")))
+REDIS_SOCKET_TIMEOUT = max(0.05, float(os.environ.get("POSTER_REDIS_SOCKET_TIMEOUT", "0.5")))
+REDIS_FAILURE_THRESHOLD = max(1, int(os.environ.get("POSTER_REDIS_FAILURE_THRESHOLD", "3")))
+REDIS_RETRY_SECONDS = max(1.0, float(os.environ.get("POSTER_REDIS_RETRY_SECONDS", "5")))
 PREVIEW_ID_RE = re.compile(r"^[0-9a-f]{64}$")
 DATE_YMD_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
 HEX_COLOR_RE = re.compile(r"^#[0-9A-Fa-f]{6}$")
+ADMIN_JOB_ID_RE = re.compile(r"^[0-9a-f]{12}$")
+PROFILE_NAME_RE = re.compile(r"^\d{8}_\d{6}_[A-Za-z0-9_-]{1,40}$")
 ADMIN_TOKEN = (os.environ.get("POSTER_ADMIN_TOKEN") or "").strip()
 ENV_NAME = str(os.environ.get("POSTER_ENV") or os.environ.get("FLASK_ENV") or "").strip().lower()
 IS_PRODUCTION = ENV_NAME in {"prod", "production"}
@@ -76,14 +129,48 @@ SESSION_COOKIE_SECURE = str(
 LOGIN_WINDOW_SECONDS = max(60, int(os.environ.get("POSTER_LOGIN_WINDOW_SECONDS", "600")))
 LOGIN_MAX_ATTEMPTS = max(3, int(os.environ.get("POSTER_LOGIN_MAX_ATTEMPTS", "8")))
 LOGIN_LOCK_SECONDS = max(60, int(os.environ.get("POSTER_LOGIN_LOCK_SECONDS", "600")))
+METRICS_FLUSH_SECONDS = max(1, int(os.environ.get("POSTER_METRICS_FLUSH_SECONDS", "5")))
+METRICS_MAX_FILES = 200
+RENDER_SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0)
+SLOW_PROFILE_THRESHOLD_MS = max(0, int(os.environ.get("POSTER_SLOW_PROFILE_MS", "0")))
+SLOW_PROFILE_INTERVAL_MS = max(1, int(os.environ.get("POSTER_SLOW_PROFILE_INTERVAL_MS", "10")))
+SLOW_PROFILE_KEEP = max(1, int(os.environ.get("POSTER_SLOW_PROFILE_KEEP", "20")))
+SLOW_PROFILE_ENDPOINTS = {"api_preview", "api_generate"}
+RENDER_MEMORY_BUDGET_BYTES = max(0, int(os.environ.get("POSTER_RENDER_MEMORY_BUDGET_MB", "0"))) * 1024 * 1024
+RENDER_MEMORY_TRACKING = str(os.environ.get("POSTER_RENDER_MEMORY_TRACKING", "0")).strip().lower() in {"1", "true", "yes", "on"}
+RENDER_CONCURRENCY = max(0, int(os.environ.get("POSTER_RENDER_CONCURRENCY", str(os.cpu_count() or 2))))
+RENDER_QUEUE_SIZE = max(0, int(os.environ.get("POSTER_RENDER_QUEUE", "16")))
+RENDER_PREVIEW_WAIT_SECONDS = max(0.0, float(os.environ.get("POSTER_RENDER_PREVIEW_WAIT_SECONDS", "5")))
+RENDER_GENERATE_WAIT_SECONDS = max(0.0, float(os.environ.get("POSTER_RENDER_GENERATE_WAIT_SECONDS", "30")))
+RENDER_RETRY_AFTER_SECONDS = max(1, int(os.environ.get("POSTER_RENDER_RETRY_AFTER_SECONDS", "2")))
+PREVIEW_QUALITY = str(os.environ.get("POSTER_PREVIEW_QUALITY", "auto")).strip().lower()
+if PREVIEW_QUALITY not in RENDER_QUALITY_LEVELS:
+    PREVIEW_QUALITY = "auto"
+CARD_STYLE_LABELS = {"single", "ticket", "double", "block", "stack", "flip", "aurora", "paper_relief"}
+CONFIG_WRITE_BEHIND_SECONDS = max(0.0, float(os.environ.get("POSTER_CONFIG_WRITE_BEHIND_SECONDS", "2")))
+USER_CONFIG_CACHE_MAX_ITEMS = max(64, int(os.environ.get("POSTER_USER_CONFIG_CACHE_MAX", "4096")))
+GLOBAL_CONFIG_RECHECK_SECONDS = max(0.0, float(os.environ.get("POSTER_GLOBAL_CONFIG_RECHECK_SECONDS", "5")))
+TEMPLATE_STORE_KEYS = ("custom_templates", "shop_name_hist", "address_hist", "phone_hist", "slogan_hist")
+MAX_CUSTOM_TEMPLATES = max(1, int(os.environ.get("POSTER_MAX_CUSTOM_TEMPLATES", "200")))
+MAX_TEMPLATE_NAME_CHARS = 64
+MAX_TEMPLATE_CONTENT_CHARS = 20000
+GUEST_CLEANUP_BATCH_SIZE = max(1, min(500, int(os.environ.get("POSTER_GUEST_CLEANUP_BATCH", "200"))))
+ADMIN_JOB_STALE_SECONDS = 120
+ADMIN_JOB_HEARTBEAT_SECONDS = 15
+ADMIN_JOB_KEEP = 50
+SQLITE_BUSY_TIMEOUT_SECONDS = max(1.0, float(os.environ.get("POSTER_SQLITE_BUSY_TIMEOUT", "10")))
 MAX_UPLOAD_IMAGE_PIXELS = max(1_000_000, int(os.environ.get("POSTER_UPLOAD_MAX_PIXELS", "40000000")))
 
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 os.makedirs(USER_CONFIG_DIR, exist_ok=True)
-_OUTPUT_META_LOCK = threading.Lock()
+os.makedirs(USER_TEMPLATE_DIR, exist_ok=True)
 _LOGIN_FAIL_LOCK = threading.Lock()
 _LOGIN_FAIL_BUCKETS = {}
+_USER_CONFIG_CACHE_LOCK = threading.Lock()
+_USER_CONFIG_CACHE = OrderedDict()
+_GLOBAL_CONFIG_LOCK = threading.Lock()
+_GLOBAL_CONFIG_STATE = {"expires_at": 0.0, "cfg": None}
 
 app = Flask(__name__)
 app.config["JSON_AS_ASCII"] = False
@@ -128,76 +215,1222 @@ def _log_exception(event, **context):
     LOGGER.exception("%s | %s", event, json.dumps(payload, ensure_ascii=False, default=str))
 
 
+def _read_lock_token(path):
+    try:
+        with open(path, "r", encoding="ascii") as f:
+            return f.read()
+    except (OSError, ValueError):
+        return ""
+
+
+def _break_stale_lock(path, stale_seconds):
+    # True if the lock at path was stale and is gone, so the caller may retry.
+    # The lock is first moved aside under a unique name and only deleted if the
+    # moved file is the one judged stale: another process may have broken it and
+    # taken a fresh lock in between, and that one is linked back in place.
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return True
+    if time.time() - st.st_mtime <= stale_seconds:
+        return False
+    aside = f"{path}.{uuid.uuid4().hex}.stale"
+    try:
+        os.rename(path, aside)
+    except FileNotFoundError:
+        return True
+    except OSError:
+        return False
+    moved = os.stat(aside)
+    if (moved.st_ino, moved.st_mtime_ns) != (st.st_ino, st.st_mtime_ns):
+        try:
+            os.link(aside, path)
+        except OSError:
+            _log_event(logging.WARNING, "file_lock.restore_failed", path=path)
+        os.remove(aside)
+        return False
+    os.remove(aside)
+    _log_event(logging.WARNING, "file_lock.stale_broken", path=path, age_seconds=round(time.time() - st.st_mtime, 1))
+    return True
+
+
+@contextmanager
+def _file_lock(path, timeout=10.0, stale_seconds=60.0):
+    # Cross-process mutex for workers sharing DATA_DIR: an O_EXCL lock file holding
+    # the owner's pid and a random token. A lock older than stale_seconds is taken
+    # to be left by a killed process and broken; on release the file is removed
+    # only if it still holds our token. TimeoutError if it cannot be taken within
+    # timeout (0 = try once).
+    token = f"{os.getpid()} {uuid.uuid4().hex}"
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            if _break_stale_lock(path, stale_seconds):
+                continue
+            if time.monotonic() >= deadline:
+                raise TimeoutError(path)
+            time.sleep(0.01)
+    try:
+        os.write(fd, token.encode("ascii"))
+    finally:
+        os.close(fd)
+    try:
+        yield
+    finally:
+        if _read_lock_token(path) == token:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        else:
+            _log_event(logging.WARNING, "file_lock.lost", path=path)
+
+
+class LocalPreviewTier:
+    # LRU bounded by entry count and total bytes. Expired entries are dropped lazily
+    # (on read or when they reach the LRU head), and each user has its own quota so
+    # one busy editor cannot flush everyone else's previews.
+    def __init__(self, max_items, max_bytes, user_max_items, user_max_bytes, ttl_seconds):
+        self.max_items = max(1, int(max_items))
+        self.max_bytes = max(1, int(max_bytes))
+        self.user_max_items = max(1, min(int(user_max_items), self.max_items))
+        self.user_max_bytes = max(1, min(int(user_max_bytes), self.max_bytes))
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._user_keys = {}
+        self._user_bytes = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._expired = 0
+        self._evictions = 0
+        self._user_evictions = 0
+        self._rejected = 0
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        size = len(entry[1])
+        self._bytes -= size
+        user_id = key[0]
+        keys = self._user_keys.get(user_id)
+        if keys is not None:
+            keys.pop(key[1], None)
+            if not keys:
+                self._user_keys.pop(user_id, None)
+                self._user_bytes.pop(user_id, None)
+                return
+        self._user_bytes[user_id] = self._user_bytes.get(user_id, 0) - size
+
+    def get(self, user_id, cache_id, record_miss=True):
+        key = (user_id, cache_id)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += int(record_miss)
+                return None
+            if entry[0] <= now:
+                self._drop(key)
+                self._expired += 1
+                self._misses += int(record_miss)
+                return None
+            self._entries.move_to_end(key)
+            self._user_keys[user_id].move_to_end(cache_id)
+            self._hits += 1
+            return entry[1]
+
+    def set(self, user_id, cache_id, data):
+        size = len(data)
+        key = (user_id, cache_id)
+        with self._lock:
+            self._drop(key)
+            if size > self.user_max_bytes:
+                self._rejected += 1
+                return False
+            user_keys = self._user_keys.setdefault(user_id, OrderedDict())
+            while user_keys and (
+                len(user_keys) >= self.user_max_items or self._user_bytes.get(user_id, 0) + size > self.user_max_bytes
+            ):
+                self._drop((user_id, next(iter(user_keys))))
+                self._user_evictions += 1
+            now = time.time()
+            while self._entries and (len(self._entries) >= self.max_items or self._bytes + size > self.max_bytes):
+                oldest_key, (expires_at, _) = next(iter(self._entries.items()))
+                self._drop(oldest_key)
+                if expires_at <= now:
+                    self._expired += 1
+                else:
+                    self._evictions += 1
+            user_keys = self._user_keys.setdefault(user_id, OrderedDict())
+            self._entries[key] = (now + self.ttl_seconds, data)
+            user_keys[cache_id] = None
+            self._user_bytes[user_id] = self._user_bytes.get(user_id, 0) + size
+            self._bytes += size
+            return True
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "users": len(self._user_keys),
+                "max_items": self.max_items,
+                "max_bytes": self.max_bytes,
+                "user_max_items": self.user_max_items,
+                "user_max_bytes": self.user_max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "user_evictions": self._user_evictions,
+                "expired": self._expired,
+                "rejected_oversize": self._rejected,
+            }
+
+
+class DiskPreviewTier:
+    # Host-wide preview cache shared by all workers on the same DATA_DIR. Files are
+    # sharded by the first two hex chars of the cache id, written via rename, and
+    # expired by mtime; a janitor thread enforces TTL and the total size cap.
+    def __init__(self, root_dir, max_bytes, ttl_seconds, janitor_seconds):
+        self.root_dir = root_dir
+        self.max_bytes = max(1, int(max_bytes))
+        self.ttl_seconds = ttl_seconds
+        self.janitor_seconds = janitor_seconds
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._writes = 0
+        self._errors = 0
+        self._janitor_thread = None
+        self._janitor_pid = 0
+        self._last_sweep = {}
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def _path(self, user_id, cache_id):
+        return os.path.join(self.root_dir, cache_id[:2], f"{user_id}_{cache_id}.png")
+
+    def _count(self, attr):
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def get(self, user_id, cache_id, record_miss=True):
+        path = self._path(user_id, cache_id)
+        try:
+            st = os.stat(path)
+            if st.st_mtime + self.ttl_seconds <= time.time():
+                os.remove(path)
+                if record_miss:
+                    self._count("_misses")
+                return None
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            if record_miss:
+                self._count("_misses")
+            return None
+        except OSError:
+            self._count("_errors")
+            _log_exception("preview_cache.disk_read_failed", path=path)
+            return None
+        self._count("_hits")
+        return data
+
+    def set(self, user_id, cache_id, data):
+        self._ensure_janitor()
+        path = self._path(user_id, cache_id)
+        folder = os.path.dirname(path)
+        tmp_path = ""
+        try:
+            os.makedirs(folder, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".png", dir=folder)
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            self._count("_errors")
+            _log_exception("preview_cache.disk_write_failed", path=path)
+            if tmp_path:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+            return False
+        self._count("_writes")
+        return True
+
+    def _ensure_janitor(self):
+        with self._lock:
+            if self._janitor_thread is not None and self._janitor_thread.is_alive() and self._janitor_pid == os.getpid():
+                return
+            self._janitor_pid = os.getpid()
+            self._janitor_thread = threading.Thread(target=self._janitor_loop, name="preview-disk-janitor", daemon=True)
+            self._janitor_thread.start()
+
+    def _janitor_loop(self):
+        while True:
+            time.sleep(self.janitor_seconds)
+            try:
+                self.sweep()
+            except Exception:
+                _log_exception("preview_cache.disk_sweep_failed", root=self.root_dir)
+
+    def sweep(self):
+        started = time.time()
+        cutoff = started - self.ttl_seconds
+        live = []
+        total = 0
+        removed_expired = 0
+        removed_capacity = 0
+        for shard in os.scandir(self.root_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                # Orphaned temp files from a crashed writer expire like regular entries.
+                if st.st_mtime <= cutoff:
+                    try:
+                        os.remove(entry.path)
+                        removed_expired += 1
+                    except FileNotFoundError:
+                        pass
+                    continue
+                live.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+        if total > self.max_bytes:
+            live.sort()
+            for _, size, path in live:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    removed_capacity += 1
+                except FileNotFoundError:
+                    pass
+                total -= size
+        result = {
+            "files": len(live) - removed_capacity,
+            "bytes": total,
+            "removed_expired": removed_expired,
+            "removed_capacity": removed_capacity,
+            "elapsed_ms": round((time.time() - started) * 1000, 1),
+            "at": datetime.datetime.now().isoformat(timespec="seconds"),
+        }
+        with self._lock:
+            self._last_sweep = result
+        if removed_expired or removed_capacity:
+            _log_event(logging.INFO, "preview_cache.disk_sweep", **result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "root": self.root_dir,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+                "writes": self._writes,
+                "errors": self._errors,
+                "last_sweep": dict(self._last_sweep),
+            }
+
+
+class RedisTier:
+    # Circuit breaker around a pooled Redis client. After REDIS_FAILURE_THRESHOLD
+    # consecutive errors the breaker opens and callers skip Redis entirely; a
+    # background thread pings until Redis answers again and then closes it.
+    STATE_CLOSED = "closed"
+    STATE_OPEN = "open"
+
+    def __init__(self, redis_url):
+        self.redis_url = redis_url
+        self._pool = ConnectionPool.from_url(
+            redis_url,
+            max_connections=REDIS_MAX_CONNECTIONS,
+            socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+            socket_timeout=REDIS_SOCKET_TIMEOUT,
+        )
+        self._client = Redis(connection_pool=self._pool)
+        self._lock = threading.Lock()
+        self._state = self.STATE_CLOSED
+        self._failures = 0
+        self._trips = 0
+        self._ops = 0
+        self._errors = 0
+        self._skipped = 0
+        self._last_error = ""
+        self._opened_at = 0.0
+        self._probe_thread = None
+        self._probe_pid = 0
+        try:
+            self._client.ping()
+        except RedisError as e:
+            _log_event(logging.WARNING, "preview_cache.redis_init_failed", redis_url=redis_url, error=str(e))
+            self._trip(str(e))
+
+    @property
+    def available(self):
+        return self._state == self.STATE_CLOSED
+
+    def execute(self, op, fn, default=None):
+        if self._state != self.STATE_CLOSED:
+            with self._lock:
+                self._skipped += 1
+            self._ensure_probe()
+            return default
+        try:
+            result = fn(self._client)
+        except RedisError as e:
+            self._record_failure(op, e)
+            return default
+        with self._lock:
+            self._ops += 1
+            self._failures = 0
+        return result
+
+    def _record_failure(self, op, err):
+        with self._lock:
+            self._ops += 1
+            self._errors += 1
+            self._failures += 1
+            self._last_error = f"{op}: {err}"
+            should_trip = self._failures >= REDIS_FAILURE_THRESHOLD and self._state == self.STATE_CLOSED
+        _log_event(logging.WARNING, "preview_cache.redis_op_failed", op=op, error=str(err))
+        if should_trip:
+            self._trip(str(err))
+
+    def _trip(self, reason):
+        with self._lock:
+            if self._state == self.STATE_OPEN:
+                return
+            self._state = self.STATE_OPEN
+            self._opened_at = time.time()
+            self._trips += 1
+            self._last_error = reason
+        _log_event(
+            logging.ERROR,
+            "preview_cache.redis_circuit_open",
+            redis_url=self.redis_url,
+            reason=reason,
+            retry_seconds=REDIS_RETRY_SECONDS,
+        )
+        self._ensure_probe()
+
+    def _ensure_probe(self):
+        # Threads do not survive fork, so track the owning pid for gunicorn workers.
+        with self._lock:
+            alive = self._probe_thread is not None and self._probe_thread.is_alive() and self._probe_pid == os.getpid()
+            if alive or self._state != self.STATE_OPEN:
+                return
+            self._probe_pid = os.getpid()
+            self._probe_thread = threading.Thread(target=self._probe_loop, name="redis-probe", daemon=True)
+            self._probe_thread.start()
+
+    def _probe_loop(self):
+        while self._state == self.STATE_OPEN:
+            time.sleep(REDIS_RETRY_SECONDS)
+            try:
+                self._client.ping()
+            except RedisError as e:
+                with self._lock:
+                    self._last_error = f"ping: {e}"
+                continue
+            with self._lock:
+                down_seconds = round(time.time() - self._opened_at, 1)
+                self._state = self.STATE_CLOSED
+                self._failures = 0
+            _log_event(logging.INFO, "preview_cache.redis_circuit_closed", redis_url=self.redis_url, down_seconds=down_seconds)
+
+    def stats(self):
+        with self._lock:
+            pool_in_use = len(getattr(self._pool, "_in_use_connections", ()) or ())
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "trips": self._trips,
+                "ops": self._ops,
+                "errors": self._errors,
+                "skipped_while_open": self._skipped,
+                "last_error": self._last_error,
+                "open_since": datetime.datetime.fromtimestamp(self._opened_at).isoformat(timespec="seconds")
+                if self._state == self.STATE_OPEN
+                else "",
+                "pool_max_connections": REDIS_MAX_CONNECTIONS,
+                "pool_in_use": pool_in_use,
+            }
+
+
 class PreviewCache:
     def __init__(self):
         self._redis = None
-        self._local = {}
-        self._lock = threading.Lock()
+        self._local = LocalPreviewTier(
+            PREVIEW_CACHE_MAX_LOCAL_ITEMS,
+            PREVIEW_CACHE_MAX_LOCAL_BYTES,
+            PREVIEW_CACHE_MAX_LOCAL_USER_ITEMS,
+            PREVIEW_CACHE_MAX_LOCAL_USER_BYTES,
+            PREVIEW_CACHE_TTL_SECONDS,
+        )
+        self._disk = None
+        if PREVIEW_CACHE_DISK_ENABLED:
+            self._disk = DiskPreviewTier(
+                PREVIEW_DISK_DIR,
+                PREVIEW_CACHE_DISK_MAX_BYTES,
+                PREVIEW_CACHE_TTL_SECONDS,
+                PREVIEW_CACHE_DISK_JANITOR_SECONDS,
+            )
+        self._redis_stats_lock = threading.Lock()
+        self._redis_stats = {
+            "hits": 0,
+            "misses": 0,
+            "refs_written": 0,
+            "blobs_written": 0,
+            "blobs_reused": 0,
+            "bytes_deduplicated": 0,
+        }
         redis_url = (os.environ.get("POSTER_REDIS_URL") or "").strip()
         if not redis_url or Redis is None:
             return
         try:
-            cli = Redis.from_url(
-                redis_url,
-                decode_responses=False,
-                socket_connect_timeout=0.5,
-                socket_timeout=0.5,
-            )
-            cli.ping()
-            self._redis = cli
+            self._redis = RedisTier(redis_url)
         except Exception:
             self._redis = None
-            _log_exception("preview_cache.redis_init_failed", redis_url=redis_url)
+            _log_exception("preview_cache.redis_config_invalid", redis_url=redis_url)
 
     def _key(self, user_id, cache_id):
         return f"{PREVIEW_CACHE_PREFIX}:{user_id}:{cache_id}"
 
-    def get(self, user_id, cache_id):
-        if self._redis is not None:
-            try:
-                data = self._redis.get(self._key(user_id, cache_id))
-                if data:
-                    return data
-            except RedisError:
-                _log_event(logging.WARNING, "preview_cache.redis_get_failed", user_id=user_id, cache_id=cache_id)
-        local_key = (user_id, cache_id)
-        now = time.time()
-        with self._lock:
-            entry = self._local.get(local_key)
-            if not entry:
-                return None
-            expires_at, data = entry
-            if expires_at <= now:
-                self._local.pop(local_key, None)
-                return None
+    def _blob_key(self, fingerprint):
+        return f"{PREVIEW_CACHE_BLOB_PREFIX}:{fingerprint}"
+
+    @staticmethod
+    def _encode_blob(data):
+        packed = zlib.compress(data, 6)
+        if len(packed) <= len(data) * (1 - PREVIEW_CACHE_MIN_COMPRESS_GAIN):
+            return b"Z" + packed
+        return b"R" + data
+
+    @staticmethod
+    def _decode_blob(blob):
+        if not blob:
+            return None
+        codec, body = blob[:1], blob[1:]
+        if codec == b"Z":
+            return zlib.decompress(body)
+        if codec == b"R":
+            return body
+        return None
+
+    def _redis_get(self, cli, user_id, cache_id):
+        value = cli.get(self._key(user_id, cache_id))
+        if not value:
+            return None
+        if not value.startswith(PREVIEW_CACHE_REF_MARKER):
+            # Entries written before blobs were deduplicated hold the PNG bytes directly.
+            return value
+        fingerprint = value[len(PREVIEW_CACHE_REF_MARKER):].decode("ascii", "ignore")
+        return self._decode_blob(cli.get(self._blob_key(fingerprint)))
+
+    def _redis_set(self, cli, user_id, cache_id, data):
+        # Blobs are shared by content fingerprint; every new reference pushes the blob
+        # TTL out again, so a blob always outlives the refs pointing at it.
+        fingerprint = hashlib.sha256(data).hexdigest()
+        blob_key = self._blob_key(fingerprint)
+        reused = bool(cli.expire(blob_key, PREVIEW_CACHE_TTL_SECONDS))
+        if not reused:
+            cli.setex(blob_key, PREVIEW_CACHE_TTL_SECONDS, self._encode_blob(data))
+        cli.setex(self._key(user_id, cache_id), PREVIEW_CACHE_TTL_SECONDS, PREVIEW_CACHE_REF_MARKER + fingerprint.encode("ascii"))
+        with self._redis_stats_lock:
+            self._redis_stats["refs_written"] += 1
+            if reused:
+                self._redis_stats["blobs_reused"] += 1
+                self._redis_stats["bytes_deduplicated"] += len(data)
+            else:
+                self._redis_stats["blobs_written"] += 1
+        return reused
+
+    def redis_memory_report(self, sample=200):
+        if self._redis is None or not self._redis.available:
+            return None
+
+        def _scan(cli, pattern):
+            keys = []
+            for key in cli.scan_iter(match=pattern, count=500):
+                keys.append(key)
+                if len(keys) >= sample:
+                    break
+            sizes = [int(cli.memory_usage(key) or 0) for key in keys]
+            return {
+                "sampled_keys": len(keys),
+                "avg_bytes": round(sum(sizes) / len(sizes), 1) if sizes else 0.0,
+                "max_bytes": max(sizes) if sizes else 0,
+            }
+
+        def _report(cli):
+            return {
+                "refs": _scan(cli, f"{PREVIEW_CACHE_PREFIX}:*"),
+                "blobs": _scan(cli, f"{PREVIEW_CACHE_BLOB_PREFIX}:*"),
+                "used_memory": int((cli.info("memory") or {}).get("used_memory", 0)),
+            }
+
+        return self._redis.execute("memory_report", _report)
+
+    def get(self, user_id, cache_id, record_miss=True):
+        # record_miss=False for a lookup that another one follows for the same
+        # request, so a request counts at most one miss per tier.
+        data = self._local.get(user_id, cache_id, record_miss)
+        if data is not None:
             return data
+        if self._disk is not None:
+            data = self._disk.get(user_id, cache_id, record_miss)
+            if data:
+                self._local.set(user_id, cache_id, data)
+                return data
+        if self._redis is not None:
+            data = self._redis.execute("get", lambda cli: self._redis_get(cli, user_id, cache_id))
+            if data or record_miss:
+                with self._redis_stats_lock:
+                    self._redis_stats["hits" if data else "misses"] += 1
+            if data:
+                self._local.set(user_id, cache_id, data)
+                if self._disk is not None:
+                    self._disk.set(user_id, cache_id, data)
+                return data
+        return None
 
     def set(self, user_id, cache_id, data):
         if self._redis is not None:
+            self._redis.execute("set", lambda cli: self._redis_set(cli, user_id, cache_id, data))
+        if self._disk is not None:
+            self._disk.set(user_id, cache_id, data)
+        self._local.set(user_id, cache_id, data)
+
+    def stats(self):
+        return {
+            "ttl_seconds": PREVIEW_CACHE_TTL_SECONDS,
+            "redis_enabled": self._redis is not None,
+            "redis": self._redis.stats() if self._redis is not None else None,
+            "redis_blobs": self._redis_blob_stats() if self._redis is not None else None,
+            "disk": self._disk.stats() if self._disk is not None else None,
+            "local": self._local.stats(),
+        }
+
+    def _redis_blob_stats(self):
+        with self._redis_stats_lock:
+            return dict(self._redis_stats)
+
+
+PREVIEW_CACHE = PreviewCache()
+
+
+class MetricsRegistry:
+    # Per-process counters, histograms and gauges. Each worker flushes its values to
+    # METRICS_DIR/<pid>_<token>.json; a scrape on any worker sums every file, so the
+    # totals cover all processes. Counters of exited workers keep counting toward the
+    # total; gauges only count while their file is fresh. When old files are pruned
+    # their counters and histograms are first folded into retired.json, so the
+    # summed totals never go down. retired.json also lists every file name it has
+    # absorbed (kept for RETIRED_NAME_TTL_SECONDS after the file is gone), and a
+    # worker whose own file was retired carries on under a new name.
+    RETIRED_NAME = "retired.json"
+    RETIRED_NAME_TTL_SECONDS = 7 * 86400
+
+    def __init__(self, root, flush_seconds):
+        self.root = root
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._collectors = []
+        self._path = ""
+        self._pid = None
+        self._thread = None
+        # Totals already handed to retired.json, subtracted from later snapshots,
+        # and the totals of the last flush (the base if this file is retired next).
+        self._base = ({}, {})
+        self._last_flushed = ({}, {})
+        self._retired_seen = (None, set())
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((labels or {}).items()))
+
+    def inc(self, name, labels=None, value=1):
+        self._ensure_started()
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets):
+        self._ensure_started()
+        key = self._key(name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = {"buckets": list(buckets), "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(hist["buckets"]):
+                if value <= bound:
+                    hist["counts"][i] += 1
+            hist["sum"] += value
+            hist["count"] += 1
+
+    def gauge_add(self, name, labels, delta):
+        self._ensure_started()
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + delta
+
+    def register_collector(self, fn):
+        # fn() -> [(name, labels, value)] of per-process counters that already
+        # live elsewhere (cache tier stats); sampled at flush time.
+        self._collectors.append(fn)
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # A forked worker starts from zero under its own file.
+            self._counters.clear()
+            self._histograms.clear()
+            self._gauges.clear()
+            self._base = ({}, {})
+            self._last_flushed = ({}, {})
+            self._pid = os.getpid()
+            self._path = self._new_path()
+            self._thread = threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True)
+            self._thread.start()
+
+    def _new_path(self):
+        return os.path.join(self.root, f"{os.getpid()}_{uuid.uuid4().hex[:8]}.json")
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            try:
+                self.flush()
+            except Exception:
+                _log_exception("metrics.flush_failed", path=self._path)
+
+    def _snapshot(self):
+        # (file payload, raw totals). The payload holds only what retired.json does
+        # not already count for this process.
+        counters = {}
+        for fn in self._collectors:
             try:
-                self._redis.setex(self._key(user_id, cache_id), PREVIEW_CACHE_TTL_SECONDS, data)
-            except RedisError:
-                _log_event(logging.WARNING, "preview_cache.redis_set_failed", user_id=user_id, cache_id=cache_id)
-        local_key = (user_id, cache_id)
-        expires_at = time.time() + PREVIEW_CACHE_TTL_SECONDS
+                for name, labels, value in fn():
+                    counters[self._key(name, labels)] = value
+            except Exception:
+                _log_exception("metrics.collector_failed")
         with self._lock:
-            self._local[local_key] = (expires_at, data)
-            if len(self._local) <= PREVIEW_CACHE_MAX_LOCAL_ITEMS:
+            counters.update(self._counters)
+            histograms = deepcopy(self._histograms)
+            gauges = dict(self._gauges)
+        base_counters, base_histograms = self._base
+        out_histograms = {}
+        for key, hist in histograms.items():
+            base = base_histograms.get(key)
+            if base is not None and base["buckets"] == hist["buckets"]:
+                hist = {
+                    "buckets": hist["buckets"],
+                    "counts": [a - b for a, b in zip(hist["counts"], base["counts"])],
+                    "sum": hist["sum"] - base["sum"],
+                    "count": hist["count"] - base["count"],
+                }
+            out_histograms[key] = hist
+        payload = {
+            "pid": self._pid,
+            "counters": [
+                [name, dict(labels), value - base_counters.get((name, labels), 0)]
+                for (name, labels), value in counters.items()
+            ],
+            "histograms": [[name, dict(labels), hist] for (name, labels), hist in out_histograms.items()],
+            "gauges": [[name, dict(labels), value] for (name, labels), value in gauges.items()],
+        }
+        return payload, (counters, histograms)
+
+    def _retired_names(self):
+        # Re-read only when retired.json changes; flush calls this every interval.
+        try:
+            mtime = os.stat(os.path.join(self.root, self.RETIRED_NAME)).st_mtime_ns
+        except OSError:
+            return set()
+        if mtime != self._retired_seen[0]:
+            self._retired_seen = (mtime, set(self._retired_files(self._load_retired())))
+        return self._retired_seen[1]
+
+    def flush(self):
+        self._ensure_started()
+        with self._flush_lock:
+            if os.path.basename(self._path) in self._retired_names():
+                # Another worker took this file for stale (the flush thread stalled)
+                # and folded it into retired.json. Rewriting the name would either
+                # be ignored or counted twice, so continue under a new one with
+                # what retired.json holds subtracted.
+                self._base = self._last_flushed
+                old_path, self._path = self._path, self._new_path()
+                _log_event(logging.WARNING, "metrics.file_retired_while_live", old=old_path, new=self._path)
+            payload, totals = self._snapshot()
+            _atomic_write_json(self._path, payload)
+            self._last_flushed = totals
+
+    def _merge(self, counters, histograms, data):
+        for metric, labels, value in data.get("counters") or []:
+            key = self._key(metric, labels)
+            counters[key] = counters.get(key, 0) + value
+        for metric, labels, hist in data.get("histograms") or []:
+            key = self._key(metric, labels)
+            merged = histograms.setdefault(
+                key, {"buckets": hist["buckets"], "counts": [0] * len(hist["buckets"]), "sum": 0.0, "count": 0}
+            )
+            if merged["buckets"] == hist["buckets"]:
+                merged["counts"] = [a + b for a, b in zip(merged["counts"], hist["counts"])]
+                merged["sum"] += hist["sum"]
+                merged["count"] += hist["count"]
+
+    def _load_retired(self):
+        try:
+            with open(os.path.join(self.root, self.RETIRED_NAME), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError):
+            _log_exception("metrics.retired_unreadable")
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    @staticmethod
+    def _retired_files(retired):
+        # {file name: retired_at}; older retired.json files kept a plain list.
+        files = retired.get("files") or {}
+        if isinstance(files, list):
+            return {str(name): time.time() for name in files}
+        return {str(name): float(ts) for name, ts in files.items()} if isinstance(files, dict) else {}
+
+    def _retire(self, stale):
+        # Fold stale worker files into retired.json, then delete them. Absorbed
+        # names stay listed after their files are gone, so neither a crash between
+        # the write and the deletes nor a scrape that read a file just before it
+        # was retired can count it twice.
+        try:
+            with _file_lock(os.path.join(self.root, ".retire.lock"), timeout=0):
+                retired = self._load_retired()
+                counters, histograms = {}, {}
+                self._merge(counters, histograms, retired)
+                done = self._retired_files(retired)
+                now = time.time()
+                for path in stale:
+                    name = os.path.basename(path)
+                    if name in done:
+                        continue
+                    try:
+                        with open(path, "r", encoding="utf-8") as f:
+                            data = json.load(f)
+                    except FileNotFoundError:
+                        continue
+                    except (OSError, ValueError):
+                        data = {}
+                    self._merge(counters, histograms, data)
+                    done[name] = now
+                files = {
+                    name: ts
+                    for name, ts in sorted(done.items())
+                    if ts + self.RETIRED_NAME_TTL_SECONDS > now or os.path.exists(os.path.join(self.root, name))
+                }
+                _atomic_write_json(
+                    os.path.join(self.root, self.RETIRED_NAME),
+                    {
+                        "files": files,
+                        "counters": [[name, dict(labels), value] for (name, labels), value in counters.items()],
+                        "histograms": [[name, dict(labels), hist] for (name, labels), hist in histograms.items()],
+                    },
+                )
+                for path in stale:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+        except TimeoutError:
+            # Another worker is retiring files right now.
+            pass
+
+    def collect(self):
+        self.flush()
+        counters = {}
+        histograms = {}
+        gauges = {}
+        now = time.time()
+        files = []
+        live = 0
+        loaded = []
+        for name in os.listdir(self.root):
+            if not name.endswith(".json") or name.startswith(".") or name == self.RETIRED_NAME:
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                mtime = os.path.getmtime(path)
+                with open(path, "r", encoding="utf-8") as f:
+                    loaded.append((name, path, mtime, json.load(f)))
+            except (OSError, ValueError):
+                continue
+        # Read after the worker files: a file retired meanwhile is then either
+        # listed in retired.json or was read above, never neither.
+        retired = self._load_retired()
+        folded = set(self._retired_files(retired))
+        self._merge(counters, histograms, retired)
+        for name, path, mtime, data in loaded:
+            if name in folded:
+                continue
+            files.append((mtime, path))
+            self._merge(counters, histograms, data)
+            if mtime + self.flush_seconds * 3 >= now:
+                live += 1
+                for metric, labels, value in data.get("gauges") or []:
+                    key = self._key(metric, labels)
+                    gauges[key] = gauges.get(key, 0) + value
+        # Bound the directory across many worker restarts.
+        files.sort()
+        stale = [
+            path
+            for mtime, path in files[: max(0, len(files) - METRICS_MAX_FILES)]
+            if mtime + self.flush_seconds * 3 < now
+        ]
+        if stale:
+            self._retire(stale)
+        gauges[("poster_metrics_workers", ())] = live
+        return counters, histograms, gauges
+
+
+METRICS = MetricsRegistry(METRICS_DIR, METRICS_FLUSH_SECONDS)
+
+
+def _preview_cache_metric_samples():
+    stats = PREVIEW_CACHE.stats()
+    samples = []
+    tiers = {"local": stats.get("local"), "disk": stats.get("disk"), "redis": stats.get("redis_blobs")}
+    for tier, tier_stats in tiers.items():
+        if not tier_stats:
+            continue
+        samples.append(("poster_preview_cache_lookups_total", {"tier": tier, "result": "hit"}, tier_stats.get("hits", 0)))
+        samples.append(("poster_preview_cache_lookups_total", {"tier": tier, "result": "miss"}, tier_stats.get("misses", 0)))
+    return samples
+
+
+METRICS.register_collector(_preview_cache_metric_samples)
+
+
+class SlowRequestProfiler:
+    # Opt-in sampling profiler. While a watched request runs, one shared thread
+    # samples its stack every interval_ms; if the request ends up slower than
+    # threshold_ms the folded stacks are saved under root, newest `keep` kept.
+    def __init__(self, root, threshold_ms, interval_ms, keep):
+        self.root = root
+        self.threshold_ms = threshold_ms
+        self.interval = interval_ms / 1000.0
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._active = {}
+        self._thread = None
+        self._pid = None
+        self._saved = 0
+
+    @property
+    def enabled(self):
+        return self.threshold_ms > 0
+
+    def begin(self):
+        self._ensure_started()
+        with self._lock:
+            self._active[threading.get_ident()] = {"stacks": {}, "samples": 0}
+
+    def end(self, request_id, endpoint, elapsed_ms):
+        with self._lock:
+            state = self._active.pop(threading.get_ident(), None)
+        if state is None or elapsed_ms < self.threshold_ms or not state["samples"]:
+            return None
+        # request_id comes from the client's X-Request-Id and need not be unique;
+        # the random suffix keeps two captures in the same second apart.
+        safe_id = re.sub(r"[^A-Za-z0-9_-]", "", str(request_id or ""))[:32] or "req"
+        name = f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_{safe_id}_{uuid.uuid4().hex[:6]}"
+        capture = {
+            "name": name,
+            "request_id": request_id,
+            "endpoint": endpoint,
+            "elapsed_ms": round(elapsed_ms, 1),
+            "interval_ms": round(self.interval * 1000, 1),
+            "samples": state["samples"],
+            "captured_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "stacks": state["stacks"],
+        }
+        try:
+            _atomic_write_json(os.path.join(self.root, f"{name}.json"), capture)
+            self._prune()
+        except Exception:
+            _log_exception("slow_profile.save_failed", request_id=request_id)
+            return None
+        self._saved += 1
+        _log_event(logging.WARNING, "slow_profile.captured", name=name, endpoint=endpoint, elapsed_ms=round(elapsed_ms, 1))
+        return name
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
                 return
-            stale_keys = [k for k, v in self._local.items() if v[0] <= time.time()]
-            for k in stale_keys:
-                self._local.pop(k, None)
-            while len(self._local) > PREVIEW_CACHE_MAX_LOCAL_ITEMS:
-                self._local.pop(next(iter(self._local)))
+            self._pid = os.getpid()
+            self._active.clear()
+            self._thread = threading.Thread(target=self._sample_loop, name="slow-profiler", daemon=True)
+            self._thread.start()
+
+    @staticmethod
+    def _fold(frame):
+        parts = []
+        while frame is not None:
+            code = frame.f_code
+            parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ";".join(reversed(parts))
+
+    def _sample_loop(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    continue
+                frames = sys._current_frames()
+                for ident, state in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is None:
+                        continue
+                    stack = self._fold(frame)
+                    state["stacks"][stack] = state["stacks"].get(stack, 0) + 1
+                    state["samples"] += 1
+            del frames
+
+    def _capture_names(self):
+        # Saved captures only; other workers' in-flight .tmp_*.json files are skipped.
+        return sorted(
+            name[:-5] for name in os.listdir(self.root) if name.endswith(".json") and PROFILE_NAME_RE.match(name[:-5])
+        )
 
+    def _prune(self):
+        names = self._capture_names()
+        for name in names[: max(0, len(names) - self.keep)]:
+            try:
+                os.remove(os.path.join(self.root, f"{name}.json"))
+            except OSError:
+                pass
+
+    def recent(self):
+        if not os.path.isdir(self.root):
+            return []
+        rows = []
+        for name in reversed(self._capture_names()):
+            capture = self.load(name)
+            if capture:
+                capture.pop("stacks", None)
+                rows.append(capture)
+        return rows
+
+    def load(self, name):
+        if not PROFILE_NAME_RE.match(str(name or "")):
+            return None
+        try:
+            with open(os.path.join(self.root, f"{name}.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            _log_exception("slow_profile.load_failed", name=name)
+            return None
 
-PREVIEW_CACHE = PreviewCache()
+    def stats(self):
+        with self._lock:
+            active = len(self._active)
+        return {
+            "enabled": self.enabled,
+            "threshold_ms": self.threshold_ms,
+            "interval_ms": round(self.interval * 1000, 1),
+            "keep": self.keep,
+            "active": active,
+            "saved": self._saved,
+        }
+
+
+SLOW_PROFILER = SlowRequestProfiler(PROFILE_DIR, SLOW_PROFILE_THRESHOLD_MS, SLOW_PROFILE_INTERVAL_MS, SLOW_PROFILE_KEEP)
+
+
+class RenderAdmission:
+    # Per-process cap on concurrent draw_poster calls. Waiters form one
+    # priority queue: generate is served before preview, FIFO otherwise.
+    # Previews are turned away once the queue is full; generate may queue
+    # into a reserve of the same size so downloads are not starved.
+    PRIORITIES = {"generate": 0, "preview": 1}
+
+    def __init__(self, limit, queue_size, wait_seconds, retry_after):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.wait_seconds = wait_seconds
+        self.retry_after = retry_after
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = []
+        self._seq = 0
+        self._admitted = 0
+        self._queued = 0
+        self._rejected = {}
+
+    def _reject(self, kind, reason):
+        key = f"{kind}:{reason}"
+        self._rejected[key] = self._rejected.get(key, 0) + 1
+        METRICS.inc("poster_render_admission_rejections_total", {"endpoint": kind, "reason": reason})
+        return False
+
+    def acquire(self, kind):
+        if not self.limit:
+            return True
+        priority = self.PRIORITIES.get(kind, 1)
+        with self._cond:
+            if self._active < self.limit and not self._waiting:
+                self._active += 1
+                self._admitted += 1
+                return True
+            cap = self.queue_size * (2 if priority == 0 else 1)
+            if len(self._waiting) >= cap:
+                return self._reject(kind, "queue_full")
+            self._seq += 1
+            ticket = (priority, self._seq)
+            heapq.heappush(self._waiting, ticket)
+            self._queued += 1
+            METRICS.gauge_add("poster_render_queue_depth", {"endpoint": kind}, 1)
+            deadline = time.monotonic() + self.wait_seconds.get(kind, 0)
+            try:
+                while True:
+                    if self._active < self.limit and self._waiting[0] == ticket:
+                        heapq.heappop(self._waiting)
+                        self._active += 1
+                        self._admitted += 1
+                        # A slot may still be free for the next waiter.
+                        self._cond.notify_all()
+                        return True
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._waiting.remove(ticket)
+                        heapq.heapify(self._waiting)
+                        self._cond.notify_all()
+                        return self._reject(kind, "timeout")
+                    self._cond.wait(remaining)
+            finally:
+                METRICS.gauge_add("poster_render_queue_depth", {"endpoint": kind}, -1)
+
+    def release(self):
+        if not self.limit:
+            return
+        with self._cond:
+            self._active = max(0, self._active - 1)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, kind):
+        admitted = self.acquire(kind)
+        try:
+            yield admitted
+        finally:
+            if admitted:
+                self.release()
+
+    def load(self):
+        with self._cond:
+            return self._active, len(self._waiting)
+
+    def retry_after_seconds(self):
+        # Scales with how many renders are ahead of a newcomer.
+        with self._cond:
+            backlog = self._active + len(self._waiting)
+        if not self.limit:
+            return self.retry_after
+        return max(self.retry_after, math.ceil(self.retry_after * backlog / self.limit))
+
+    def stats(self):
+        with self._cond:
+            return {
+                "limit": self.limit,
+                "queue_size": self.queue_size,
+                "active": self._active,
+                "waiting": len(self._waiting),
+                "admitted": self._admitted,
+                "queued": self._queued,
+                "rejected": dict(self._rejected),
+            }
+
+
+RENDER_ADMISSION = RenderAdmission(
+    RENDER_CONCURRENCY,
+    RENDER_QUEUE_SIZE,
+    {"preview": RENDER_PREVIEW_WAIT_SECONDS, "generate": RENDER_GENERATE_WAIT_SECONDS},
+    RENDER_RETRY_AFTER_SECONDS,
+)
+
+
+def _preview_quality():
+    # Downloads always render full; previews step down as the render queue fills:
+    # a free slot -> full, queue under half full -> balanced, otherwise fast.
+    if PREVIEW_QUALITY != "auto":
+        return PREVIEW_QUALITY
+    if not RENDER_ADMISSION.limit:
+        return "full"
+    active, waiting = RENDER_ADMISSION.load()
+    if active < RENDER_ADMISSION.limit and not waiting:
+        return "full"
+    if waiting < max(1, RENDER_ADMISSION.queue_size // 2):
+        return "balanced"
+    return "fast"
+
+
+def _render_busy_response():
+    retry_after = RENDER_ADMISSION.retry_after_seconds()
+    payload = {
+        "error": "当前生成人数较多，请稍后重试",
+        "retry_after": retry_after,
+        "request_id": getattr(g, "request_id", ""),
+    }
+    return jsonify(payload), 503, {"Retry-After": str(retry_after)}
+
+
+@contextmanager
+def _render_metrics(endpoint, cfg):
+    style = str((cfg or {}).get("card_style") or "single")
+    labels = {"endpoint": endpoint, "card_style": style if style in CARD_STYLE_LABELS else "other"}
+    METRICS.gauge_add("poster_renders_in_flight", {"endpoint": endpoint}, 1)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        METRICS.gauge_add("poster_renders_in_flight", {"endpoint": endpoint}, -1)
+        METRICS.observe("poster_render_seconds", labels, time.perf_counter() - started, RENDER_SECONDS_BUCKETS)
 
 
 @app.before_request
 def _set_request_id():
     raw = (request.headers.get("X-Request-Id") or "").strip()
     g.request_id = raw[:64] if raw else uuid.uuid4().hex[:12]
+    g.request_started = time.perf_counter()
+    if SLOW_PROFILER.enabled and request.endpoint in SLOW_PROFILE_ENDPOINTS:
+        SLOW_PROFILER.begin()
+        g.slow_profiling = True
 
 
 @app.after_request
@@ -205,9 +1438,78 @@ def _append_request_id(resp):
     req_id = getattr(g, "request_id", "")
     if req_id:
         resp.headers["X-Request-Id"] = req_id
+    METRICS.inc("poster_http_requests_total", {"endpoint": request.endpoint or "unknown", "status": str(resp.status_code)})
+    timings = getattr(g, "stage_timings", None)
+    if timings is not None:
+        total_ms = (time.perf_counter() - g.request_started) * 1000.0
+        parts = [f"{name};dur={ms:.1f}" for name, ms in timings.items()]
+        resp.headers["Server-Timing"] = ", ".join(parts + [f"total;dur={total_ms:.1f}"])
     return resp
 
 
+@app.teardown_request
+def _finish_slow_profile(exc):
+    # teardown also runs when the view raised, so the sampler always lets go.
+    if not getattr(g, "slow_profiling", False):
+        return
+    g.slow_profiling = False
+    elapsed_ms = (time.perf_counter() - g.request_started) * 1000.0
+    SLOW_PROFILER.end(getattr(g, "request_id", ""), request.endpoint, elapsed_ms)
+
+
+def _plan_render_memory(cfg, endpoint):
+    # (fit_inputs, memory). Over budget, inputs are first decoded at their
+    # on-canvas size; ValueError if even that would not fit.
+    if not RENDER_MEMORY_BUDGET_BYTES and not RENDER_MEMORY_TRACKING:
+        return False, None
+    estimate = estimate_render_memory(cfg)
+    fit_inputs = False
+    if RENDER_MEMORY_BUDGET_BYTES and estimate["estimated_peak_bytes"] > RENDER_MEMORY_BUDGET_BYTES:
+        estimate = estimate_render_memory(cfg, fit_inputs=True)
+        if estimate["estimated_peak_bytes"] > RENDER_MEMORY_BUDGET_BYTES:
+            METRICS.inc("poster_render_memory_rejections_total", {"endpoint": endpoint})
+            _log_event(
+                logging.WARNING,
+                "render_memory.rejected",
+                endpoint=endpoint,
+                estimated_peak_mb=round(estimate["estimated_peak_bytes"] / 1048576, 1),
+                budget_mb=round(RENDER_MEMORY_BUDGET_BYTES / 1048576, 1),
+            )
+            raise ValueError("素材图片过大，超出单次渲染的内存上限，请压缩后重新上传")
+        fit_inputs = True
+        METRICS.inc("poster_render_memory_downscaled_total", {"endpoint": endpoint})
+    memory = {
+        "estimated_peak_bytes": estimate["estimated_peak_bytes"],
+        "largest_image_bytes": estimate["largest_image_bytes"],
+        "fit_inputs": fit_inputs,
+    }
+    return fit_inputs, memory
+
+
+def _render_too_large_response(error):
+    return jsonify({"error": str(error), "request_id": getattr(g, "request_id", "")}), 413
+
+
+def _memory_log_fields(memory):
+    if not memory:
+        return {}
+    fields = {
+        "estimated_peak_mb": round(memory["estimated_peak_bytes"] / 1048576, 1),
+        "largest_image_mb": round(memory["largest_image_bytes"] / 1048576, 1),
+        "fit_inputs": memory["fit_inputs"],
+    }
+    if "rss_start_bytes" in memory:
+        fields["rss_growth_mb"] = round((memory["rss_peak_bytes"] - memory["rss_start_bytes"]) / 1048576, 1)
+        fields["rss_peak_stage"] = memory.get("rss_peak_stage", "")
+    return {"memory": fields}
+
+
+def _stage_timings():
+    # Per-request stage collector; _append_request_id turns it into Server-Timing.
+    g.stage_timings = {}
+    return g.stage_timings
+
+
 def _sanitize_filename(name):
     return re.sub(r'[\\/*?:"<>|]', "", name) or "公告"
 
@@ -239,6 +1541,19 @@ def _normalize_cfg_paths(cfg):
     return out
 
 
+def _strip_template_fields(cfg):
+    return {k: v for k, v in (cfg or {}).items() if k not in TEMPLATE_STORE_KEYS}
+
+
+def _extract_template_fields(cfg):
+    # Only non-default values are worth moving into the template store.
+    fields = {}
+    for key in TEMPLATE_STORE_KEYS:
+        if key in (cfg or {}) and cfg[key] != DEFAULT_CONFIG.get(key):
+            fields[key] = cfg[key]
+    return fields
+
+
 
 def _coerce_float(value, default, min_value=None, max_value=None):
     default_val = float(default)
@@ -371,155 +1686,1079 @@ def _ensure_user_id():
     return uid
 
 
-def _get_user_config_path(user_id):
-    return os.path.join(USER_CONFIG_DIR, f"{user_id}.json")
+def _get_user_config_path(user_id):
+    return os.path.join(USER_CONFIG_DIR, f"{user_id}.json")
+
+
+class SqliteStore(ABC):
+    # Shared plumbing for the SQLite-backed stores: one connection per thread and
+    # process (WAL mode), lazy schema setup, and an import of the JSON file the
+    # store replaces. Imports use INSERT OR IGNORE, so workers racing on startup
+    # (or a users.json restored from an old backup) never overwrite newer rows;
+    # the JSON file is renamed to *.migrated afterwards. Subclasses supply the
+    # schema and the legacy row import.
+    def __init__(self, db_path, legacy_json_path):
+        self.db_path = db_path
+        self.legacy_json_path = legacy_json_path
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._ready_pid = None
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and getattr(self._local, "pid", None) == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.db_path, timeout=SQLITE_BUSY_TIMEOUT_SECONDS, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        self._ensure_schema(conn)
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _ensure_schema(self, conn):
+        if self._ready_pid == os.getpid():
+            return
+        with self._init_lock:
+            if self._ready_pid == os.getpid():
+                return
+            self._create_schema(conn)
+            self._migrate_legacy_json(conn)
+            self._ready_pid = os.getpid()
+
+    @abstractmethod
+    def _create_schema(self, conn):
+        ...
+
+    @abstractmethod
+    def _import_legacy_rows(self, conn, data):
+        # Insert rows from the parsed legacy JSON dict; returns how many were read.
+        ...
+
+    def _migrate_legacy_json(self, conn):
+        if not os.path.isfile(self.legacy_json_path):
+            return
+        try:
+            with open(self.legacy_json_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception:
+            _log_exception("sqlite_store.legacy_load_failed", path=self.legacy_json_path)
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            imported = self._import_legacy_rows(conn, data if isinstance(data, dict) else {})
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        _log_event(logging.INFO, "sqlite_store.migrated", path=self.legacy_json_path, entries=imported)
+        try:
+            os.replace(self.legacy_json_path, self.legacy_json_path + ".migrated")
+        except FileNotFoundError:
+            pass
+        except Exception:
+            _log_exception("sqlite_store.legacy_rename_failed", path=self.legacy_json_path)
+
+    def backup_to(self, path):
+        # Consistent copy for backups; the live file plus -wal/-shm may be mid-write.
+        dest = sqlite3.connect(path)
+        try:
+            self._connect().backup(dest)
+        finally:
+            dest.close()
+
+
+class OutputIndex(SqliteStore):
+    # Output ownership index plus the per-user activity summary the admin pages
+    # read (last_active, output_count, has_config, has_password). Every change is
+    # a single-row statement or a short IMMEDIATE transaction; output changes
+    # refresh the owner's summary row in the same transaction.
+    ACTIVITY_SCHEMA_VERSION = 1
+    ACTIVITY_SORT_COLUMNS = {"user_id": "user_id", "last_active": "last_active_ts", "output_count": "output_count"}
+
+    def __init__(self, db_path, legacy_json_path):
+        super().__init__(db_path, legacy_json_path)
+        self._activity_ready_pid = None
+
+    def _create_schema(self, conn):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS outputs ("
+            "relpath TEXT PRIMARY KEY, user_id TEXT NOT NULL, created_at TEXT NOT NULL, created_ts REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_outputs_user ON outputs (user_id, created_ts)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_outputs_created ON outputs (created_ts)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS user_activity ("
+            "user_id TEXT PRIMARY KEY, is_guest INTEGER NOT NULL, last_active_ts REAL NOT NULL DEFAULT 0, "
+            "output_count INTEGER NOT NULL DEFAULT 0, has_config INTEGER NOT NULL DEFAULT 0, "
+            "has_password INTEGER NOT NULL DEFAULT 0)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_activity_guest ON user_activity (is_guest, last_active_ts)")
+
+    def _import_legacy_rows(self, conn, data):
+        rows = []
+        for rel, meta in data.items():
+            rel = str(rel or "").replace("\\", "/").strip()
+            uid = _sanitize_user_id((meta or {}).get("user_id", ""))
+            if not rel or not uid:
+                continue
+            created_at = str((meta or {}).get("created_at", "")).strip()
+            rows.append((rel, uid, created_at, _parse_iso_timestamp(created_at)))
+        conn.executemany(
+            "INSERT OR IGNORE INTO outputs (relpath, user_id, created_at, created_ts) VALUES (?, ?, ?, ?)", rows
+        )
+        return len(rows)
+
+    def _refresh_activity(self, conn, user_id):
+        conn.execute(
+            "INSERT INTO user_activity (user_id, is_guest) VALUES (?, ?) ON CONFLICT(user_id) DO NOTHING",
+            (user_id, int(_is_guest_user(user_id))),
+        )
+        conn.execute(
+            "UPDATE user_activity SET "
+            "output_count = (SELECT COUNT(*) FROM outputs WHERE user_id = ?1), "
+            "last_active_ts = MAX(last_active_ts, COALESCE((SELECT MAX(created_ts) FROM outputs WHERE user_id = ?1), 0)) "
+            "WHERE user_id = ?1",
+            (user_id,),
+        )
+
+    def record(self, relpath, user_id):
+        created_at = datetime.datetime.now().isoformat(timespec="seconds")
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO outputs (relpath, user_id, created_at, created_ts) VALUES (?, ?, ?, ?)",
+                (relpath, user_id, created_at, _parse_iso_timestamp(created_at)),
+            )
+            self._refresh_activity(conn, user_id)
+
+    def owner(self, relpath):
+        row = self._connect().execute("SELECT user_id FROM outputs WHERE relpath = ?", (relpath,)).fetchone()
+        return row[0] if row else ""
+
+    def prune_over_limit(self, keep, max_rows):
+        # Drops the oldest outputs of every user holding more than `keep`, using the
+        # activity summary to find them. Returns [(user_id, relpath)].
+        stale = []
+        with self._transaction() as conn:
+            users = [row[0] for row in conn.execute("SELECT user_id FROM user_activity WHERE output_count > ?", (keep,))]
+            for uid in users:
+                rows = conn.execute(
+                    "SELECT relpath FROM outputs WHERE user_id = ? ORDER BY created_ts DESC, relpath DESC LIMIT -1 OFFSET ?",
+                    (uid, keep),
+                ).fetchall()
+                conn.executemany("DELETE FROM outputs WHERE relpath = ?", rows)
+                self._refresh_activity(conn, uid)
+                stale.extend((uid, row[0]) for row in rows)
+                if len(stale) >= max_rows:
+                    break
+        return stale
+
+    def expire_before(self, cutoff_ts, max_rows):
+        with self._transaction() as conn:
+            stale = conn.execute(
+                "SELECT user_id, relpath FROM outputs WHERE created_ts < ? ORDER BY created_ts LIMIT ?", (cutoff_ts, max_rows)
+            ).fetchall()
+            conn.executemany("DELETE FROM outputs WHERE relpath = ?", [(rel,) for _, rel in stale])
+            for uid in {uid for uid, _ in stale}:
+                self._refresh_activity(conn, uid)
+        return stale
+
+    def delete_users(self, user_ids):
+        relpaths = {}
+        with self._transaction() as conn:
+            for uid in user_ids:
+                relpaths[uid] = [row[0] for row in conn.execute("SELECT relpath FROM outputs WHERE user_id = ?", (uid,))]
+                conn.execute("DELETE FROM outputs WHERE user_id = ?", (uid,))
+                conn.execute("DELETE FROM user_activity WHERE user_id = ?", (uid,))
+        return relpaths
+
+    def stale_guests(self, cutoff_ts):
+        rows = self._connect().execute(
+            "SELECT user_id, output_count FROM user_activity WHERE is_guest = 1 AND last_active_ts <= ? "
+            "ORDER BY last_active_ts, user_id",
+            (cutoff_ts,),
+        )
+        return [(uid, int(count)) for uid, count in rows]
+
+    def user_ids(self):
+        return [row[0] for row in self._connect().execute("SELECT DISTINCT user_id FROM outputs")]
+
+    def counts(self):
+        return dict(self._connect().execute("SELECT user_id, COUNT(*) FROM outputs GROUP BY user_id").fetchall())
+
+    def size(self):
+        return int(self._connect().execute("SELECT COUNT(*) FROM outputs").fetchone()[0])
+
+    def iter_entries(self):
+        # Lazy cursor: rows are fetched as the caller consumes them.
+        return self._connect().execute("SELECT relpath, user_id, created_at FROM outputs ORDER BY relpath")
+
+    def touch_many(self, entries):
+        # entries: (user_id, ts, has_config, has_password); None leaves a flag as is
+        # and ts only ever moves last_active forward.
+        if not entries:
+            return
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT INTO user_activity (user_id, is_guest, last_active_ts, has_config, has_password) "
+                "VALUES (?1, ?2, ?3, COALESCE(?4, 0), COALESCE(?5, 0)) "
+                "ON CONFLICT(user_id) DO UPDATE SET "
+                "last_active_ts = MAX(last_active_ts, excluded.last_active_ts), "
+                "has_config = COALESCE(?4, has_config), has_password = COALESCE(?5, has_password)",
+                [
+                    (
+                        uid,
+                        int(_is_guest_user(uid)),
+                        float(ts or 0.0),
+                        None if has_config is None else int(bool(has_config)),
+                        None if has_password is None else int(bool(has_password)),
+                    )
+                    for uid, ts, has_config, has_password in entries
+                ],
+            )
+
+    def activity_ready(self):
+        if self._activity_ready_pid == os.getpid():
+            return True
+        version = self._connect().execute("PRAGMA user_version").fetchone()[0]
+        if version >= self.ACTIVITY_SCHEMA_VERSION:
+            self._activity_ready_pid = os.getpid()
+            return True
+        return False
+
+    def rebuild_activity(self, entries):
+        # entries: {user_id: {"last_active_ts", "has_config", "has_password"}} gathered
+        # from files and the account store; output aggregates come from this table.
+        with self._transaction() as conn:
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= self.ACTIVITY_SCHEMA_VERSION:
+                return False
+            merged = {uid: dict(meta) for uid, meta in entries.items()}
+            for uid, count, last_ts in conn.execute("SELECT user_id, COUNT(*), MAX(created_ts) FROM outputs GROUP BY user_id"):
+                meta = merged.setdefault(uid, {})
+                meta["output_count"] = int(count)
+                meta["last_active_ts"] = max(float(meta.get("last_active_ts") or 0.0), float(last_ts or 0.0))
+            conn.execute("DELETE FROM user_activity")
+            conn.executemany(
+                "INSERT INTO user_activity (user_id, is_guest, last_active_ts, output_count, has_config, has_password) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        uid,
+                        int(_is_guest_user(uid)),
+                        float(meta.get("last_active_ts") or 0.0),
+                        int(meta.get("output_count") or 0),
+                        int(bool(meta.get("has_config"))),
+                        int(bool(meta.get("has_password"))),
+                    )
+                    for uid, meta in merged.items()
+                ],
+            )
+            conn.execute(f"PRAGMA user_version = {self.ACTIVITY_SCHEMA_VERSION}")
+        self._activity_ready_pid = os.getpid()
+        _log_event(logging.INFO, "user_activity.rebuilt", users=len(merged))
+        return True
+
+    def activity(self, user_id):
+        row = self._connect().execute(
+            "SELECT last_active_ts, output_count, has_config, has_password FROM user_activity WHERE user_id = ?",
+            (user_id,),
+        ).fetchone()
+        if not row:
+            return None
+        return {"last_active_ts": row[0], "output_count": row[1], "has_config": bool(row[2]), "has_password": bool(row[3])}
+
+    def list_activity(self, offset, limit, sort="last_active", descending=True, query="", kind="all"):
+        where = []
+        params = []
+        if query:
+            escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            where.append("user_id LIKE ? ESCAPE '\\'")
+            params.append(f"%{escaped}%")
+        if kind == "guest":
+            where.append("is_guest = 1")
+        elif kind == "registered":
+            where.append("is_guest = 0")
+        clause = f" WHERE {' AND '.join(where)}" if where else ""
+        column = self.ACTIVITY_SORT_COLUMNS.get(sort, "last_active_ts")
+        direction = "DESC" if descending else "ASC"
+        conn = self._connect()
+        total = conn.execute(f"SELECT COUNT(*) FROM user_activity{clause}", params).fetchone()[0]
+        rows = conn.execute(
+            "SELECT user_id, last_active_ts, output_count, has_config, has_password FROM user_activity"
+            f"{clause} ORDER BY {column} {direction}, user_id ASC LIMIT ? OFFSET ?",
+            [*params, limit, offset],
+        ).fetchall()
+        return total, [
+            {
+                "user_id": uid,
+                "last_active_ts": last_ts,
+                "output_count": count,
+                "has_config": bool(has_config),
+                "has_password": bool(has_password),
+            }
+            for uid, last_ts, count, has_config, has_password in rows
+        ]
+
+
+class AccountStore(SqliteStore):
+    # Password hashes keyed by user id. Lookups are served from an in-memory
+    # cache; PRAGMA data_version tells each thread's connection when another
+    # connection (thread or worker) has committed, which clears the cache.
+    def __init__(self, db_path, legacy_json_path):
+        super().__init__(db_path, legacy_json_path)
+        self._cache_lock = threading.Lock()
+        self._cache = {}
+
+    def _create_schema(self, conn):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS accounts ("
+            "user_id TEXT PRIMARY KEY, password_hash TEXT NOT NULL, updated_at TEXT NOT NULL)"
+        )
+
+    def _import_legacy_rows(self, conn, data):
+        now = datetime.datetime.now().isoformat(timespec="seconds")
+        rows = []
+        for uid, pw_hash in data.items():
+            uid = _sanitize_user_id(uid)
+            if uid and isinstance(pw_hash, str) and pw_hash:
+                rows.append((uid, pw_hash, now))
+        conn.executemany("INSERT OR IGNORE INTO accounts (user_id, password_hash, updated_at) VALUES (?, ?, ?)", rows)
+        return len(rows)
+
+    def _fresh_conn(self):
+        conn = self._connect()
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if getattr(self._local, "data_version", None) != version:
+            self._local.data_version = version
+            with self._cache_lock:
+                self._cache.clear()
+        return conn
+
+    def _forget(self, user_id):
+        with self._cache_lock:
+            self._cache.pop(user_id, None)
+
+    def get_hash(self, user_id):
+        conn = self._fresh_conn()
+        with self._cache_lock:
+            if user_id in self._cache:
+                return self._cache[user_id]
+        row = conn.execute("SELECT password_hash FROM accounts WHERE user_id = ?", (user_id,)).fetchone()
+        pw_hash = row[0] if row else ""
+        with self._cache_lock:
+            self._cache[user_id] = pw_hash
+        return pw_hash
+
+    def create(self, user_id, pw_hash):
+        # False when the account already exists, e.g. another worker registered it first.
+        cur = self._fresh_conn().execute(
+            "INSERT OR IGNORE INTO accounts (user_id, password_hash, updated_at) VALUES (?, ?, ?)",
+            (user_id, pw_hash, datetime.datetime.now().isoformat(timespec="seconds")),
+        )
+        self._forget(user_id)
+        return cur.rowcount == 1
+
+    def set_hash(self, user_id, pw_hash):
+        self._fresh_conn().execute(
+            "INSERT OR REPLACE INTO accounts (user_id, password_hash, updated_at) VALUES (?, ?, ?)",
+            (user_id, pw_hash, datetime.datetime.now().isoformat(timespec="seconds")),
+        )
+        self._forget(user_id)
+
+    def delete_users(self, user_ids):
+        removed = set()
+        with self._transaction() as conn:
+            for uid in user_ids:
+                if conn.execute("DELETE FROM accounts WHERE user_id = ?", (uid,)).rowcount > 0:
+                    removed.add(uid)
+        for uid in user_ids:
+            self._forget(uid)
+        return removed
+
+    def user_ids(self):
+        return [row[0] for row in self._connect().execute("SELECT user_id FROM accounts")]
+
+    def iter_hashes(self):
+        return self._connect().execute("SELECT user_id, password_hash FROM accounts ORDER BY user_id")
+
+
+OUTPUT_INDEX = OutputIndex(OUTPUT_INDEX_DB_PATH, OUTPUT_META_PATH)
+ACCOUNT_STORE = AccountStore(ACCOUNTS_DB_PATH, USERS_PATH)
+
+
+def _atomic_write_json(path, data):
+    folder = os.path.dirname(path) or "."
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".json", dir=folder)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except Exception:
+            pass
+        raise
+
+
+def _validate_uploaded_image(path):
+    try:
+        with Image.open(path) as img:
+            img.verify()
+        with Image.open(path) as img2:
+            width, height = img2.size
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        return False, "图片文件无效或已损坏"
+    except Exception:
+        _log_exception("upload.image_verify_failed", path=path)
+        return False, "图片校验失败，请重试"
+    if width <= 0 or height <= 0:
+        return False, "图片尺寸无效"
+    if width * height > MAX_UPLOAD_IMAGE_PIXELS:
+        return False, f"图片像素过大，最大支持 {MAX_UPLOAD_IMAGE_PIXELS} 像素"
+    return True, ""
+
+
+def _record_output_owner(relpath, user_id):
+    rel = str(relpath or "").replace("\\", "/").strip()
+    uid = _sanitize_user_id(user_id)
+    if not rel or not uid:
+        return
+    OUTPUT_INDEX.record(rel, uid)
+
+
+def _parse_iso_timestamp(raw_value):
+    text = str(raw_value or "").strip()
+    if not text:
+        return 0.0
+    try:
+        return datetime.datetime.fromisoformat(text).timestamp()
+    except Exception:
+        return 0.0
+
+
+class OutputRetentionJanitor:
+    # Enforces MAX_SAVED_OUTPUTS_PER_USER and the optional age limit off the
+    # request path. Each sweep finds over-limit users through the activity index
+    # and deletes index rows in batched transactions before removing the files,
+    # so concurrent sweeps in other workers never see the same rows. Empty user
+    # directories are left in place; a generate may be writing into them.
+    def __init__(self, keep, max_age_seconds, interval, batch_size):
+        self.keep = keep
+        self.max_age_seconds = max_age_seconds
+        self.interval = interval
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._thread = None
+        self._thread_pid = 0
+        self._sweeps = 0
+        self._removed_index_entries = 0
+        self._removed_outputs = 0
+        self._errors = 0
+        self._last_sweep_ms = 0.0
+
+    def ensure_started(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+            self._thread = threading.Thread(target=self._loop, name="output-retention", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sweep()
+            except Exception:
+                with self._lock:
+                    self._errors += 1
+                _log_exception("output_retention.sweep_failed")
+
+    def _remove_files(self, stale):
+        removed = 0
+        for uid, rel in stale:
+            abs_path = _safe_join_data_path(rel)
+            if not abs_path or not os.path.isfile(abs_path):
+                continue
+            try:
+                os.remove(abs_path)
+                removed += 1
+            except Exception:
+                _log_exception("output_prune.remove_failed", user_id=uid, path=abs_path)
+        return removed
+
+    def sweep(self):
+        started = time.time()
+        _ensure_user_activity_index()
+        removed_entries = 0
+        removed_outputs = 0
+        while True:
+            stale = OUTPUT_INDEX.prune_over_limit(self.keep, self.batch_size)
+            if self.max_age_seconds > 0 and len(stale) < self.batch_size:
+                stale += OUTPUT_INDEX.expire_before(time.time() - self.max_age_seconds, self.batch_size - len(stale))
+            if not stale:
+                break
+            removed_entries += len(stale)
+            removed_outputs += self._remove_files(stale)
+            if len(stale) < self.batch_size:
+                break
+        with self._lock:
+            self._sweeps += 1
+            self._removed_index_entries += removed_entries
+            self._removed_outputs += removed_outputs
+            self._last_sweep_ms = round((time.time() - started) * 1000, 1)
+        if removed_entries:
+            _log_event(
+                logging.INFO, "output_retention.swept", removed_index_entries=removed_entries, removed_outputs=removed_outputs
+            )
+        return {"removed_outputs": removed_outputs, "removed_index_entries": removed_entries}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "keep_per_user": self.keep,
+                "max_age_days": round(self.max_age_seconds / 86400, 3),
+                "interval_seconds": self.interval,
+                "sweeps": self._sweeps,
+                "removed_index_entries": self._removed_index_entries,
+                "removed_outputs": self._removed_outputs,
+                "errors": self._errors,
+                "last_sweep_ms": self._last_sweep_ms,
+            }
+
+
+OUTPUT_RETENTION = OutputRetentionJanitor(
+    MAX_SAVED_OUTPUTS_PER_USER, OUTPUT_MAX_AGE_DAYS * 86400, OUTPUT_RETENTION_INTERVAL_SECONDS, OUTPUT_RETENTION_BATCH_SIZE
+)
+
+
+class TemplateStore:
+    # Per-user custom templates and input history, kept out of the config that
+    # preview/generate load and hash. One JSON file per user under USER_TEMPLATE_DIR;
+    # every read-modify-write holds that user's lock file, so PUTs landing on
+    # different workers cannot drop each other's templates.
+    LOCK_TIMEOUT_SECONDS = 10.0
+    LOCK_STALE_SECONDS = 60.0
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+
+    def _path(self, user_id):
+        return os.path.join(self.root_dir, f"{user_id}.json")
+
+    def _locked(self, user_id):
+        # Only the file read and write happen under the lock (milliseconds), so a
+        # lock this old was left by a killed worker.
+        return _file_lock(
+            os.path.join(self.root_dir, f".{user_id}.lock"),
+            timeout=self.LOCK_TIMEOUT_SECONDS,
+            stale_seconds=self.LOCK_STALE_SECONDS,
+        )
+
+    def _read(self, user_id):
+        path = self._path(user_id)
+        if not os.path.isfile(path):
+            return {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except Exception:
+            _log_exception("template_store.load_failed", path=path)
+            return {}
+
+    def _write(self, user_id, data):
+        _atomic_write_json(self._path(user_id), data)
+
+    @staticmethod
+    def _touch(user_id):
+        # Template edits used to live in the config file and counted as activity.
+        # Called after the lock is released: it is a SQLite write.
+        _touch_user_activity([(user_id, time.time(), None, None)])
+
+    def load(self, user_id):
+        data = self._read(user_id)
+        templates = data.get("custom_templates")
+        out = {"custom_templates": dict(templates) if isinstance(templates, dict) else {}}
+        for key in TEMPLATE_STORE_KEYS[1:]:
+            hist = data.get(key)
+            out[key] = list(hist) if isinstance(hist, list) else list(DEFAULT_CONFIG.get(key, []))
+        return out
+
+    def merge(self, user_id, fields, replace_templates=True):
+        # A client that still sends custom_templates sends its whole set, so by
+        # default that set replaces the stored one; merging would bring back
+        # templates deleted elsewhere. replace_templates=False unions instead.
+        if not fields:
+            return False
+        with self._locked(user_id):
+            data = self.load(user_id)
+            before = json.dumps(data, ensure_ascii=False, sort_keys=True)
+            for key, value in fields.items():
+                if key == "custom_templates" and isinstance(value, dict):
+                    templates = {str(k): str(v) for k, v in value.items()}
+                    if replace_templates:
+                        data["custom_templates"] = templates
+                    else:
+                        data["custom_templates"].update(templates)
+                elif key in TEMPLATE_STORE_KEYS[1:] and isinstance(value, list):
+                    data[key] = [str(x) for x in value]
+            if json.dumps(data, ensure_ascii=False, sort_keys=True) == before:
+                return False
+            self._write(user_id, data)
+        self._touch(user_id)
+        return True
+
+    def put_template(self, user_id, name, content):
+        with self._locked(user_id):
+            data = self.load(user_id)
+            templates = data["custom_templates"]
+            if name not in templates and len(templates) >= MAX_CUSTOM_TEMPLATES:
+                raise ValueError(f"自定义模板最多 {MAX_CUSTOM_TEMPLATES} 个")
+            templates[name] = content
+            self._write(user_id, data)
+        self._touch(user_id)
+        return data
+
+    def delete_template(self, user_id, name):
+        with self._locked(user_id):
+            data = self.load(user_id)
+            if name not in data["custom_templates"]:
+                return False
+            data["custom_templates"].pop(name, None)
+            self._write(user_id, data)
+        self._touch(user_id)
+        return True
+
+    def delete_user(self, user_id):
+        path = self._path(user_id)
+        with self._locked(user_id):
+            if not os.path.isfile(path):
+                return False
+            os.remove(path)
+        return True
+
+
+TEMPLATE_STORE = TemplateStore(USER_TEMPLATE_DIR)
+
+
+class AdminJobs:
+    # Long-running admin jobs run on a daemon thread in the worker that accepted
+    # them. Progress is written to ADMIN_JOB_DIR/<job_id>.json, so a status poll
+    # answered by any worker sees the same state. One job per kind at a time: the
+    # worker starting it must create ADMIN_JOB_DIR/.<kind>.claim (O_EXCL) and
+    # holds it until the job ends. A heartbeat refreshes the job file and the
+    # claim while the job runs, so only a dead worker's job goes stale.
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        self._lock = threading.Lock()
+
+    def _path(self, job_id):
+        return os.path.join(self.root_dir, f"{job_id}.json")
+
+    def _claim_path(self, kind):
+        return os.path.join(self.root_dir, f".{kind}.claim")
+
+    def _write(self, job):
+        job["updated_at"] = time.time()
+        _atomic_write_json(self._path(job["job_id"]), job)
+
+    def get(self, job_id):
+        if not ADMIN_JOB_ID_RE.match(str(job_id or "")):
+            return None
+        try:
+            with open(self._path(job_id), "r", encoding="utf-8") as f:
+                job = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            _log_exception("admin_jobs.load_failed", job_id=job_id)
+            return None
+        if job.get("state") == "running" and time.time() - float(job.get("updated_at") or 0) > ADMIN_JOB_STALE_SECONDS:
+            # The worker running it died or was restarted.
+            job["state"] = "interrupted"
+        return job
+
+    def _recent(self):
+        if not os.path.isdir(self.root_dir):
+            return []
+        names = [name for name in os.listdir(self.root_dir) if name.endswith(".json")]
+        paths = [os.path.join(self.root_dir, name) for name in names]
+        return sorted(paths, key=lambda p: os.path.getmtime(p) if os.path.exists(p) else 0, reverse=True)
+
+    def running(self, kind):
+        for path in self._recent()[:ADMIN_JOB_KEEP]:
+            job = self.get(os.path.splitext(os.path.basename(path))[0])
+            if job and job.get("kind") == kind and job.get("state") in {"queued", "running"}:
+                return job
+        return None
+
+    def start(self, kind, params, fn):
+        # fn(params, report) does the work; report(**fields) publishes progress and
+        # its return value is merged into the finished job. None if a job of this
+        # kind is already running in any worker.
+        os.makedirs(self.root_dir, exist_ok=True)
+        claim = ExitStack()
+        try:
+            claim.enter_context(_file_lock(self._claim_path(kind), timeout=0, stale_seconds=ADMIN_JOB_STALE_SECONDS))
+        except TimeoutError:
+            return None
+        try:
+            with self._lock:
+                for stale_path in self._recent()[ADMIN_JOB_KEEP:]:
+                    try:
+                        os.remove(stale_path)
+                    except OSError:
+                        pass
+                job = {
+                    "job_id": uuid.uuid4().hex[:12],
+                    "kind": kind,
+                    "state": "queued",
+                    "params": params,
+                    "progress": {},
+                    "result": None,
+                    "error": "",
+                    "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+                    "finished_at": "",
+                }
+                self._write(job)
+                snapshot = deepcopy(job)
+            thread = threading.Thread(target=self._run, args=(job, params, fn, claim), name=f"admin-job-{kind}", daemon=True)
+            thread.start()
+        except BaseException:
+            claim.close()
+            raise
+        return snapshot
+
+    def _run(self, job, params, fn, claim):
+        write_lock = threading.Lock()
+        stopped = threading.Event()
+
+        def report(**fields):
+            with write_lock:
+                job["progress"].update(fields)
+                self._write(job)
+
+        def heartbeat():
+            # fn may spend longer than ADMIN_JOB_STALE_SECONDS between report() calls.
+            while not stopped.wait(ADMIN_JOB_HEARTBEAT_SECONDS):
+                try:
+                    with write_lock:
+                        self._write(job)
+                    os.utime(self._claim_path(job["kind"]))
+                except Exception:
+                    _log_exception("admin_jobs.heartbeat_failed", job_id=job["job_id"])
+
+        job["state"] = "running"
+        self._write(job)
+        beat = threading.Thread(target=heartbeat, name=f"admin-job-{job['kind']}-heartbeat", daemon=True)
+        beat.start()
+        try:
+            job["result"] = fn(params, report)
+            job["state"] = "done"
+        except Exception as e:
+            _log_exception("admin_jobs.failed", job_id=job["job_id"], kind=job["kind"])
+            job["state"] = "failed"
+            job["error"] = str(e)
+        finally:
+            stopped.set()
+            beat.join()
+            job["finished_at"] = datetime.datetime.now().isoformat(timespec="seconds")
+            self._write(job)
+            claim.close()
+        _log_event(logging.INFO, "admin_jobs.finished", job_id=job["job_id"], kind=job["kind"], state=job["state"])
+
+
+ADMIN_JOBS = AdminJobs(ADMIN_JOB_DIR)
+
+
+class ConfigWriteBehind:
+    # Coalesces autosave writes from /api/config: the newest config per file wins,
+    # and a background thread flushes every `interval` seconds (plus once at a
+    # clean exit; SIGKILL or a worker timeout loses whatever is still queued).
+    # Entries remember when they were queued: if another worker has written the
+    # file since, the entry is stale and is dropped instead of written back.
+    def __init__(self, interval):
+        self.interval = interval
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._thread_pid = 0
+        self._queued = 0
+        self._coalesced = 0
+        self._flushed = 0
+        self._superseded = 0
+        self._written = OrderedDict()
+        self._errors = 0
+        self._last_flush_ms = 0.0
+
+    @property
+    def enabled(self):
+        return self.interval > 0
+
+    def put(self, path, cfg):
+        with self._lock:
+            if path in self._pending:
+                self._coalesced += 1
+            self._pending[path] = (cfg, time.time_ns())
+            self._queued += 1
+        self._ensure_thread()
+
+    def peek(self, path):
+        # (cfg, queued_ns) or None.
+        with self._lock:
+            return self._pending.get(path)
+
+    def is_superseded(self, path, st, queued_ns):
+        # The file changed after the entry was queued, and not by this worker.
+        with self._lock:
+            return st.st_mtime_ns > queued_ns and self._written.get(path) != st.st_mtime_ns
+
+    def drop_superseded(self, path, queued_ns):
+        with self._lock:
+            entry = self._pending.get(path)
+            if entry is not None and entry[1] == queued_ns:
+                self._pending.pop(path, None)
+                self._superseded += 1
+
+    def _remember_write(self, path, mtime_ns):
+        with self._lock:
+            self._written[path] = mtime_ns
+            self._written.move_to_end(path)
+            while len(self._written) > USER_CONFIG_CACHE_MAX_ITEMS:
+                self._written.popitem(last=False)
+
+    def write_now(self, path, cfg):
+        # Synchronous writes supersede anything still queued for the same file.
+        with self._write_lock:
+            with self._lock:
+                self._pending.pop(path, None)
+            save_config(path, cfg)
+            self._remember_write(path, os.stat(path).st_mtime_ns)
+        _touch_user_activity([(_config_path_user_id(path), time.time(), True, None)])
+
+    def discard(self, path):
+        with self._write_lock:
+            with self._lock:
+                self._pending.pop(path, None)
+
+    def flush(self):
+        started = time.time()
+        flushed = 0
+        touched = []
+        with self._write_lock:
+            with self._lock:
+                batch = list(self._pending.items())
+                self._pending.clear()
+            for path, (cfg, queued_ns) in batch:
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    st = None
+                if st is not None and self.is_superseded(path, st, queued_ns):
+                    with self._lock:
+                        self._superseded += 1
+                    _log_event(logging.INFO, "config_write_behind.superseded", path=path)
+                    continue
+                try:
+                    save_config(path, cfg)
+                    st = os.stat(path)
+                    self._remember_write(path, st.st_mtime_ns)
+                except OSError:
+                    with self._lock:
+                        self._errors += 1
+                        self._pending.setdefault(path, (cfg, queued_ns))
+                    _log_exception("config_write_behind.flush_failed", path=path)
+                    continue
+                _store_config_cache(path, (st.st_mtime_ns, st.st_size), {**deepcopy(DEFAULT_CONFIG), **cfg})
+                touched.append((_config_path_user_id(path), st.st_mtime, True, None))
+                flushed += 1
+        _touch_user_activity(touched)
+        with self._lock:
+            self._flushed += flushed
+            self._last_flush_ms = round((time.time() - started) * 1000, 1)
+        return flushed
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+            self._thread = threading.Thread(target=self._loop, name="config-write-behind", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                _log_exception("config_write_behind.loop_failed")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "interval_seconds": self.interval,
+                "pending": len(self._pending),
+                "queued": self._queued,
+                "coalesced": self._coalesced,
+                "flushed": self._flushed,
+                "superseded": self._superseded,
+                "errors": self._errors,
+                "last_flush_ms": self._last_flush_ms,
+            }
+
 
+CONFIG_WRITE_BEHIND = ConfigWriteBehind(CONFIG_WRITE_BEHIND_SECONDS)
+atexit.register(CONFIG_WRITE_BEHIND.flush)
 
-def _load_users():
-    if not os.path.isfile(USERS_PATH):
-        return {}
+
+def _read_config_cached(path):
+    # Parsed configs are reused while the file's (mtime, size) is unchanged, so a
+    # warm read costs a single stat. Other workers' writes change the signature,
+    # and also win over an older save still queued in this worker.
+    pending = CONFIG_WRITE_BEHIND.peek(path)
     try:
-        with open(USERS_PATH, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return data if isinstance(data, dict) else {}
-    except Exception:
-        _log_exception("users.load_failed", path=USERS_PATH)
-        return {}
+        st = os.stat(path)
+    except FileNotFoundError:
+        with _USER_CONFIG_CACHE_LOCK:
+            _USER_CONFIG_CACHE.pop(path, None)
+        return pending[0] if pending is not None else None
+    if pending is not None:
+        if not CONFIG_WRITE_BEHIND.is_superseded(path, st, pending[1]):
+            return pending[0]
+        CONFIG_WRITE_BEHIND.drop_superseded(path, pending[1])
+    sig = (st.st_mtime_ns, st.st_size)
+    with _USER_CONFIG_CACHE_LOCK:
+        hit = _USER_CONFIG_CACHE.get(path)
+        if hit is not None and hit[0] == sig:
+            _USER_CONFIG_CACHE.move_to_end(path)
+            return hit[1]
+    cfg = load_config(path)
+    _store_config_cache(path, sig, cfg)
+    return cfg
 
 
-def _save_users(users):
-    _atomic_write_json(USERS_PATH, users)
+def _read_global_config():
+    # Fallback for users without a config of their own (most guests). The shared
+    # file is only edited by hand, so it is re-validated at most once per
+    # GLOBAL_CONFIG_RECHECK_SECONDS and such a read costs one stat, not two.
+    now = time.monotonic()
+    with _GLOBAL_CONFIG_LOCK:
+        if now < _GLOBAL_CONFIG_STATE["expires_at"]:
+            return _GLOBAL_CONFIG_STATE["cfg"]
+    cfg = _read_config_cached(CONFIG_PATH)
+    with _GLOBAL_CONFIG_LOCK:
+        _GLOBAL_CONFIG_STATE["expires_at"] = now + GLOBAL_CONFIG_RECHECK_SECONDS
+        _GLOBAL_CONFIG_STATE["cfg"] = cfg
+    return cfg
 
 
-def _load_output_index():
-    if not os.path.isfile(OUTPUT_META_PATH):
-        return {}
-    try:
-        with open(OUTPUT_META_PATH, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return data if isinstance(data, dict) else {}
-    except Exception:
-        _log_exception("output_index.load_failed", path=OUTPUT_META_PATH)
-        return {}
+def _store_config_cache(path, sig, cfg):
+    with _USER_CONFIG_CACHE_LOCK:
+        _USER_CONFIG_CACHE[path] = (sig, cfg)
+        _USER_CONFIG_CACHE.move_to_end(path)
+        while len(_USER_CONFIG_CACHE) > USER_CONFIG_CACHE_MAX_ITEMS:
+            _USER_CONFIG_CACHE.popitem(last=False)
 
 
-def _save_output_index(data):
-    _atomic_write_json(OUTPUT_META_PATH, data)
+def _invalidate_user_config_cache(path):
+    with _USER_CONFIG_CACHE_LOCK:
+        _USER_CONFIG_CACHE.pop(path, None)
 
 
-def _atomic_write_json(path, data):
-    folder = os.path.dirname(path) or "."
-    os.makedirs(folder, exist_ok=True)
-    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".json", dir=folder)
+def _save_user_config(user_id, cfg, defer=False):
+    path = _get_user_config_path(user_id)
+    cfg = _strip_template_fields(cfg)
+    if defer and CONFIG_WRITE_BEHIND.enabled:
+        CONFIG_WRITE_BEHIND.put(path, _strip_template_fields({**deepcopy(DEFAULT_CONFIG), **deepcopy(cfg)}))
+        return
+    CONFIG_WRITE_BEHIND.write_now(path, cfg)
     try:
-        with os.fdopen(fd, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-            f.flush()
-            os.fsync(f.fileno())
-        os.replace(tmp_path, path)
-    except Exception:
-        try:
-            os.remove(tmp_path)
-        except Exception:
-            pass
-        raise
-
+        st = os.stat(path)
+    except OSError:
+        _invalidate_user_config_cache(path)
+        return
+    _store_config_cache(path, (st.st_mtime_ns, st.st_size), _strip_template_fields({**deepcopy(DEFAULT_CONFIG), **deepcopy(cfg)}))
 
-def _validate_uploaded_image(path):
-    try:
-        with Image.open(path) as img:
-            img.verify()
-        with Image.open(path) as img2:
-            width, height = img2.size
-    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
-        return False, "图片文件无效或已损坏"
-    except Exception:
-        _log_exception("upload.image_verify_failed", path=path)
-        return False, "图片校验失败，请重试"
-    if width <= 0 or height <= 0:
-        return False, "图片尺寸无效"
-    if width * height > MAX_UPLOAD_IMAGE_PIXELS:
-        return False, f"图片像素过大，最大支持 {MAX_UPLOAD_IMAGE_PIXELS} 像素"
-    return True, ""
 
+GUEST_SEED_KEYS = ("bg_mode", "bg_image_path", "logo_image_path")
 
-def _record_output_owner(relpath, user_id):
-    rel = str(relpath or "").replace("\\", "/").strip()
-    uid = _sanitize_user_id(user_id)
-    if not rel or not uid:
-        return
-    with _OUTPUT_META_LOCK:
-        idx = _load_output_index()
-        idx[rel] = {"user_id": uid, "created_at": datetime.datetime.now().isoformat(timespec="seconds")}
-        _save_output_index(idx)
 
+def _get_guest_seed(user_id):
+    # Guests are not persisted until their first real change; the randomly picked
+    # background/logo live in the signed session cookie so every worker agrees.
+    if not has_request_context():
+        return {}
+    seed = session.get("guest_seed")
+    if not isinstance(seed, dict) or seed.get("user_id") != user_id:
+        return {}
+    return {k: str(seed[k]) for k in GUEST_SEED_KEYS if k in seed}
 
-def _parse_iso_timestamp(raw_value):
-    text = str(raw_value or "").strip()
-    if not text:
-        return 0.0
-    try:
-        return datetime.datetime.fromisoformat(text).timestamp()
-    except Exception:
-        return 0.0
 
+def _set_guest_seed(user_id, cfg):
+    seed = {"user_id": user_id, **{k: cfg.get(k, "") for k in GUEST_SEED_KEYS}}
+    if session.get("guest_seed") != seed:
+        session["guest_seed"] = seed
 
-def _prune_old_outputs_for_user(user_id, keep=MAX_SAVED_OUTPUTS_PER_USER):
-    uid = _sanitize_user_id(user_id)
-    keep_count = max(1, int(keep or 1))
-    if not uid:
-        return {"removed_outputs": 0, "removed_index_entries": 0}
-
-    removed_relpaths = []
-    with _OUTPUT_META_LOCK:
-        idx = _load_output_index()
-        owned = []
-        for rel, meta in idx.items():
-            owner = _sanitize_user_id((meta or {}).get("user_id", ""))
-            if owner != uid:
-                continue
-            created_at = _parse_iso_timestamp((meta or {}).get("created_at", ""))
-            owned.append((created_at, str(rel), meta))
-        if len(owned) <= keep_count:
-            return {"removed_outputs": 0, "removed_index_entries": 0}
-        owned.sort(key=lambda item: (item[0], item[1]), reverse=True)
-        stale_relpaths = {rel for _, rel, _ in owned[keep_count:]}
-        next_idx = {rel: meta for rel, meta in idx.items() if rel not in stale_relpaths}
-        removed_relpaths = sorted(stale_relpaths)
-        _save_output_index(next_idx)
 
-    removed_outputs = 0
-    for rel in removed_relpaths:
-        abs_path = _safe_join_data_path(rel)
-        if not abs_path or not os.path.isfile(abs_path):
-            continue
-        try:
-            os.remove(abs_path)
-            removed_outputs += 1
-        except Exception:
-            _log_exception("output_prune.remove_failed", user_id=uid, path=abs_path)
+def _load_user_config(user_id):
+    # Hot path for preview/generate: read-only, no repair and no writes.
+    cfg = _read_config_cached(_get_user_config_path(user_id))
+    if cfg is None:
+        cfg = dict(_read_global_config() or DEFAULT_CONFIG)
+        if _is_guest_user(user_id):
+            cfg.update(_get_guest_seed(user_id))
+    cfg = _strip_template_fields(cfg)
+    if _is_guest_user(user_id):
+        cfg["stamp_image_path"] = ""
+        cfg["qrcode_image_path"] = ""
+    return cfg
 
-    user_output_dir = os.path.join(OUTPUT_DIR, uid)
-    if os.path.isdir(user_output_dir):
-        try:
-            if not any(os.scandir(user_output_dir)):
-                os.rmdir(user_output_dir)
-        except Exception:
-            _log_exception("output_prune.cleanup_dir_failed", user_id=uid, path=user_output_dir)
 
-    return {"removed_outputs": removed_outputs, "removed_index_entries": len(removed_relpaths)}
+def _build_render_cfg(user_id, overrides):
+    if not isinstance(overrides, dict):
+        overrides = {}
+    cfg = _sanitize_runtime_cfg({**_load_user_config(user_id), **_strip_template_fields(overrides)})
+    return _normalize_cfg_paths(_strip_template_fields(cfg))
 
 
-def _load_user_config(user_id):
+def _ensure_user_config(user_id):
+    # Page-load path: creates the user's config on first visit, repairs default
+    # assets (random preset/logo, legacy logo names) and moves legacy templates into
+    # TEMPLATE_STORE. Persists only when changed; guests without a saved config are
+    # kept in the session instead.
     user_path = _get_user_config_path(user_id)
-    user_config_exists = os.path.isfile(user_path)
+    cached = _read_config_cached(user_path)
+    user_config_exists = cached is not None
     if user_config_exists:
-        cfg = load_config(user_path)
+        cfg = deepcopy(cached)
     else:
-        cfg = load_config(CONFIG_PATH)
+        cfg = deepcopy(_read_global_config() or DEFAULT_CONFIG)
     changed = False
     default_logos = list(PresetGenerator.get_default_logos(BASE_DIR).values())
-    if not user_config_exists:
+    guest_seed = _get_guest_seed(user_id) if (_is_guest_user(user_id) and not user_config_exists) else {}
+    if guest_seed:
+        cfg.update(guest_seed)
+    elif not user_config_exists:
         presets = list(PresetGenerator.get_presets(BASE_DIR).values())
         if presets:
             picked = random.choice(presets)
@@ -550,8 +2789,18 @@ def _load_user_config(user_id):
         if cfg.get("qrcode_image_path"):
             cfg["qrcode_image_path"] = ""
             changed = True
+    legacy_template_fields = _extract_template_fields(cfg) if user_config_exists else {}
+    if legacy_template_fields:
+        # Templates left in an old config file predate the store; add them to it
+        # rather than letting them replace what was created since.
+        TEMPLATE_STORE.merge(user_id, legacy_template_fields, replace_templates=False)
+        changed = True
+    cfg = _strip_template_fields(cfg)
+    if _is_guest_user(user_id) and not user_config_exists:
+        _set_guest_seed(user_id, cfg)
+        return cfg
     if (not user_config_exists) or changed:
-        save_config(user_path, cfg)
+        _save_user_config(user_id, cfg)
     return cfg
 
 
@@ -592,9 +2841,7 @@ def _is_owned_output(relpath, abs_path, user_id):
         return False
 
     rel = str(relpath or "").replace("\\", "/").strip()
-    with _OUTPUT_META_LOCK:
-        idx = _load_output_index()
-    owner = idx.get(rel, {}).get("user_id")
+    owner = OUTPUT_INDEX.owner(rel)
     if owner:
         return owner == uid
 
@@ -672,6 +2919,7 @@ def _register_login_failure(user_id):
             item["lock_until"] = now + LOGIN_LOCK_SECONDS
             item["window_start"] = now
             item["count"] = 0
+            METRICS.inc("poster_login_lockouts_total")
         _LOGIN_FAIL_BUCKETS[key] = item
 
 
@@ -681,13 +2929,15 @@ def _clear_login_failures(user_id):
         _LOGIN_FAIL_BUCKETS.pop(key, None)
 
 
-def _build_preview_cache_id(content, date_str, title, cfg):
+def _build_preview_cache_id(content, date_str, title, cfg, quality="full"):
     payload = {
         "content": content or "",
         "title": title or "",
         "date": date_str or "",
         "config": cfg or {},
     }
+    if quality != "full":
+        payload["quality"] = quality
     raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
     return hashlib.sha256(raw.encode("utf-8")).hexdigest()
 
@@ -720,152 +2970,288 @@ def _admin_guard():
 
 def _collect_all_user_ids():
     ids = set()
-    users = _load_users()
-    ids.update(_sanitize_user_id(uid) for uid in users.keys())
-    if os.path.isdir(USER_CONFIG_DIR):
-        for name in os.listdir(USER_CONFIG_DIR):
+    ids.update(_sanitize_user_id(uid) for uid in ACCOUNT_STORE.user_ids())
+    for root_dir in (USER_CONFIG_DIR, USER_TEMPLATE_DIR):
+        if not os.path.isdir(root_dir):
+            continue
+        for name in os.listdir(root_dir):
             if not name.lower().endswith(".json"):
                 continue
             uid = _sanitize_user_id(os.path.splitext(name)[0])
             if uid:
                 ids.add(uid)
-    with _OUTPUT_META_LOCK:
-        idx = _load_output_index()
-    for meta in idx.values():
-        uid = _sanitize_user_id((meta or {}).get("user_id", ""))
-        if uid:
-            ids.add(uid)
+    ids.update(_sanitize_user_id(uid) for uid in OUTPUT_INDEX.user_ids())
     ids.discard("")
     return sorted(ids)
 
 
 def _collect_output_counts():
     counts = {}
-    with _OUTPUT_META_LOCK:
-        idx = _load_output_index()
-    for meta in idx.values():
-        uid = _sanitize_user_id((meta or {}).get("user_id", ""))
-        if not uid:
-            continue
-        counts[uid] = counts.get(uid, 0) + 1
+    for uid, count in OUTPUT_INDEX.counts().items():
+        uid = _sanitize_user_id(uid)
+        if uid:
+            counts[uid] = counts.get(uid, 0) + int(count)
     return counts
 
 
+def _touch_user_activity(entries):
+    # entries: (user_id, ts, has_config, has_password). Activity bookkeeping must
+    # never fail the write it describes.
+    entries = [entry for entry in entries if entry[0]]
+    if not entries:
+        return
+    try:
+        OUTPUT_INDEX.touch_many(entries)
+    except Exception:
+        _log_exception("user_activity.touch_failed", users=len(entries))
+
+
+def _config_path_user_id(path):
+    if os.path.dirname(os.path.abspath(path)) != os.path.abspath(USER_CONFIG_DIR):
+        return ""
+    return _sanitize_user_id(os.path.splitext(os.path.basename(path))[0])
+
+
+def _ensure_user_activity_index():
+    # One-time backfill of the activity summary from what is already on disk;
+    # afterwards it is maintained by the write paths.
+    if OUTPUT_INDEX.activity_ready():
+        return
+    entries = {}
+    for root_dir, has_config in ((USER_CONFIG_DIR, True), (USER_TEMPLATE_DIR, False)):
+        if not os.path.isdir(root_dir):
+            continue
+        for name in os.listdir(root_dir):
+            if not name.lower().endswith(".json"):
+                continue
+            uid = _sanitize_user_id(os.path.splitext(name)[0])
+            if not uid:
+                continue
+            meta = entries.setdefault(uid, {})
+            if has_config:
+                meta["has_config"] = True
+                try:
+                    meta["last_active_ts"] = os.path.getmtime(os.path.join(root_dir, name))
+                except OSError:
+                    _log_event(logging.WARNING, "user_last_active.mtime_failed", user_id=uid, path=root_dir)
+    for uid in ACCOUNT_STORE.user_ids():
+        uid = _sanitize_user_id(uid)
+        if uid:
+            entries.setdefault(uid, {})["has_password"] = True
+    OUTPUT_INDEX.rebuild_activity(entries)
+
+
 def _user_last_active_timestamp(user_id):
     uid = _sanitize_user_id(user_id)
     if not uid:
         return 0.0
-    ts = 0.0
-    cfg_path = _get_user_config_path(uid)
-    if os.path.isfile(cfg_path):
-        try:
-            ts = max(ts, os.path.getmtime(cfg_path))
-        except Exception:
-            _log_event(logging.WARNING, "user_last_active.mtime_failed", user_id=uid, path=cfg_path)
-    with _OUTPUT_META_LOCK:
-        idx = _load_output_index()
-    for meta in idx.values():
-        if _sanitize_user_id((meta or {}).get("user_id", "")) != uid:
-            continue
-        created = str((meta or {}).get("created_at", "")).strip()
-        if not created:
-            continue
-        try:
-            parsed = datetime.datetime.fromisoformat(created)
-            ts = max(ts, parsed.timestamp())
-        except Exception:
-            _log_event(logging.WARNING, "user_last_active.parse_failed", user_id=uid, created_at=created)
-    return ts
+    _ensure_user_activity_index()
+    row = OUTPUT_INDEX.activity(uid)
+    return float(row["last_active_ts"]) if row else 0.0
 
 
-def _admin_delete_user_data(user_id, include_outputs=True):
-    uid = _sanitize_user_id(user_id)
-    if not uid:
-        raise ValueError("用户ID无效")
-
-    deleted = {
-        "user_id": uid,
-        "removed_user": False,
-        "removed_config": False,
-        "removed_outputs": 0,
-        "removed_output_dir": False,
-        "removed_index_entries": 0,
+def _admin_delete_users_data(user_ids, include_outputs=True):
+    # Batch form used by guest cleanup: account and index rows for the whole batch
+    # are removed in one transaction each; files are removed per user.
+    uids = []
+    for user_id in user_ids:
+        uid = _sanitize_user_id(user_id)
+        if not uid:
+            raise ValueError("用户ID无效")
+        uids.append(uid)
+    results = {
+        uid: {
+            "user_id": uid,
+            "removed_user": False,
+            "removed_config": False,
+            "removed_outputs": 0,
+            "removed_output_dir": False,
+            "removed_index_entries": 0,
+            "removed_templates": False,
+        }
+        for uid in uids
     }
 
-    users = _load_users()
-    if uid in users:
-        users.pop(uid, None)
-        _save_users(users)
-        deleted["removed_user"] = True
+    for uid in ACCOUNT_STORE.delete_users(uids):
+        results[uid]["removed_user"] = True
 
-    cfg_path = _get_user_config_path(uid)
-    if os.path.isfile(cfg_path):
+    for uid in uids:
+        cfg_path = _get_user_config_path(uid)
+        CONFIG_WRITE_BEHIND.discard(cfg_path)
+        _invalidate_user_config_cache(cfg_path)
+        if os.path.isfile(cfg_path):
+            try:
+                os.remove(cfg_path)
+                results[uid]["removed_config"] = True
+            except Exception:
+                _log_exception("admin_delete.remove_config_failed", user_id=uid, path=cfg_path)
         try:
-            os.remove(cfg_path)
-            deleted["removed_config"] = True
+            results[uid]["removed_templates"] = TEMPLATE_STORE.delete_user(uid)
         except Exception:
-            _log_exception("admin_delete.remove_config_failed", user_id=uid, path=cfg_path)
-
-    removed_relpaths = []
-    with _OUTPUT_META_LOCK:
-        idx = _load_output_index()
-        kept = {}
-        for rel, meta in idx.items():
-            owner = _sanitize_user_id((meta or {}).get("user_id", ""))
-            if owner == uid:
-                removed_relpaths.append(str(rel))
-            else:
-                kept[rel] = meta
-        if len(kept) != len(idx):
-            _save_output_index(kept)
-        deleted["removed_index_entries"] = len(idx) - len(kept)
+            _log_exception("admin_delete.remove_templates_failed", user_id=uid)
 
-    if include_outputs:
-        for rel in removed_relpaths:
+    removed_relpaths = OUTPUT_INDEX.delete_users(uids)
+    for uid in uids:
+        relpaths = removed_relpaths.get(uid, [])
+        results[uid]["removed_index_entries"] = len(relpaths)
+        if not include_outputs:
+            continue
+        for rel in relpaths:
             abs_path = _safe_join_data_path(rel)
             if not abs_path or not os.path.isfile(abs_path):
                 continue
             try:
                 os.remove(abs_path)
-                deleted["removed_outputs"] += 1
+                results[uid]["removed_outputs"] += 1
             except Exception:
                 _log_exception("admin_delete.remove_output_failed", user_id=uid, path=abs_path)
         user_output_dir = os.path.join(OUTPUT_DIR, uid)
         if os.path.isdir(user_output_dir):
             try:
                 shutil.rmtree(user_output_dir)
-                deleted["removed_output_dir"] = True
+                results[uid]["removed_output_dir"] = True
             except Exception:
                 _log_exception("admin_delete.remove_output_dir_failed", user_id=uid, path=user_output_dir)
-    return deleted
+    return [results[uid] for uid in uids]
+
+
+def _admin_delete_user_data(user_id, include_outputs=True):
+    return _admin_delete_users_data([user_id], include_outputs=include_outputs)[0]
+
 
+def _select_stale_guests(days):
+    _ensure_user_activity_index()
+    return OUTPUT_INDEX.stale_guests(time.time() - days * 86400)
 
-def _export_all_data_snapshot():
-    users = _load_users()
+
+def _run_guest_cleanup(params, report):
+    include_outputs = params["include_outputs"]
+    candidates = [uid for uid, _ in _select_stale_guests(params["days"])]
+    report(total=len(candidates), processed=0, removed_count=0, removed_outputs=0)
+    removed = []
+    removed_outputs = 0
+    for start in range(0, len(candidates), GUEST_CLEANUP_BATCH_SIZE):
+        batch = candidates[start:start + GUEST_CLEANUP_BATCH_SIZE]
+        for item in _admin_delete_users_data(batch, include_outputs=include_outputs):
+            removed.append(item["user_id"])
+            removed_outputs += item["removed_outputs"]
+        report(processed=start + len(batch), removed_count=len(removed), removed_outputs=removed_outputs)
+    _log_event(logging.INFO, "admin_cleanup_guests.done", removed_count=len(removed), include_outputs=include_outputs)
+    return {"removed_count": len(removed), "removed_outputs": removed_outputs, "removed_user_ids": removed[:1000]}
+
+
+def _iter_export_records():
+    # One (section, key, value) per record, read from the stores as it is consumed;
+    # only the user id list and per-user output counts are held in memory.
     user_ids = _collect_all_user_ids()
-    output_counts = _collect_output_counts()
-    user_configs = {}
+    yield "meta", "generated_at", datetime.datetime.now().isoformat(timespec="seconds")
+    yield "meta", "data_dir", DATA_DIR
+    for uid, password_hash in ACCOUNT_STORE.iter_hashes():
+        yield "users", uid, password_hash
     for uid in user_ids:
-        cfg_path = _get_user_config_path(uid)
-        if not os.path.isfile(cfg_path):
+        cfg = _read_config_cached(_get_user_config_path(uid))
+        if cfg is not None:
+            yield "user_configs", uid, cfg
+    for uid in user_ids:
+        if os.path.isfile(TEMPLATE_STORE._path(uid)):
+            yield "user_templates", uid, TEMPLATE_STORE.load(uid)
+    for rel, uid, created_at in OUTPUT_INDEX.iter_entries():
+        yield "output_index", rel, {"user_id": uid, "created_at": created_at}
+    for uid in user_ids:
+        yield "user_ids", None, uid
+    for uid, count in sorted(_collect_output_counts().items()):
+        yield "output_counts", uid, count
+
+
+EXPORT_SECTIONS = ("users", "user_configs", "user_templates", "output_index", "user_ids", "output_counts")
+
+
+def _export_json_brackets(section):
+    return ("[", "]") if section == "user_ids" else ("{", "}")
+
+
+def _iter_export_json():
+    # Same document as the former in-memory snapshot, emitted one entry per line.
+    # Every section is opened even when empty, so the shape never changes.
+    dump = lambda value: json.dumps(value, ensure_ascii=False)
+    position = -1
+    first = True
+
+    def advance(target):
+        nonlocal position, first
+        while position < target:
+            if position >= 0:
+                yield "\n  " + _export_json_brackets(EXPORT_SECTIONS[position])[1] + ","
+            position += 1
+            first = True
+            yield f"\n  {dump(EXPORT_SECTIONS[position])}: " + _export_json_brackets(EXPORT_SECTIONS[position])[0]
+
+    yield "{"
+    for kind, key, value in _iter_export_records():
+        if kind == "meta":
+            yield f"\n  {dump(key)}: {dump(value)},"
             continue
-        user_configs[uid] = load_config(cfg_path)
-    with _OUTPUT_META_LOCK:
-        output_index = _load_output_index()
-    return {
-        "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
-        "data_dir": DATA_DIR,
-        "users": users,
-        "user_configs": user_configs,
-        "output_index": output_index,
-        "user_ids": user_ids,
-        "output_counts": output_counts,
-    }
+        yield from advance(EXPORT_SECTIONS.index(kind))
+        item = dump(value) if key is None else f"{dump(key)}: {dump(value)}"
+        yield ("\n    " if first else ",\n    ") + item
+        first = False
+    yield from advance(len(EXPORT_SECTIONS) - 1)
+    yield "\n  " + _export_json_brackets(EXPORT_SECTIONS[-1])[1] + "\n}\n"
+
+
+def _iter_export_ndjson():
+    labels = {"users": ("user", "user_id", "password_hash"), "user_configs": ("config", "user_id", "config"),
+              "user_templates": ("templates", "user_id", "templates"), "output_index": ("output", "relpath", None),
+              "user_ids": ("user_id", None, "user_id"), "output_counts": ("output_count", "user_id", "count")}
+    meta = {"type": "meta"}
+    for kind, key, value in _iter_export_records():
+        if kind == "meta":
+            meta[key] = value
+            if key == "data_dir":
+                yield json.dumps(meta, ensure_ascii=False) + "\n"
+            continue
+        label, key_field, value_field = labels[kind]
+        record = {"type": label}
+        if key_field:
+            record[key_field] = key
+        if value_field:
+            record[value_field] = value
+        else:
+            record.update(value)
+        yield json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def _iter_export_chunks(fmt="json"):
+    # Coalesces the per-record strings into ~64K chunks of UTF-8.
+    pieces = []
+    size = 0
+    for piece in (_iter_export_ndjson() if fmt == "ndjson" else _iter_export_json()):
+        pieces.append(piece)
+        size += len(piece)
+        if size >= EXPORT_STREAM_CHUNK_CHARS:
+            yield "".join(pieces).encode("utf-8")
+            pieces = []
+            size = 0
+    if pieces:
+        yield "".join(pieces).encode("utf-8")
 
 
 def _collect_backup_files(include_outputs):
     selected = []
-    for root, _, files in os.walk(DATA_DIR):
+    for root, dirs, files in os.walk(DATA_DIR):
+        if os.path.abspath(root) == DATA_DIR:
+            # Caches, job reports, backup manifests, metrics and profiles are not data.
+            skipped = {
+                os.path.basename(PREVIEW_DISK_DIR),
+                os.path.basename(ADMIN_JOB_DIR),
+                os.path.basename(BACKUP_MANIFEST_DIR),
+                os.path.basename(METRICS_DIR),
+                os.path.basename(PROFILE_DIR),
+            }
+            dirs[:] = [d for d in dirs if d not in skipped]
+            # The live SQLite files are added separately as a consistent snapshot.
+            live_dbs = (os.path.basename(OUTPUT_INDEX_DB_PATH), os.path.basename(ACCOUNTS_DB_PATH))
+            files = [f for f in files if not f.startswith(live_dbs)]
         for name in files:
             abs_path = os.path.join(root, name)
             rel = os.path.relpath(abs_path, DATA_DIR).replace("\\", "/")
@@ -875,10 +3261,216 @@ def _collect_backup_files(include_outputs):
     return selected
 
 
+class _ZipStreamSink:
+    # Write-only file object for zipfile. Being unseekable makes zipfile emit data
+    # descriptors, so entries can be streamed out as they are written.
+    def __init__(self):
+        self._buf = bytearray()
+
+    def write(self, data):
+        self._buf += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = bytes(self._buf)
+        self._buf.clear()
+        return data
+
+
+def _zip_stream_file(zf, sink, abs_path, arcname, entries, errors):
+    try:
+        src = open(abs_path, "rb")
+    except OSError as e:
+        errors.append({"path": arcname, "error": str(e)})
+        return
+    with src:
+        st = os.fstat(src.fileno())
+        ext = os.path.splitext(arcname)[1].lower()
+        zinfo = zipfile.ZipInfo(arcname, time.localtime(max(st.st_mtime, 315532800))[:6])
+        zinfo.file_size = st.st_size
+        zinfo.external_attr = (st.st_mode & 0xFFFF) << 16
+        zinfo.compress_type = zipfile.ZIP_STORED if ext in BACKUP_STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+        digest = hashlib.sha256()
+        try:
+            with zf.open(zinfo, "w") as dest:
+                while True:
+                    chunk = src.read(BACKUP_STREAM_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    dest.write(chunk)
+                    yield sink.drain()
+        except OSError as e:
+            # The entry header is already on the wire; it is closed short and flagged.
+            errors.append({"path": arcname, "error": f"{e} (entry truncated)"})
+            return
+    entries.append(
+        {
+            "path": arcname,
+            "size": st.st_size,
+            "mtime": st.st_mtime,
+            "sha256": digest.hexdigest(),
+            "in_archive": True,
+            "stored": zinfo.compress_type == zipfile.ZIP_STORED,
+        }
+    )
+    yield sink.drain()
+
+
+def _file_sha256(abs_path):
+    digest = hashlib.sha256()
+    with open(abs_path, "rb") as f:
+        for chunk in iter(lambda: f.read(BACKUP_STREAM_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _backup_file_unchanged(abs_path, st, prev):
+    # size+mtime match is trusted; a touched file with the same size is hashed
+    # when the base manifest has a hash to compare against.
+    if not prev or int(prev.get("size", -1)) != st.st_size:
+        return False
+    if float(prev.get("mtime", -1)) == st.st_mtime:
+        return True
+    if prev.get("sha256"):
+        try:
+            return _file_sha256(abs_path) == prev["sha256"]
+        except OSError:
+            return False
+    return False
+
+
+def _parse_backup_base(raw):
+    # Accepts a previous backup's manifest.json. The base must carry its backup_id:
+    # restore_backup.py checks each incremental's base_backup_id against the
+    # archive before it, so an incremental of an unknown base could never be restored.
+    if not isinstance(raw, dict) or not isinstance(raw.get("files"), list):
+        raise ValueError("since 必须是上一份备份的 manifest.json")
+    backup_id = str(raw.get("backup_id") or "")
+    if not BACKUP_ID_RE.match(backup_id):
+        raise ValueError("since 清单缺少有效的 backup_id，无法作为增量备份的基准")
+    files = {}
+    for item in raw["files"]:
+        if isinstance(item, dict) and item.get("path"):
+            files[str(item["path"])] = item
+    return {"backup_id": backup_id, "files": files}
+
+
+def _load_backup_manifest(backup_id):
+    if not BACKUP_ID_RE.match(str(backup_id or "")):
+        return None
+    path = os.path.join(BACKUP_MANIFEST_DIR, f"{backup_id}.json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        _log_exception("admin_backup.manifest_load_failed", backup_id=backup_id)
+        return None
+    if not isinstance(manifest, dict):
+        _log_event(logging.WARNING, "admin_backup.manifest_invalid", backup_id=backup_id)
+        return None
+    return manifest
+
+
+def _save_backup_manifest(manifest):
+    os.makedirs(BACKUP_MANIFEST_DIR, exist_ok=True)
+    _atomic_write_json(os.path.join(BACKUP_MANIFEST_DIR, f"{manifest['backup_id']}.json"), manifest)
+    names = sorted(name for name in os.listdir(BACKUP_MANIFEST_DIR) if name.endswith(".json"))
+    for name in names[:-BACKUP_MANIFEST_KEEP]:
+        try:
+            os.remove(os.path.join(BACKUP_MANIFEST_DIR, name))
+        except OSError:
+            pass
+
+
+def _iter_backup_zip(backup_id, include_outputs, base=None):
+    # Full backup when base is None; otherwise only files that are new or changed
+    # relative to base["files"], plus a deletion list. The manifest always lists
+    # the complete in-scope file set so it can serve as the next base.
+    sink = _ZipStreamSink()
+    entries = []
+    snapshots = []
+    errors = []
+    base_files = (base or {}).get("files") or {}
+    started_at = datetime.datetime.now().isoformat(timespec="seconds")
+    seen = set()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for abs_path, rel_path in _collect_backup_files(include_outputs):
+            seen.add(rel_path)
+            prev = base_files.get(rel_path)
+            if base is not None:
+                try:
+                    st = os.stat(abs_path)
+                except OSError as e:
+                    errors.append({"path": rel_path, "error": str(e)})
+                    continue
+                if _backup_file_unchanged(abs_path, st, prev):
+                    entries.append(
+                        {
+                            "path": rel_path,
+                            "size": st.st_size,
+                            "mtime": st.st_mtime,
+                            "sha256": prev.get("sha256", ""),
+                            "in_archive": False,
+                        }
+                    )
+                    continue
+            yield from _zip_stream_file(zf, sink, abs_path, rel_path, entries, errors)
+        for store in (OUTPUT_INDEX, ACCOUNT_STORE):
+            fd, db_copy = tempfile.mkstemp(prefix="poster_db_", suffix=".sqlite3")
+            os.close(fd)
+            try:
+                store.backup_to(db_copy)
+                yield from _zip_stream_file(zf, sink, db_copy, os.path.basename(store.db_path), snapshots, errors)
+            except Exception as e:
+                _log_exception("admin_backup.db_snapshot_failed", path=store.db_path)
+                errors.append({"path": os.path.basename(store.db_path), "error": str(e)})
+            finally:
+                os.remove(db_copy)
+        export_info = zipfile.ZipInfo("export.json", time.localtime()[:6])
+        export_info.compress_type = zipfile.ZIP_DEFLATED
+        with zf.open(export_info, "w") as dest:
+            for chunk in _iter_export_chunks():
+                dest.write(chunk)
+                yield sink.drain()
+        yield sink.drain()
+        deleted = sorted(
+            path for path in base_files if path not in seen and (include_outputs or not path.startswith("outputs/"))
+        )
+        # Written last so it can list every entry and per-file error.
+        manifest = {
+            "backup_id": backup_id,
+            "type": "full" if base is None else "incremental",
+            "base_backup_id": (base or {}).get("backup_id", ""),
+            "generated_at": started_at,
+            "finished_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "include_outputs": include_outputs,
+            "files": entries,
+            "snapshots": snapshots,
+            "deleted": deleted,
+            "errors": errors,
+        }
+        zf.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2))
+        yield sink.drain()
+    if errors:
+        _log_event(logging.WARNING, "admin_backup.file_errors", backup_id=backup_id, errors=len(errors))
+    yield sink.drain()
+    # Only a backup that was streamed to the end can serve as a base.
+    try:
+        _save_backup_manifest(manifest)
+    except Exception:
+        _log_exception("admin_backup.save_manifest_failed", backup_id=backup_id)
+
+
 @app.route("/")
 def index():
     uid = _ensure_user_id()
-    cfg = _load_user_config(uid)
+    cfg = _ensure_user_config(uid)
     primary = _normalize_hex_color(cfg.get("theme_color"), "#B22222")
     primary_rgb = f"{int(primary[1:3], 16)}, {int(primary[3:5], 16)}, {int(primary[5:7], 16)}"
     initial_bg_variant = random.choice(["bg-variant-a", "bg-variant-b", "bg-variant-c", "bg-variant-d", "bg-variant-e"])
@@ -953,27 +3545,28 @@ def api_login():
     locked, wait_seconds = _is_login_locked(uid)
     if locked:
         _log_event(logging.WARNING, "auth.login_locked", user_id=uid, wait_seconds=wait_seconds)
+        METRICS.inc("poster_login_locked_rejections_total")
         return jsonify({"error": f"登录尝试过于频繁，请 {wait_seconds} 秒后重试"}), 429
 
-    users = _load_users()
-    has_user_profile = os.path.isfile(_get_user_config_path(uid))
-    user_hash = users.get(uid, "")
-    if user_hash:
-        if not check_password_hash(user_hash, password):
-            _register_login_failure(uid)
-            _log_event(logging.WARNING, "auth.login_wrong_password", user_id=uid)
-            return jsonify({"error": "密码错误"}), 401
-    else:
-        users[uid] = generate_password_hash(password)
-        _save_users(users)
+    has_user_profile = _read_config_cached(_get_user_config_path(uid)) is not None
+    user_hash = ACCOUNT_STORE.get_hash(uid)
+    if not user_hash:
+        if ACCOUNT_STORE.create(uid, generate_password_hash(password)):
+            _touch_user_activity([(uid, 0.0, None, True)])
+        else:
+            # Registered concurrently by another request; verify against the stored hash.
+            user_hash = ACCOUNT_STORE.get_hash(uid)
+    if user_hash and not check_password_hash(user_hash, password):
+        _register_login_failure(uid)
+        _log_event(logging.WARNING, "auth.login_wrong_password", user_id=uid)
+        return jsonify({"error": "密码错误"}), 401
     _clear_login_failures(uid)
 
     current_uid = _ensure_user_id()
     merge_from_current = bool(data.get("merge_from_current", True))
-    current_path = _get_user_config_path(current_uid)
-    target_path = _get_user_config_path(uid)
-    if merge_from_current and current_uid != uid and os.path.isfile(current_path) and (not has_user_profile):
-        save_config(target_path, load_config(current_path))
+    current_cfg = _read_config_cached(_get_user_config_path(current_uid))
+    if merge_from_current and current_uid != uid and current_cfg is not None and (not has_user_profile):
+        _save_user_config(uid, current_cfg)
     _set_session_user_id(uid)
     return jsonify({"ok": True, "user_id": uid, "display_user_id": _display_user_id(uid), "is_guest": _is_guest_user(uid)})
 
@@ -988,7 +3581,8 @@ def api_logout():
 @app.get("/api/init")
 def api_init():
     uid = _ensure_user_id()
-    cfg = _load_user_config(uid)
+    cfg = _ensure_user_config(uid)
+    OUTPUT_RETENTION.ensure_started()
     presets = PresetGenerator.get_presets(BASE_DIR)
     default_logos = PresetGenerator.get_default_logos(BASE_DIR)
     preset_payload = [{"name": name, "path": _public_path(path)} for name, path in presets.items()]
@@ -1009,26 +3603,41 @@ def api_admin_users():
     blocked = _admin_guard()
     if blocked:
         return blocked
-    users = _load_users()
-    output_counts = _collect_output_counts()
+    page = _coerce_int(request.args.get("page"), 1, 1, 1_000_000)
+    page_size = _coerce_int(request.args.get("page_size"), 50, 1, 500)
+    sort = str(request.args.get("sort") or "last_active").strip()
+    if sort not in OutputIndex.ACTIVITY_SORT_COLUMNS:
+        return jsonify({"error": "sort 仅支持 user_id / last_active / output_count"}), 400
+    order = str(request.args.get("order") or "desc").strip().lower()
+    if order not in {"asc", "desc"}:
+        return jsonify({"error": "order 仅支持 asc / desc"}), 400
+    kind = str(request.args.get("type") or "all").strip().lower()
+    if kind not in {"all", "guest", "registered"}:
+        return jsonify({"error": "type 仅支持 all / guest / registered"}), 400
+    query = str(request.args.get("q") or "").strip()[:64]
+
+    _ensure_user_activity_index()
+    total, entries = OUTPUT_INDEX.list_activity(
+        (page - 1) * page_size, page_size, sort=sort, descending=order == "desc", query=query, kind=kind
+    )
     rows = []
-    for uid in _collect_all_user_ids():
-        cfg_path = _get_user_config_path(uid)
-        last_active_ts = _user_last_active_timestamp(uid)
+    for entry in entries:
+        uid = entry["user_id"]
+        last_active_ts = entry["last_active_ts"]
         rows.append(
             {
                 "user_id": uid,
                 "display_user_id": _display_user_id(uid),
                 "is_guest": _is_guest_user(uid),
-                "has_password": bool(users.get(uid)),
-                "has_config": os.path.isfile(cfg_path),
-                "output_count": int(output_counts.get(uid, 0)),
+                "has_password": entry["has_password"],
+                "has_config": entry["has_config"],
+                "output_count": int(entry["output_count"]),
                 "last_active": datetime.datetime.fromtimestamp(last_active_ts).isoformat(timespec="seconds")
                 if last_active_ts
                 else "",
             }
         )
-    return jsonify({"users": rows, "total": len(rows)})
+    return jsonify({"users": rows, "total": total, "page": page, "page_size": page_size, "sort": sort, "order": order})
 
 
 @app.get("/api/admin/export")
@@ -1036,35 +3645,191 @@ def api_admin_export():
     blocked = _admin_guard()
     if blocked:
         return blocked
-    snapshot = _export_all_data_snapshot()
     download = str(request.args.get("download", "0")).strip().lower() in {"1", "true", "yes"}
-    if not download:
-        return jsonify(snapshot)
-    payload = json.dumps(snapshot, ensure_ascii=False, indent=2).encode("utf-8")
-    buf = io.BytesIO(payload)
-    buf.seek(0)
-    filename = f"poster_export_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-    return send_file(buf, mimetype="application/json", as_attachment=True, download_name=filename)
-
-
-@app.get("/api/admin/backup")
+    fmt = str(request.args.get("format", "json")).strip().lower()
+    if fmt not in {"json", "ndjson"}:
+        return jsonify({"error": "format 仅支持 json 或 ndjson"}), 400
+    headers = {"X-Accel-Buffering": "no"}
+    if download:
+        ext = "ndjson" if fmt == "ndjson" else "json"
+        filename = f"poster_export_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.{ext}"
+        headers["Content-Disposition"] = f"attachment; filename={filename}"
+    mimetype = "application/x-ndjson" if fmt == "ndjson" else "application/json"
+    return Response(_iter_export_chunks(fmt), mimetype=mimetype, headers=headers)
+
+
+@app.route("/api/admin/backup", methods=["GET", "POST"])
 def api_admin_backup():
     blocked = _admin_guard()
     if blocked:
         return blocked
     include_outputs = _coerce_request_bool(request.args.get("include_outputs"), True)
-    files = _collect_backup_files(include_outputs)
-    snapshot = _export_all_data_snapshot()
-    zip_buf = io.BytesIO()
-    with zipfile.ZipFile(zip_buf, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-        zf.writestr("manifest.json", json.dumps(snapshot, ensure_ascii=False, indent=2))
-        for abs_path, rel_path in files:
-            if not os.path.isfile(abs_path):
+    base = None
+    since_id = str(request.args.get("since") or "").strip()
+    if request.method == "POST":
+        try:
+            data = _json_body()
+            base = _parse_backup_base(data.get("since"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    elif since_id:
+        manifest = _load_backup_manifest(since_id)
+        if manifest is None:
+            return jsonify({"error": "找不到该备份的清单，请改用完整备份或上传清单"}), 404
+        base = _parse_backup_base(manifest)
+    backup_id = f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+    kind = "full" if base is None else "incr"
+    filename = f"poster_backup_{backup_id}_{kind}.zip"
+    return Response(
+        _iter_backup_zip(backup_id, include_outputs, base=base),
+        mimetype="application/zip",
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "X-Accel-Buffering": "no",
+            "X-Backup-Id": backup_id,
+        },
+    )
+
+
+@app.get("/api/admin/backups")
+def api_admin_backups():
+    blocked = _admin_guard()
+    if blocked:
+        return blocked
+    rows = []
+    if os.path.isdir(BACKUP_MANIFEST_DIR):
+        for name in sorted(os.listdir(BACKUP_MANIFEST_DIR), reverse=True):
+            if not name.endswith(".json"):
                 continue
-            zf.write(abs_path, arcname=rel_path)
-    zip_buf.seek(0)
-    filename = f"poster_backup_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
-    return send_file(zip_buf, mimetype="application/zip", as_attachment=True, download_name=filename)
+            manifest = _load_backup_manifest(name[:-5])
+            if not manifest:
+                continue
+            rows.append(
+                {
+                    "backup_id": manifest.get("backup_id", ""),
+                    "type": manifest.get("type", ""),
+                    "base_backup_id": manifest.get("base_backup_id", ""),
+                    "generated_at": manifest.get("generated_at", ""),
+                    "include_outputs": manifest.get("include_outputs", True),
+                    "file_count": len(manifest.get("files") or []),
+                    "archived_count": sum(1 for f in manifest.get("files") or [] if f.get("in_archive")),
+                    "deleted_count": len(manifest.get("deleted") or []),
+                    "error_count": len(manifest.get("errors") or []),
+                }
+            )
+    return jsonify({"backups": rows, "total": len(rows)})
+
+
+METRIC_HELP = {
+    "poster_http_requests_total": ("counter", "HTTP responses by Flask endpoint and status."),
+    "poster_render_seconds": ("histogram", "draw_poster wall time by endpoint and card style."),
+    "poster_renders_in_flight": ("gauge", "Renders currently running, summed over live workers."),
+    "poster_preview_cache_lookups_total": ("counter", "Preview cache lookups by tier and result."),
+    "poster_uploads_total": ("counter", "Image uploads by result."),
+    "poster_upload_bytes_total": ("counter", "Bytes of accepted image uploads."),
+    "poster_login_lockouts_total": ("counter", "Login buckets locked after too many failures."),
+    "poster_login_locked_rejections_total": ("counter", "Login attempts rejected while locked."),
+    "poster_render_memory_downscaled_total": ("counter", "Renders whose inputs were decoded at canvas size to fit the memory budget."),
+    "poster_render_memory_rejections_total": ("counter", "Renders rejected because they exceed the memory budget."),
+    "poster_preview_quality_total": ("counter", "Preview renders by quality tier (full, balanced, fast)."),
+    "poster_render_queue_depth": ("gauge", "Renders waiting for an admission slot, summed over live workers."),
+    "poster_render_admission_rejections_total": ("counter", "Renders answered with 503 by admission control, by reason."),
+    "poster_output_index_entries": ("gauge", "Rows in the output index."),
+    "poster_metrics_workers": ("gauge", "Worker processes with a fresh metrics file."),
+}
+
+
+def _prometheus_labels(labels, extra=None):
+    items = list(labels) + list(extra or [])
+    if not items:
+        return ""
+    escape = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in items) + "}"
+
+
+def _render_prometheus(counters, histograms, gauges):
+    by_name = {}
+    for (name, labels), value in list(counters.items()) + list(gauges.items()):
+        by_name.setdefault(name, []).append((labels, [f"{name}{_prometheus_labels(labels)} {value}"]))
+    for (name, labels), hist in histograms.items():
+        # Stored bucket counts are already cumulative (value <= bound).
+        lines = [
+            f"{name}_bucket{_prometheus_labels(labels, [('le', repr(float(bound)))])} {count}"
+            for bound, count in zip(hist["buckets"], hist["counts"])
+        ]
+        lines.append(f"{name}_bucket{_prometheus_labels(labels, [('le', '+Inf')])} {hist['count']}")
+        lines.append(f"{name}_sum{_prometheus_labels(labels)} {round(hist['sum'], 6)}")
+        lines.append(f"{name}_count{_prometheus_labels(labels)} {hist['count']}")
+        by_name.setdefault(name, []).append((labels, lines))
+    out = []
+    for name in sorted(by_name):
+        kind, help_text = METRIC_HELP.get(name, ("untyped", ""))
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} {kind}")
+        for _, lines in sorted(by_name[name], key=lambda item: item[0]):
+            out.extend(lines)
+    return "\n".join(out) + "\n"
+
+
+@app.get("/metrics")
+def api_metrics():
+    # Same token as the admin API; Prometheus can send it as a bearer token.
+    blocked = _admin_guard()
+    if blocked:
+        return blocked
+    counters, histograms, gauges = METRICS.collect()
+    gauges[("poster_output_index_entries", ())] = OUTPUT_INDEX.size()
+    return Response(_render_prometheus(counters, histograms, gauges), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/api/admin/cache/stats")
+def api_admin_cache_stats():
+    blocked = _admin_guard()
+    if blocked:
+        return blocked
+    payload = {
+        "preview_cache": PREVIEW_CACHE.stats(),
+        "config_write_behind": CONFIG_WRITE_BEHIND.stats(),
+        "output_retention": OUTPUT_RETENTION.stats(),
+        "slow_profiler": SLOW_PROFILER.stats(),
+        "render_admission": RENDER_ADMISSION.stats(),
+        "shadow_cache": ShadowCache.stats(),
+    }
+    if _coerce_request_bool(request.args.get("redis_memory"), False):
+        sample = _coerce_int(request.args.get("sample"), 200, 1, 2000)
+        payload["redis_memory"] = PREVIEW_CACHE.redis_memory_report(sample=sample)
+    return jsonify(payload)
+
+
+@app.get("/api/admin/profiles")
+def api_admin_profiles():
+    blocked = _admin_guard()
+    if blocked:
+        return blocked
+    return jsonify({"profiles": SLOW_PROFILER.recent(), **SLOW_PROFILER.stats()})
+
+
+@app.get("/api/admin/profiles/<name>")
+def api_admin_profile(name):
+    blocked = _admin_guard()
+    if blocked:
+        return blocked
+    capture = SLOW_PROFILER.load(name)
+    if capture is None:
+        return jsonify({"error": "找不到该性能采样"}), 404
+    fmt = str(request.args.get("format", "folded")).strip().lower()
+    if fmt == "json":
+        return jsonify(capture)
+    if fmt != "folded":
+        return jsonify({"error": "format 仅支持 folded 或 json"}), 400
+    # Collapsed-stack text, readable by flamegraph.pl / speedscope.
+    stacks = sorted((capture.get("stacks") or {}).items(), key=lambda item: -item[1])
+    body = "".join(f"{stack} {count}\n" for stack, count in stacks)
+    return Response(
+        body,
+        mimetype="text/plain; charset=utf-8",
+        headers={"Content-Disposition": f"attachment; filename={name}.folded"},
+    )
 
 
 @app.post("/api/admin/users/<user_id>/password")
@@ -1082,9 +3847,8 @@ def api_admin_user_password(user_id):
     password = str(data.get("password", "")).strip()
     if len(password) < 4:
         return jsonify({"error": "密码至少 4 位"}), 400
-    users = _load_users()
-    users[uid] = generate_password_hash(password)
-    _save_users(users)
+    ACCOUNT_STORE.set_hash(uid, generate_password_hash(password))
+    _touch_user_activity([(uid, 0.0, None, True)])
     return jsonify({"ok": True, "user_id": uid})
 
 
@@ -1110,10 +3874,13 @@ def api_admin_user_config(user_id):
     if mode == "replace":
         cfg = {**DEFAULT_CONFIG, **cfg_patch}
     else:
-        base = load_config(target_path) if os.path.isfile(target_path) else load_config(CONFIG_PATH)
+        base = _read_config_cached(target_path) or _read_global_config() or DEFAULT_CONFIG
         cfg = {**base, **cfg_patch}
-    cfg = _sanitize_runtime_cfg(cfg)
-    save_config(target_path, cfg)
+    template_fields = _extract_template_fields(cfg_patch)
+    if template_fields:
+        TEMPLATE_STORE.merge(uid, template_fields)
+    cfg = _strip_template_fields(_sanitize_runtime_cfg(cfg))
+    _save_user_config(uid, cfg)
     return jsonify({"ok": True, "user_id": uid, "config": cfg})
 
 
@@ -1146,18 +3913,34 @@ def api_admin_cleanup_guests():
     if days < 0 or days > 3650:
         return jsonify({"error": "days 范围应在 0-3650"}), 400
     include_outputs = _coerce_request_bool(data.get("include_outputs"), False)
-    now = time.time()
-    cutoff = now - days * 86400
-    removed = []
-    for uid in _collect_all_user_ids():
-        if not _is_guest_user(uid):
-            continue
-        last_ts = _user_last_active_timestamp(uid)
-        if last_ts and last_ts > cutoff:
-            continue
-        deleted = _admin_delete_user_data(uid, include_outputs=include_outputs)
-        removed.append(deleted["user_id"])
-    return jsonify({"ok": True, "days": days, "include_outputs": include_outputs, "removed_count": len(removed), "removed_user_ids": removed})
+    params = {"days": days, "include_outputs": include_outputs}
+    if _coerce_request_bool(data.get("dry_run"), False):
+        candidates = _select_stale_guests(days)
+        return jsonify(
+            {
+                "ok": True,
+                "dry_run": True,
+                **params,
+                "candidate_count": len(candidates),
+                "output_count": sum(count for _, count in candidates),
+                "sample_user_ids": [uid for uid, _ in candidates[:20]],
+            }
+        )
+    job = ADMIN_JOBS.start("guest_cleanup", params, _run_guest_cleanup)
+    if job is None:
+        return jsonify({"error": "已有访客清理任务在运行", "job": ADMIN_JOBS.running("guest_cleanup")}), 409
+    return jsonify({"ok": True, "job": job}), 202
+
+
+@app.get("/api/admin/jobs/<job_id>")
+def api_admin_job(job_id):
+    blocked = _admin_guard()
+    if blocked:
+        return blocked
+    job = ADMIN_JOBS.get(job_id)
+    if job is None:
+        return jsonify({"error": "任务不存在"}), 404
+    return jsonify({"ok": True, "job": job})
 
 
 @app.post("/api/upload")
@@ -1177,11 +3960,14 @@ def api_upload():
     f.save(path)
     ok, msg = _validate_uploaded_image(path)
     if not ok:
+        METRICS.inc("poster_uploads_total", {"result": "rejected"})
         try:
             os.remove(path)
         except Exception:
             _log_exception("upload.cleanup_failed", path=path)
         return jsonify({"error": msg}), 400
+    METRICS.inc("poster_uploads_total", {"result": "accepted"})
+    METRICS.inc("poster_upload_bytes_total", value=os.path.getsize(path))
     return jsonify({"path": _public_path(path)})
 
 
@@ -1198,18 +3984,51 @@ def api_preview():
         date_str = _normalize_request_date_or_raise(data.get("date", ""))
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
+    timings = _stage_timings()
+    clock = StageClock(timings)
+    memory = None
     try:
-        cfg = _sanitize_runtime_cfg({**_load_user_config(uid), **data.get("config", {})})
-        cfg = _normalize_cfg_paths(cfg)
+        cfg = _build_render_cfg(uid, data.get("config"))
+        quality = _preview_quality()
         cache_id = _build_preview_cache_id(content, date_str, title, cfg)
-        png_bytes = PREVIEW_CACHE.get(uid, cache_id)
+        # A full-quality copy is served whenever one is cached; when it is not, the
+        # degraded lookup below is the one that counts the miss.
+        png_bytes = PREVIEW_CACHE.get(uid, cache_id, record_miss=quality == "full")
+        if png_bytes is None and quality != "full":
+            cache_id = _build_preview_cache_id(content, date_str, title, cfg, quality)
+            png_bytes = PREVIEW_CACHE.get(uid, cache_id)
+        else:
+            quality = "full"
         cache_hit = png_bytes is not None
+        clock.mark("cache_get")
         if png_bytes is None:
-            img = draw_poster(content, date_str, title, cfg)
-            buf = io.BytesIO()
-            img.convert("RGB").save(buf, "PNG")
-            png_bytes = buf.getvalue()
+            try:
+                fit_inputs, memory = _plan_render_memory(cfg, "preview")
+            except ValueError as e:
+                return _render_too_large_response(e)
+            with RENDER_ADMISSION.slot("preview") as admitted:
+                if not admitted:
+                    return _render_busy_response()
+                clock.mark("queue")
+                METRICS.inc("poster_preview_quality_total", {"quality": quality})
+                with _render_metrics("preview", cfg):
+                    img = draw_poster(
+                        content,
+                        date_str,
+                        title,
+                        cfg,
+                        timings=timings,
+                        fit_inputs=fit_inputs,
+                        memory=memory if RENDER_MEMORY_TRACKING else None,
+                        quality=quality,
+                    )
+                clock.restart()
+                buf = io.BytesIO()
+                img.convert("RGB").save(buf, "PNG")
+                png_bytes = buf.getvalue()
+                clock.mark("encode")
             PREVIEW_CACHE.set(uid, cache_id, png_bytes)
+            clock.mark("cache_set")
         image_data = "data:image/png;base64," + base64.b64encode(png_bytes).decode("ascii")
         valid, warnings = validate_content(content)
         image_url = f"/api/preview-image/{cache_id}"
@@ -1219,8 +4038,11 @@ def api_preview():
             user_id=uid,
             cache_id=cache_id,
             cache_hit=cache_hit,
+            quality=quality,
             title=(title or "")[:48],
             date=date_str,
+            timings={name: round(ms, 1) for name, ms in timings.items()},
+            **_memory_log_fields(memory),
         )
         return jsonify(
             {
@@ -1228,6 +4050,7 @@ def api_preview():
                 "image_url": image_url,
                 "image_data": image_data,
                 "cache_hit": cache_hit,
+                "quality": quality,
                 "request_id": getattr(g, "request_id", ""),
                 "date": date_str,
                 "valid": valid,
@@ -1268,14 +4091,33 @@ def api_generate():
         date_str = _normalize_request_date_or_raise(data.get("date", ""))
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
-    cfg = _sanitize_runtime_cfg({**_load_user_config(uid), **data.get("config", {})})
-    cfg = _normalize_cfg_paths(cfg)
+    cfg = _build_render_cfg(uid, data.get("config"))
     export_format = (data.get("export_format") or cfg.get("export_format") or "PNG").upper()
+    timings = _stage_timings()
     try:
-        img = draw_poster(content, date_str, title, cfg).convert("RGB")
-    except Exception:
-        _log_exception("api_generate.failed", user_id=uid, title=title, date=date_str, export_format=export_format)
-        return jsonify({"error": "生成失败，请检查图片素材和参数后重试"}), 500
+        fit_inputs, memory = _plan_render_memory(cfg, "generate")
+    except ValueError as e:
+        return _render_too_large_response(e)
+    clock = StageClock(timings)
+    with RENDER_ADMISSION.slot("generate") as admitted:
+        if not admitted:
+            return _render_busy_response()
+        clock.mark("queue")
+        try:
+            with _render_metrics("generate", cfg):
+                img = draw_poster(
+                    content,
+                    date_str,
+                    title,
+                    cfg,
+                    timings=timings,
+                    fit_inputs=fit_inputs,
+                    memory=memory if RENDER_MEMORY_TRACKING else None,
+                    quality="full",
+                ).convert("RGB")
+        except Exception:
+            _log_exception("api_generate.failed", user_id=uid, title=title, date=date_str, export_format=export_format)
+            return jsonify({"error": "生成失败，请检查图片素材和参数后重试"}), 500
 
     safe_title = _sanitize_filename(title)
     ext = {"PNG": ".png", "JPEG": ".jpg", "PDF": ".pdf"}.get(export_format, ".png")
@@ -1284,15 +4126,27 @@ def api_generate():
     user_output_dir = os.path.join(OUTPUT_DIR, uid)
     os.makedirs(user_output_dir, exist_ok=True)
     path = os.path.join(user_output_dir, filename)
+    clock.restart()
     if export_format == "JPEG":
         img.save(path, "JPEG", quality=int(cfg.get("jpeg_quality", 95)))
     elif export_format == "PDF":
         img.save(path, "PDF", resolution=100.0)
     else:
         img.save(path, "PNG")
+    clock.mark("encode")
     relpath = _public_path(path)
     _record_output_owner(relpath, uid)
-    _prune_old_outputs_for_user(uid)
+    clock.mark("index")
+    OUTPUT_RETENTION.ensure_started()
+    _log_event(
+        logging.INFO,
+        "api_generate.ok",
+        user_id=uid,
+        file=relpath,
+        export_format=export_format,
+        timings={name: round(ms, 1) for name, ms in timings.items()},
+        **_memory_log_fields(memory),
+    )
 
     copy_text = f"【{title}】\n{date_str}\n\n{content.strip()}\n\n{cfg.get('shop_name', '')}\n电话：{cfg.get('phone', '')}"
     return jsonify({"file": relpath, "name": filename, "copy_text": copy_text})
@@ -1339,11 +4193,64 @@ def api_config():
         data = _json_body()
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
-    cfg = _sanitize_runtime_cfg({**DEFAULT_CONFIG, **data})
-    save_config(_get_user_config_path(uid), cfg)
+    # Older clients still send templates/history inside the config; merge them into
+    # the template store so they are not lost, but keep them out of the config file.
+    template_fields = _extract_template_fields(data)
+    if template_fields:
+        TEMPLATE_STORE.merge(uid, template_fields)
+    cfg = _strip_template_fields(_sanitize_runtime_cfg({**DEFAULT_CONFIG, **data}))
+    _save_user_config(uid, cfg, defer=True)
     return jsonify({"ok": True, "config": cfg})
 
 
+def _template_name_or_raise(raw_name):
+    name = str(raw_name or "").strip()
+    if not name:
+        raise ValueError("模板名称不能为空")
+    if len(name) > MAX_TEMPLATE_NAME_CHARS:
+        raise ValueError(f"模板名称最多 {MAX_TEMPLATE_NAME_CHARS} 个字符")
+    if name in SYSTEM_TEMPLATES:
+        raise ValueError("不能覆盖系统模板")
+    return name
+
+
+@app.get("/api/templates")
+def api_templates():
+    uid = _ensure_user_id()
+    data = TEMPLATE_STORE.load(uid)
+    history = {key: data[key] for key in TEMPLATE_STORE_KEYS[1:]}
+    return jsonify({"templates": data["custom_templates"], "history": history})
+
+
+@app.put("/api/templates/<path:name>")
+def api_template_put(name):
+    uid = _ensure_user_id()
+    try:
+        data = _json_body()
+        tpl_name = _template_name_or_raise(name)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    content = data.get("content", "")
+    if not isinstance(content, str):
+        return jsonify({"error": "模板内容必须是文本"}), 400
+    if len(content) > MAX_TEMPLATE_CONTENT_CHARS:
+        return jsonify({"error": f"模板内容最多 {MAX_TEMPLATE_CONTENT_CHARS} 个字符"}), 400
+    try:
+        TEMPLATE_STORE.put_template(uid, tpl_name, content)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"ok": True, "name": tpl_name})
+
+
+@app.delete("/api/templates/<path:name>")
+def api_template_delete(name):
+    uid = _ensure_user_id()
+    tpl_name = str(name or "").strip()
+    if not TEMPLATE_STORE.delete_template(uid, tpl_name):
+        return jsonify({"error": "模板不存在"}), 404
+    return jsonify({"ok": True, "name": tpl_name})
+
+
 @app.post("/api/format")
 def api_format():
     try:
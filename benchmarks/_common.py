@@ -0,0 +1,112 @@
+﻿import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+# Shared helpers for the benchmark scripts: timing, result files and baseline comparison.
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_DIR, "benchmarks", "results")
+
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    k = (len(ordered) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def summarize_ms(samples):
+    ms = [s * 1000.0 for s in samples]
+    return {
+        "runs": len(ms),
+        "min_ms": round(min(ms), 3) if ms else 0.0,
+        "median_ms": round(statistics.median(ms), 3) if ms else 0.0,
+        "mean_ms": round(statistics.fmean(ms), 3) if ms else 0.0,
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "max_ms": round(max(ms), 3) if ms else 0.0,
+    }
+
+
+def time_call(fn, repeat, warmup=1):
+    for _ in range(max(0, warmup)):
+        fn()
+    samples = []
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def environment():
+    try:
+        import PIL
+
+        pillow = PIL.__version__
+    except Exception:
+        pillow = ""
+    return {
+        "python": platform.python_version(),
+        "pillow": pillow,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count() or 1,
+    }
+
+
+def write_results(kind, results, output_path=None, extra=None):
+    payload = {
+        "kind": kind,
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment(),
+        "results": results,
+    }
+    payload.update(extra or {})
+    if not output_path:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output_path = os.path.join(RESULTS_DIR, f"{kind}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    folder = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(folder, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    return output_path
+
+
+def compare_to_baseline(results, baseline_path, metric, threshold):
+    # Returns (rows, regressions); a case regresses when metric grows by more than threshold.
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f).get("results") or {}
+    rows = []
+    regressions = []
+    for name, current in results.items():
+        before = (baseline.get(name) or {}).get(metric)
+        now = current.get(metric)
+        if not before or now is None:
+            rows.append((name, before, now, None))
+            continue
+        ratio = now / before
+        rows.append((name, before, now, ratio))
+        if ratio > 1.0 + threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def print_comparison(rows, metric):
+    width = max([len(r[0]) for r in rows] + [4])
+    print(f"\n{'case'.ljust(width)}  {'baseline':>10}  {'current':>10}  {'change':>8}   ({metric})")
+    for name, before, now, ratio in rows:
+        before_s = f"{before:.1f}" if before else "-"
+        now_s = f"{now:.1f}" if now is not None else "-"
+        change = f"{(ratio - 1) * 100:+.1f}%" if ratio is not None else "new"
+        print(f"{name.ljust(width)}  {before_s:>10}  {now_s:>10}  {change:>8}")
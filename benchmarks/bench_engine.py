@@ -0,0 +1,209 @@
+﻿import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+from PIL import Image, ImageDraw, ImageFilter
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import _common  # noqa: E402,F401  (puts the repo root on sys.path)
+
+from poster_engine import (  # noqa: E402
+    CANVAS_SIZE,
+    FONT_CN_BOLD,
+    FONT_CN_REG,
+    RENDER_QUALITY_LEVELS,
+    FontManager,
+    _apply_watermark,
+    _calculate_layout_lines,
+    batch_adjust_content,
+    draw_poster,
+    gaussian_blur,
+)
+
+# Offline timing of poster_engine. The cases run as pytest tests
+# (benchmarks/test_bench_engine.py); this script is a shortcut for that run:
+#   python benchmarks/bench_engine.py                       # full matrix, writes benchmarks/results/engine_*.json
+#   python benchmarks/bench_engine.py --quick -k aurora     # subset
+#   python benchmarks/bench_engine.py --baseline old.json   # exit 1 if any case is >15% slower
+#   python -m pytest benchmarks -k aurora --bench-repeat 3  # the same through pytest
+
+CARD_STYLES = ["single", "ticket", "double", "block", "stack", "flip", "aurora", "paper_relief"]
+PRICE_TITLE = "调价通知"
+HOLIDAY_TITLE = "放假通知"
+DATE = "2026-10-18"
+PRICE_SHORT = "【工厂黄板】：1350 元/吨\n【花板】：1300 元/吨\n【书本纸】：1450 元/吨"
+HOLIDAY_SHORT = "尊敬的各位客户：\n本站国庆期间放假三天，10月4日正常收货。\n祝大家节日快乐！"
+
+
+def _long_price_content(lines=40):
+    names = ["工厂黄板", "统货黄板", "花板", "书本纸", "报纸", "白纸边", "杂纸", "纸管"]
+    rows = [f"【{names[i % len(names)]}{i // len(names) + 1}】：{1200 + i * 7} 元/吨" for i in range(lines - 2)]
+    return "\n".join(rows + ["温馨提示：", "水分超标按比例扣重，现金结算，假货勿扰，价格如有变动以现场为准。"])
+
+
+def _long_holiday_content(lines=40):
+    body = [f"第{i + 1}项：本站春节期间暂停收货，请各位客户合理安排送货时间，节后恢复正常营业。" for i in range(lines - 2)]
+    return "\n".join(["尊敬的各位客户："] + body + ["祝大家新年快乐，生意兴隆！"])
+
+
+class BenchAssets:
+    # Synthetic attachments so the suite needs nothing outside the repo. Each
+    # file is written on first use, so a run filtered with -k only pays for the
+    # ones it touches (the 4000x6000 JPEG alone takes seconds to encode).
+    def __init__(self):
+        self._folder = None
+        self._paths = {}
+
+    def path(self, name):
+        if name not in self._paths:
+            if self._folder is None:
+                self._folder = tempfile.mkdtemp(prefix="poster_bench_")
+            self._paths[name] = getattr(self, f"_make_{name}")(self._folder)
+        return self._paths[name]
+
+    def cleanup(self):
+        if self._folder:
+            shutil.rmtree(self._folder, ignore_errors=True)
+        self._folder = None
+        self._paths = {}
+
+    @staticmethod
+    def _make_stamp(folder):
+        stamp = Image.new("RGBA", (400, 400), (0, 0, 0, 0))
+        sd = ImageDraw.Draw(stamp)
+        sd.ellipse((10, 10, 390, 390), outline=(200, 30, 30, 255), width=16)
+        sd.text((120, 180), "STAMP", fill=(200, 30, 30, 255))
+        path = os.path.join(folder, "stamp.png")
+        stamp.save(path)
+        return path
+
+    @staticmethod
+    def _make_qr(folder):
+        qr = Image.new("RGB", (600, 600), "white")
+        qd = ImageDraw.Draw(qr)
+        for y in range(0, 600, 24):
+            for x in range(0, 600, 24):
+                if (x * 7 + y * 13) % 5 < 2:
+                    qd.rectangle((x, y, x + 23, y + 23), fill="black")
+        path = os.path.join(folder, "qr.png")
+        qr.save(path)
+        return path
+
+    @staticmethod
+    def _make_logo(folder):
+        logo = Image.new("RGBA", (512, 512), (0, 0, 0, 0))
+        ImageDraw.Draw(logo).ellipse((0, 0, 511, 511), fill=(40, 140, 90, 255))
+        path = os.path.join(folder, "logo.png")
+        logo.save(path)
+        return path
+
+    @staticmethod
+    def _make_bg_large(folder):
+        path = os.path.join(folder, "bg_large.jpg")
+        Image.effect_noise((4000, 6000), 60).convert("RGB").save(path, quality=90)
+        return path
+
+
+ATTACHMENT_KEYS = {"stamp": "stamp_image_path", "qr": "qrcode_image_path", "logo": "logo_image_path"}
+
+
+def build_cases(assets, quick=False):
+    cases = {}
+    styles = CARD_STYLES[:2] if quick else CARD_STYLES
+    for style in styles:
+        for mode, title, short, long_ in (
+            ("price", PRICE_TITLE, PRICE_SHORT, _long_price_content()),
+            ("holiday", HOLIDAY_TITLE, HOLIDAY_SHORT, _long_holiday_content()),
+        ):
+            for length, content in (("short", short), ("long40", long_)):
+                for wm in (False, True):
+                    name = f"draw/{style}/{mode}/{length}/{'wm' if wm else 'nowm'}"
+                    cfg = {"card_style": style, "watermark_enabled": wm, "watermark_text": "仅供内部参考"}
+                    cases[name] = (lambda c=content, t=title, cfg=cfg: draw_poster(c, DATE, t, cfg))
+        for quality in RENDER_QUALITY_LEVELS[1:]:
+            cfg = {"card_style": style}
+            cases[f"draw/{style}/quality/{quality}"] = (
+                lambda cfg=cfg, q=quality: draw_poster(PRICE_SHORT, DATE, PRICE_TITLE, cfg, quality=q)
+            )
+    for names in ((), ("stamp",), ("qr",), ("logo",), ("stamp", "qr", "logo")):
+        label = "+".join(names) or "none"
+        cases[f"draw/attachments/{label}"] = (
+            lambda names=names: draw_poster(
+                PRICE_SHORT,
+                DATE,
+                PRICE_TITLE,
+                {"card_style": "single", **{ATTACHMENT_KEYS[n]: assets.path(n) for n in names}},
+            )
+        )
+    for mode in ("custom", "preset"):
+        for blur in (0, 12):
+            cases[f"draw/bg_large_4000x6000/{mode}/blur{blur}"] = (
+                lambda mode=mode, blur=blur: draw_poster(
+                    PRICE_SHORT,
+                    DATE,
+                    PRICE_TITLE,
+                    {"bg_image_path": assets.path("bg_large"), "bg_mode": mode, "bg_blur_radius": blur},
+                )
+            )
+
+    get_font = lambda size, bold=False: FontManager.get(FONT_CN_BOLD if bold else FONT_CN_REG, size)
+    for mode, content, holiday in (
+        ("price", _long_price_content(), False),
+        ("holiday", _long_holiday_content(), True),
+    ):
+        lines = content.split("\n")
+        cases[f"layout/{mode}/long40"] = (
+            lambda lines=lines, holiday=holiday: _calculate_layout_lines(lines, 920, holiday, get_font, "festive")
+        )
+    noise = Image.effect_noise(CANVAS_SIZE, 60).convert("RGB")
+    for radius in (8, 24, 120):
+        cases[f"blur/exact/r{radius}"] = lambda r=radius: noise.filter(ImageFilter.GaussianBlur(r))
+        cases[f"blur/gaussian_blur/r{radius}"] = lambda r=radius: gaussian_blur(noise, r)
+    canvas = Image.new("RGBA", CANVAS_SIZE, (240, 240, 240, 255))
+    for density in (0.5, 1.0, 2.0):
+        cases[f"watermark/density{density}"] = (
+            lambda density=density: _apply_watermark(canvas, "仅供内部参考", 0.15, density)
+        )
+    long_price = _long_price_content()
+    cases["batch_adjust/long40"] = lambda: batch_adjust_content(long_price, 30)
+    cases["batch_adjust/long40x25"] = lambda: batch_adjust_content("\n".join([long_price] * 25), -20)
+    return cases
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="poster_engine 微基准")
+    parser.add_argument("--repeat", type=int, default=5, help="每个用例计时次数（默认 5）")
+    parser.add_argument("--warmup", type=int, default=1, help="计时前的预热次数（默认 1）")
+    parser.add_argument("-k", "--filter", default="", help="只运行匹配的用例（名称子串或 pytest -k 表达式）")
+    parser.add_argument("--quick", action="store_true", help="只跑前两种卡片样式")
+    parser.add_argument("--output", default="", help="结果 JSON 路径（默认 benchmarks/results/engine_<时间>.json）")
+    parser.add_argument("--baseline", default="", help="与之比较的历史结果 JSON")
+    parser.add_argument("--threshold", type=float, default=0.15, help="中位数变慢超过该比例视为退化（默认 0.15）")
+    args = parser.parse_args(argv)
+
+    import pytest
+
+    pytest_args = [
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_bench_engine.py"),
+        "-q",
+        "-p",
+        "no:cacheprovider",
+        f"--bench-repeat={args.repeat}",
+        f"--bench-warmup={args.warmup}",
+        f"--bench-threshold={args.threshold}",
+    ]
+    if args.filter:
+        pytest_args += ["-k", args.filter]
+    if args.quick:
+        pytest_args.append("--bench-quick")
+    if args.output:
+        pytest_args.append(f"--bench-output={args.output}")
+    if args.baseline:
+        pytest_args.append(f"--bench-baseline={args.baseline}")
+    return int(pytest.main(pytest_args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+﻿import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _common import compare_to_baseline, print_comparison, write_results  # noqa: E402
+
+# pytest plumbing for the engine benchmarks: options, the shared result table,
+# and the JSON file / baseline check once the session ends.
+
+BENCH_RESULTS = pytest.StashKey[dict]()
+BENCH_REPORT = pytest.StashKey[dict]()
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("poster-bench", "poster_engine 微基准")
+    group.addoption("--bench-repeat", type=int, default=5, help="每个用例计时次数（默认 5）")
+    group.addoption("--bench-warmup", type=int, default=1, help="计时前的预热次数（默认 1）")
+    group.addoption("--bench-quick", action="store_true", help="只跑前两种卡片样式")
+    group.addoption("--bench-output", default="", help="结果 JSON 路径（默认 benchmarks/results/engine_<时间>.json）")
+    group.addoption("--bench-baseline", default="", help="与之比较的历史结果 JSON")
+    group.addoption("--bench-threshold", type=float, default=0.15, help="中位数变慢超过该比例视为退化（默认 0.15）")
+
+
+def pytest_configure(config):
+    config.stash[BENCH_RESULTS] = {}
+    config.stash[BENCH_REPORT] = {"lines": [], "comparison": None, "regressions": []}
+
+
+@pytest.fixture
+def bench_results(request):
+    return request.config.stash[BENCH_RESULTS]
+
+
+def pytest_sessionfinish(session, exitstatus):
+    config = session.config
+    results = config.stash.get(BENCH_RESULTS, None)
+    if not results:
+        return
+    report = config.stash[BENCH_REPORT]
+    for name, row in results.items():
+        report["lines"].append(f"{name:<48} median {row['median_ms']:>9.1f} ms  min {row['min_ms']:>9.1f} ms")
+    extra = {"repeat": config.getoption("bench_repeat"), "warmup": config.getoption("bench_warmup")}
+    path = write_results("engine", results, config.getoption("bench_output"), extra)
+    report["lines"].append(f"\n结果已写入 {path}")
+    baseline = config.getoption("bench_baseline")
+    if baseline:
+        threshold = config.getoption("bench_threshold")
+        rows, regressions = compare_to_baseline(results, baseline, "median_ms", threshold)
+        report["comparison"] = rows
+        if regressions:
+            report["regressions"].append(
+                f"\n{len(regressions)} 个用例变慢超过 {threshold:.0%}：" + ", ".join(regressions)
+            )
+            session.exitstatus = pytest.ExitCode.TESTS_FAILED
+
+
+def pytest_terminal_summary(terminalreporter, exitstatus, config):
+    report = config.stash.get(BENCH_REPORT, None)
+    if not report or not report["lines"]:
+        return
+    terminalreporter.section("poster_engine 基准")
+    for line in report["lines"]:
+        terminalreporter.write_line(line)
+    if report["comparison"] is not None:
+        print_comparison(report["comparison"], "median_ms")
+    for line in report["regressions"]:
+        terminalreporter.write_line(line)
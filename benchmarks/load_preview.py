@@ -0,0 +1,318 @@
+﻿import argparse
+import http.cookiejar
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _common import REPO_DIR, compare_to_baseline, print_comparison, summarize_ms, write_results  # noqa: E402
+
+# Simulated editing sessions against the preview/generate flow. Usage:
+#   python benchmarks/load_preview.py --users 20 --edits 15                 # in-process (Flask test client)
+#   python benchmarks/load_preview.py --url http://127.0.0.1:5173 --users 50
+#   python benchmarks/load_preview.py --spawn-redis --users 20              # in-process with a throwaway redis-server
+# Each session: /api/init, a burst of /api/preview calls with small content edits
+# (some edits are undone, as people do), a /api/config save every few edits, then /api/generate.
+
+DATE = "2026-10-18"
+TITLE = "调价通知"
+BASE_ROWS = [("工厂黄板", 1350), ("统货黄板", 1300), ("花板", 1250), ("书本纸", 1450), ("报纸", 1600), ("白纸边", 2100)]
+
+
+class InProcessTransport:
+    def __init__(self, flask_app):
+        self._client = flask_app.test_client()
+
+    def request(self, method, path, body=None):
+        resp = self._client.open(path, method=method, json=body)
+        try:
+            payload = resp.get_json(silent=True)
+        finally:
+            resp.close()
+        return resp.status_code, payload, resp.headers
+
+
+class HttpTransport:
+    def __init__(self, base_url, timeout):
+        self._base = base_url.rstrip("/")
+        self._timeout = timeout
+        self._opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, method, path, body=None):
+        data = None if body is None else json.dumps(body).encode("utf-8")
+        req = urllib.request.Request(self._base + path, data=data, method=method)
+        if data is not None:
+            req.add_header("Content-Type", "application/json")
+        try:
+            with self._opener.open(req, timeout=self._timeout) as resp:
+                raw = resp.read()
+                status, headers = resp.status, resp.headers
+        except urllib.error.HTTPError as e:
+            raw, status, headers = e.read(), e.code, e.headers
+        try:
+            payload = json.loads(raw.decode("utf-8")) if raw else None
+        except ValueError:
+            payload = None
+        return status, payload, headers
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.statuses = {}
+        self.errors = {}
+        self.preview_hits = 0
+        self.preview_misses = 0
+        self.preview_quality = {}
+
+    def add(self, endpoint, seconds, status, payload):
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            bucket = self.statuses.setdefault(endpoint, {})
+            bucket[str(status)] = bucket.get(str(status), 0) + 1
+            if status >= 400 or status == 0:
+                message = str((payload or {}).get("error", "")) if isinstance(payload, dict) else ""
+                key = f"{endpoint} {status} {message}".strip()
+                self.errors[key] = self.errors.get(key, 0) + 1
+            if endpoint == "POST /api/preview" and status == 200 and isinstance(payload, dict):
+                if payload.get("cache_hit"):
+                    self.preview_hits += 1
+                else:
+                    self.preview_misses += 1
+                    quality = str(payload.get("quality") or "full")
+                    self.preview_quality[quality] = self.preview_quality.get(quality, 0) + 1
+
+
+def _content(prices):
+    return "\n".join(f"【{name}】：{price} 元/吨" for (name, _), price in zip(BASE_ROWS, prices))
+
+
+def _timed(transport, recorder, method, path, body=None):
+    endpoint = f"{method} {path}"
+    started = time.perf_counter()
+    try:
+        status, payload, _ = transport.request(method, path, body)
+    except Exception as e:
+        status, payload = 0, {"error": type(e).__name__}
+    recorder.add(endpoint, time.perf_counter() - started, status, payload)
+    return status, payload
+
+
+def run_session(transport, recorder, rng, args, user_no):
+    # Like static/app.js: every preview/generate carries the form config (the one
+    # /api/init returned, plus this user's edits) and every save sends all of it.
+    # An empty or partial config would reset the preset background and logo.
+    _, payload = _timed(transport, recorder, "GET", "/api/init")
+    config = dict((payload or {}).get("config") or {})
+    prices = [price for _, price in BASE_ROWS]
+    history = []
+    for edit in range(args.edits):
+        if history and rng.random() < args.undo_rate:
+            prices = history.pop()
+        else:
+            history.append(list(prices))
+            row = rng.randrange(len(prices))
+            prices[row] += rng.choice([-50, -30, -20, -10, 10, 20, 30, 50])
+        _timed(
+            transport,
+            recorder,
+            "POST",
+            "/api/preview",
+            {"content": _content(prices), "title": TITLE, "date": DATE, "config": config},
+        )
+        if args.config_every and (edit + 1) % args.config_every == 0:
+            config["shop_name"] = f"压测回收站{user_no}"
+            _timed(transport, recorder, "POST", "/api/config", config)
+        if args.think_ms:
+            time.sleep(rng.uniform(0.5, 1.5) * args.think_ms / 1000.0)
+    if not args.no_generate:
+        _timed(
+            transport,
+            recorder,
+            "POST",
+            "/api/generate",
+            {"content": _content(prices), "title": TITLE, "date": DATE, "config": config},
+        )
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _spawn_redis():
+    binary = shutil.which("redis-server")
+    if not binary:
+        raise SystemExit("--spawn-redis 需要 PATH 中有 redis-server")
+    port = _free_port()
+    proc = subprocess.Popen(
+        [binary, "--port", str(port), "--save", "", "--appendonly", "no", "--bind", "127.0.0.1"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc, f"redis://127.0.0.1:{port}/0"
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise SystemExit("redis-server 启动超时")
+
+
+def _load_app(args):
+    # The app reads its environment at import time, so everything is set first.
+    os.environ["POSTER_DATA_DIR"] = args.data_dir
+    os.environ.setdefault("POSTER_ADMIN_TOKEN", "load-test")
+    if args.redis_url:
+        os.environ["POSTER_REDIS_URL"] = args.redis_url
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    import logging
+
+    import app as appmod
+
+    logging.getLogger("poster_app").setLevel(logging.WARNING)
+    logging.getLogger("poster_engine").setLevel(logging.WARNING)
+    return appmod
+
+
+def _cache_stats(make_transport, token):
+    if not token:
+        return None
+    transport = make_transport()
+    if isinstance(transport, InProcessTransport):
+        resp = transport._client.get("/api/admin/cache/stats", headers={"X-Admin-Token": token})
+        return resp.get_json(silent=True) if resp.status_code == 200 else None
+    req = urllib.request.Request(transport._base + "/api/admin/cache/stats", headers={"X-Admin-Token": token})
+    try:
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="预览/生成链路压测")
+    parser.add_argument("--url", default="", help="压测已启动的服务；不填则在进程内用 Flask test client")
+    parser.add_argument("--users", type=int, default=20, help="并发模拟用户数（默认 20）")
+    parser.add_argument("--sessions", type=int, default=1, help="每个用户的编辑会话数（默认 1）")
+    parser.add_argument("--edits", type=int, default=15, help="每个会话的预览次数（默认 15）")
+    parser.add_argument("--undo-rate", type=float, default=0.2, help="撤回到上一版内容的概率（默认 0.2）")
+    parser.add_argument("--config-every", type=int, default=5, help="每隔几次编辑保存一次配置（0 为不保存）")
+    parser.add_argument("--think-ms", type=float, default=150, help="两次编辑之间的平均停顿（毫秒）")
+    parser.add_argument("--no-generate", action="store_true", help="会话结束时不调用 /api/generate")
+    parser.add_argument("--timeout", type=float, default=60, help="HTTP 模式单请求超时（秒）")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--data-dir", default="", help="进程内模式的数据目录（默认临时目录）")
+    parser.add_argument("--redis-url", default="", help="进程内模式使用的 Redis")
+    parser.add_argument("--spawn-redis", action="store_true", help="进程内模式启动一个临时 redis-server")
+    parser.add_argument("--admin-token", default="", help="用于读取 /api/admin/cache/stats（进程内模式自动设置）")
+    parser.add_argument("--output", default="", help="结果 JSON 路径（默认 benchmarks/results/load_<时间>.json）")
+    parser.add_argument("--baseline", default="", help="与之比较的历史结果 JSON（按 p95）")
+    parser.add_argument("--threshold", type=float, default=0.2, help="p95 变慢超过该比例视为退化（默认 0.2）")
+    args = parser.parse_args(argv)
+
+    redis_proc = None
+    temp_dir = None
+    if args.url:
+        make_transport = lambda: HttpTransport(args.url, args.timeout)
+        token = args.admin_token
+    else:
+        if args.spawn_redis:
+            redis_proc, args.redis_url = _spawn_redis()
+        if not args.data_dir:
+            temp_dir = tempfile.mkdtemp(prefix="poster_load_")
+            args.data_dir = temp_dir
+        appmod = _load_app(args)
+        make_transport = lambda: InProcessTransport(appmod.app)
+        token = args.admin_token or os.environ["POSTER_ADMIN_TOKEN"]
+
+    recorder = Recorder()
+    stats_before = _cache_stats(make_transport, token)
+
+    def worker(user_no):
+        rng = random.Random(args.seed * 1000 + user_no)
+        for _ in range(args.sessions):
+            # A fresh transport per session is a fresh cookie jar, i.e. a new guest.
+            run_session(make_transport(), recorder, rng, args, user_no)
+
+    try:
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(n,), daemon=True) for n in range(args.users)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+        stats_after = _cache_stats(make_transport, token)
+    finally:
+        if redis_proc is not None:
+            redis_proc.terminate()
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    results = {}
+    total = 0
+    print(f"{'endpoint':<22} {'count':>6} {'rps':>7} {'p50':>8} {'p95':>8} {'p99':>8}  status")
+    for endpoint, samples in sorted(recorder.latencies.items()):
+        row = summarize_ms(samples)
+        row["throughput_rps"] = round(len(samples) / elapsed, 2) if elapsed else 0.0
+        row["status"] = recorder.statuses.get(endpoint, {})
+        results[endpoint] = row
+        total += len(samples)
+        print(
+            f"{endpoint:<22} {len(samples):>6} {row['throughput_rps']:>7.1f} {row['p50_ms']:>8.1f} "
+            f"{row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f}  {row['status']}"
+        )
+    looked_up = recorder.preview_hits + recorder.preview_misses
+    hit_rate = round(recorder.preview_hits / looked_up, 4) if looked_up else 0.0
+    summary = {
+        "elapsed_seconds": round(elapsed, 3),
+        "requests": total,
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "preview_cache_hits": recorder.preview_hits,
+        "preview_cache_misses": recorder.preview_misses,
+        "preview_cache_hit_rate": hit_rate,
+        "preview_render_quality": recorder.preview_quality,
+        "errors": recorder.errors,
+    }
+    print(f"\n{total} 个请求 / {elapsed:.1f}s = {summary['throughput_rps']} req/s，预览缓存命中率 {hit_rate:.1%}")
+    if set(recorder.preview_quality) - {"full"}:
+        print(f"  预览降级渲染: {recorder.preview_quality}")
+    for key, count in sorted(recorder.errors.items()):
+        print(f"  错误 {count} × {key}")
+    params = {
+        k: getattr(args, k)
+        for k in ("url", "users", "sessions", "edits", "undo_rate", "config_every", "think_ms", "no_generate", "redis_url")
+    }
+    path = write_results(
+        "load",
+        results,
+        args.output,
+        {"params": params, "summary": summary, "cache_stats_before": stats_before, "cache_stats_after": stats_after},
+    )
+    print(f"结果已写入 {path}")
+    if args.baseline:
+        rows, regressions = compare_to_baseline(results, args.baseline, "p95_ms", args.threshold)
+        print_comparison(rows, "p95_ms")
+        if regressions:
+            print(f"\n{len(regressions)} 个接口 p95 变慢超过 {args.threshold:.0%}：" + ", ".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,32 @@
+﻿import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import poster_engine  # noqa: E402
+from _common import summarize_ms, time_call  # noqa: E402
+from bench_engine import BenchAssets, build_cases  # noqa: E402
+
+# One test per bench_engine case; run with `python -m pytest benchmarks` (see
+# conftest.py for the --bench-* options). Timings land in benchmarks/results/.
+
+ASSETS = BenchAssets()
+
+
+def pytest_generate_tests(metafunc):
+    if "case_name" in metafunc.fixturenames:
+        quick = metafunc.config.getoption("bench_quick")
+        metafunc.parametrize("case_name", list(build_cases(ASSETS, quick=quick)))
+
+
+@pytest.fixture(scope="module")
+def cases(request):
+    poster_engine.LOGGER.disabled = True
+    yield build_cases(ASSETS, quick=request.config.getoption("bench_quick"))
+    ASSETS.cleanup()
+
+
+def test_engine_case(case_name, cases, bench_results, pytestconfig):
+    samples = time_call(cases[case_name], pytestconfig.getoption("bench_repeat"), pytestconfig.getoption("bench_warmup"))
+    bench_results[case_name] = summarize_ms(samples)
@@ -8,6 +8,8 @@ import re
 import shutil
 import tempfile
 import threading
+import time
+from collections import OrderedDict
 from copy import deepcopy
 
 from PIL import Image, ImageChops, ImageDraw, ImageEnhance, ImageFilter, ImageFont, ImageOps
@@ -199,6 +201,56 @@ def _antialias_image(img, factor=3):
     return up.resize((w, h), Image.Resampling.LANCZOS)
 
 
+# Blurs whose radius is still >= BLUR_MIN_SCALED_RADIUS after shrinking run on
+# a 2x/4x/8x reduced copy. Against the exact GaussianBlur, per channel: photos,
+# gradients and shadows within 4/255 (mean < 0.3); worst case (pixel noise,
+# 1px line patterns) within 10/255 (mean < 1.5). tests/test_blur.py checks both.
+BLUR_MIN_SCALED_RADIUS = 6.0
+BLUR_MAX_DOWNSCALE = 8
+
+
+def gaussian_blur(img, radius, min_scaled_radius=BLUR_MIN_SCALED_RADIUS):
+    blurred = _reduced_blur(img, radius, min_scaled_radius)
+    if blurred.size == img.size:
+        return blurred
+    return blurred.resize(img.size, Image.Resampling.BILINEAR)
+
+
+def _reduced_blur(img, radius, min_scaled_radius):
+    # The blurred image at the reduced size gaussian_blur works at (the input
+    # size when no reduction applies); scale it back up to use it.
+    factor = 1
+    while (
+        factor < BLUR_MAX_DOWNSCALE
+        and radius / (factor * 2) >= min_scaled_radius
+        and min(img.size) >= factor * 2 * 8
+    ):
+        factor *= 2
+    if factor == 1:
+        return img.filter(ImageFilter.GaussianBlur(radius))
+    w, h = img.size
+    small = img.reduce(factor)
+    sw, sh = small.size
+    # GaussianBlur clamps at the border, extending the outermost row/column. Pad
+    # the reduced copy with the true edge pixels so the clamp extends the same
+    # values the full-size blur would, rather than a block average.
+    padded = Image.new(img.mode, (sw + 2, sh + 2))
+    padded.paste(small, (1, 1))
+    padded.paste(img.crop((0, 0, w, 1)).resize((sw, 1), Image.Resampling.BOX), (1, 0))
+    padded.paste(img.crop((0, h - 1, w, h)).resize((sw, 1), Image.Resampling.BOX), (1, sh + 1))
+    padded.paste(img.crop((0, 0, 1, h)).resize((1, sh), Image.Resampling.BOX), (0, 1))
+    padded.paste(img.crop((w - 1, 0, w, h)).resize((1, sh), Image.Resampling.BOX), (sw + 1, 1))
+    corners = (
+        ((0, 0), (0, 0)),
+        ((w - 1, 0), (sw + 1, 0)),
+        ((0, h - 1), (0, sh + 1)),
+        ((w - 1, h - 1), (sw + 1, sh + 1)),
+    )
+    for src, dst in corners:
+        padded.putpixel(dst, img.getpixel(src))
+    return padded.filter(ImageFilter.GaussianBlur(radius / factor)).crop((1, 1, sw + 1, sh + 1))
+
+
 def _aa_circle_mask(size, factor=4):
     s = max(2, int(size))
     f = max(2, int(factor))
@@ -285,7 +337,7 @@ class PresetGenerator:
             rx = x + random.randint(-50, 50)
             ry = y + random.randint(-50, 50)
             draw.ellipse((rx - r, ry - r, rx + r, ry + r), fill=color)
-        return img.filter(ImageFilter.GaussianBlur(radius=120))
+        return gaussian_blur(img, 120)
 
     @staticmethod
     def gen_luxury_red():
@@ -317,7 +369,7 @@ class PresetGenerator:
     def gen_frosted_grey():
         w, h = CANVAS_SIZE
         img = Image.new("RGB", (w, h), "#F2F2F2")
-        return PresetGenerator._add_noise(img.filter(ImageFilter.GaussianBlur(40)), 0.08)
+        return PresetGenerator._add_noise(gaussian_blur(img, 40), 0.08)
 
     @staticmethod
     def gen_kraft_pro():
@@ -346,7 +398,7 @@ class PresetGenerator:
             y1 = y0 + random.randint(240, 520)
             col = random.choice([(96, 255, 226, 54), (35, 203, 255, 52), (132, 255, 186, 42)])
             ad.ellipse((x0, y0, x1, y1), outline=col, width=random.randint(6, 12))
-        aurora = aurora.filter(ImageFilter.GaussianBlur(22))
+        aurora = gaussian_blur(aurora, 22)
         img = Image.alpha_composite(base.convert("RGBA"), aurora).convert("RGB")
         return PresetGenerator._add_noise(img, 0.04)
 
@@ -370,7 +422,7 @@ class PresetGenerator:
                 [(20, 255, 255, 90), (255, 80, 180, 86), (70, 130, 255, 86), (255, 190, 70, 68)]
             )
             gd.line([(x1, y), (x2, y + random.randint(-50, 50))], fill=color, width=random.randint(3, 7))
-        glow = glow.filter(ImageFilter.GaussianBlur(14))
+        glow = gaussian_blur(glow, 14)
         img = Image.alpha_composite(base.convert("RGBA"), glow).convert("RGB")
         return PresetGenerator._add_noise(img, 0.045)
 
@@ -404,10 +456,10 @@ class PresetGenerator:
             rr = random.randint(70, 260)
             alpha = random.randint(10, 30)
             sd.ellipse((rx - rr, ry - rr, rx + rr, ry + rr), fill=(95, 75, 48, alpha))
-        stain = stain.filter(ImageFilter.GaussianBlur(22))
+        stain = gaussian_blur(stain, 22)
         img = Image.alpha_composite(img.convert("RGBA"), stain).convert("RGB")
         # Add subtle directional emboss for tactile paper feel.
-        relief = Image.effect_noise((w, h), 18).convert("L").filter(ImageFilter.GaussianBlur(1.2))
+        relief = gaussian_blur(Image.effect_noise((w, h), 18).convert("L"), 1.2)
         hi = Image.merge("RGBA", (relief, relief, relief, Image.new("L", (w, h), 16)))
         lo = Image.merge("RGBA", (ImageOps.invert(relief), ImageOps.invert(relief), ImageOps.invert(relief), Image.new("L", (w, h), 12)))
         rel = Image.new("RGBA", (w, h), (0, 0, 0, 0))
@@ -450,7 +502,7 @@ class PresetGenerator:
             y2 = int(y + math.sin(ang) * ln)
             cd.line([(x, y), (x2, y2)], fill=(248, 236, 210, random.randint(14, 24)), width=1)
             cd.line([(x + 1, y + 1), (x2 + 1, y2 + 1)], fill=(78, 56, 34, random.randint(12, 20)), width=1)
-        crease = crease.filter(ImageFilter.GaussianBlur(1.8))
+        crease = gaussian_blur(crease, 1.8)
 
         coarse = Image.effect_noise((w // 2, h // 2), 62).resize((w, h), Image.Resampling.BICUBIC).convert("L")
         fine = Image.effect_noise((w, h), 28).convert("L")
@@ -461,7 +513,7 @@ class PresetGenerator:
         vignette = Image.new("L", (w, h), 0)
         vd = ImageDraw.Draw(vignette)
         vd.ellipse((-w // 6, -h // 6, w + w // 6, h + h // 6), fill=180)
-        vignette = ImageOps.invert(vignette).filter(ImageFilter.GaussianBlur(120))
+        vignette = gaussian_blur(ImageOps.invert(vignette), 120)
         shade = Image.merge("RGBA", (Image.new("L", (w, h), 58), Image.new("L", (w, h), 44), Image.new("L", (w, h), 28), vignette))
         img = Image.alpha_composite(img.convert("RGBA"), shade).convert("RGB")
         return PresetGenerator._add_noise(img, 0.05)
@@ -737,16 +789,125 @@ def batch_adjust_content(content, amount):
     return "\n".join(adjust_line(line) for line in lines).strip()
 
 
-def _load_image(path):
+# Largest on-canvas size of each input; fit_inputs decodes them no larger than this.
+INPUT_FIT_BOXES = {
+    "bg_image_path": ("cover", CANVAS_SIZE),
+    "logo_image_path": ("contain", (880, 880)),
+    "qrcode_image_path": ("contain", (260, 260)),
+    "stamp_image_path": ("contain", (260, 260)),
+}
+# Full-canvas RGBA layers alive at once while a card style composites (estimate).
+STYLE_CANVAS_LAYERS = {"single": 3, "block": 3, "ticket": 5, "stack": 5, "paper_relief": 5, "double": 6, "flip": 6, "aurora": 8}
+
+
+def _fit_scale(size, fit):
+    mode, (tw, th) = fit
+    bw, bh = size
+    scale = max(tw / bw, th / bh) if mode == "cover" else min(tw / bw, th / bh)
+    if scale >= 1:
+        return 1.0, size
+    return scale, (max(1, math.ceil(bw * scale)), max(1, math.ceil(bh * scale)))
+
+
+def _reduce_for_fit(img, fit):
+    scale, target = _fit_scale(img.size, fit)
+    if scale >= 1:
+        return img
+    # JPEG can decode straight at 1/2..1/8 scale; other formats decode fully first.
+    img.draft("RGB" if img.mode not in {"L", "CMYK"} else img.mode, target)
+    if img.mode not in {"RGB", "RGBA", "L"}:
+        img = img.convert("RGBA")
+    if img.size != target:
+        img = img.resize(target, Image.Resampling.LANCZOS)
+    return img
+
+
+def _load_image(path, fit=None):
     if path and os.path.exists(path):
         try:
-            return Image.open(path).convert("RGBA")
+            img = Image.open(path)
+            if fit:
+                img = _reduce_for_fit(img, fit)
+            return img.convert("RGBA")
         except Exception:
             LOGGER.exception("load_image.failed | %s", json.dumps({"path": path}, ensure_ascii=False, default=str))
             return None
     return None
 
 
+def _image_header(path):
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with Image.open(path) as img:
+            return img.size, img.mode, img.format
+    except Exception:
+        return None
+
+
+def estimate_render_memory(cfg, fit_inputs=False):
+    # Rough estimate of the bytes draw_poster holds at its peak, from image
+    # headers only (nothing is decoded).
+    cfg = {**DEFAULT_CONFIG, **(cfg or {})}
+    w, h = CANVAS_SIZE
+    canvas = w * h * 4
+    style = cfg.get("card_style", "single")
+    layers = STYLE_CANVAS_LAYERS.get(style, 3)
+    if cfg.get("watermark_enabled") and cfg.get("watermark_text"):
+        layers = max(layers, 4)
+    inputs = {}
+    load_peak = 0
+    held = 0
+    largest = canvas
+    for key, fit in INPUT_FIT_BOXES.items():
+        header = _image_header(cfg.get(key))
+        if header is None:
+            continue
+        (iw, ih), mode, fmt = header
+        try:
+            bands = 4 if mode in {"I", "F"} else Image.getmodebands(mode)
+        except Exception:
+            bands = 4
+        decode_w, decode_h = iw, ih
+        out_w, out_h = iw, ih
+        if fit_inputs:
+            scale, (out_w, out_h) = _fit_scale((iw, ih), fit)
+            if fmt == "JPEG" and scale < 1:
+                reduce = 1
+                while reduce < 8 and iw // (reduce * 2) >= out_w and ih // (reduce * 2) >= out_h:
+                    reduce *= 2
+                decode_w, decode_h = math.ceil(iw / reduce), math.ceil(ih / reduce)
+        decoded = decode_w * decode_h * bands
+        rgba = out_w * out_h * 4
+        # The decoded original and its RGBA copy are alive together while loading.
+        step = decoded + rgba
+        if key == "bg_image_path":
+            # Plus the copy resized to cover the canvas.
+            ratio = max(w / out_w, h / out_h)
+            step += max(canvas, int(out_w * ratio) * int(out_h * ratio) * 4)
+        else:
+            held += rgba
+        load_peak = max(load_peak, step)
+        largest = max(largest, decoded, rgba)
+        inputs[key] = {"width": iw, "height": ih, "decoded_bytes": decoded, "rgba_bytes": rgba}
+    peak = max(load_peak, layers * canvas) + held
+    return {
+        "estimated_peak_bytes": int(peak),
+        "largest_image_bytes": int(largest),
+        "canvas_layers": layers,
+        "fit_inputs": bool(fit_inputs),
+        "inputs": inputs,
+    }
+
+
+def _current_rss_bytes():
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError, IndexError):
+        return None
+
+
 def _apply_watermark(img, text, opacity=0.15, density=1.0):
     w, h = img.size
     layer = Image.new("RGBA", (w, h), (0, 0, 0, 0))
@@ -907,7 +1068,132 @@ def _calculate_layout_lines(lines, cw, is_holiday_mode, get_font, holiday_varian
     return layout, total_height
 
 
-def draw_poster(content, date_str, title, cfg):
+# Render quality tiers. "full" is the reference output and what downloads get;
+# the lower tiers let gaussian_blur shrink more aggressively, reuse cached shadow
+# patches and ("fast") drop the hairline overlay blurs and the aurora edge glow.
+RENDER_QUALITY_TIERS = {
+    "full": {"blur_min_radius": BLUR_MIN_SCALED_RADIUS, "fine_blur": True, "edge_glow": True, "shadow_cache": False},
+    "balanced": {"blur_min_radius": 3.0, "fine_blur": True, "edge_glow": True, "shadow_cache": True},
+    "fast": {"blur_min_radius": 2.0, "fine_blur": False, "edge_glow": False, "shadow_cache": True},
+}
+RENDER_QUALITY_LEVELS = ("full", "balanced", "fast")
+FINE_BLUR_MAX_RADIUS = 2.0
+# Cached shadows are kept at the reduced size they were blurred at (a 1/4-1/8
+# scale patch is well under 1 MiB), and the cache is capped by bytes.
+SHADOW_CACHE_MAX_BYTES = 8 * 1024 * 1024
+
+
+def _tier_blur(img, radius, tier):
+    if radius <= FINE_BLUR_MAX_RADIUS and not tier["fine_blur"]:
+        return img
+    return gaussian_blur(img, radius, tier["blur_min_radius"])
+
+
+class ShadowCache:
+    # Blurred drop-shadow patches keyed by their geometry relative to the
+    # patch origin, so a card that only moved reuses the same patch.
+    _cache = OrderedDict()
+    _bytes = 0
+    _lock = threading.Lock()
+
+    @staticmethod
+    def patch(rects, blur, min_radius):
+        left = min(box[0] for box, _, _ in rects)
+        top = min(box[1] for box, _, _ in rects)
+        pad = int(math.ceil(blur * 3))
+        ox, oy = left - pad, top - pad
+        local = tuple(
+            ((box[0] - ox, box[1] - oy, box[2] - ox, box[3] - oy), radius, fill) for box, radius, fill in rects
+        )
+        key = (local, blur, min_radius)
+        pw = max(box[2] for box, _, _ in local) + pad
+        ph = max(box[3] for box, _, _ in local) + pad
+        with ShadowCache._lock:
+            small = ShadowCache._cache.get(key)
+            if small is not None:
+                ShadowCache._cache.move_to_end(key)
+        if small is None:
+            layer = Image.new("RGBA", (pw, ph), (0, 0, 0, 0))
+            ld = ImageDraw.Draw(layer)
+            for box, radius, fill in local:
+                ld.rounded_rectangle([(box[0], box[1]), (box[2], box[3])], radius=radius, fill=fill)
+            small = _reduced_blur(layer, blur, min_radius)
+            ShadowCache._store(key, small)
+        if small.size != (pw, ph):
+            return small.resize((pw, ph), Image.Resampling.BILINEAR), (ox, oy)
+        return small, (ox, oy)
+
+    @staticmethod
+    def _store(key, small):
+        size = small.width * small.height * len(small.getbands())
+        if size > SHADOW_CACHE_MAX_BYTES:
+            return
+        with ShadowCache._lock:
+            old = ShadowCache._cache.pop(key, None)
+            if old is not None:
+                ShadowCache._bytes -= old.width * old.height * len(old.getbands())
+            ShadowCache._cache[key] = small
+            ShadowCache._bytes += size
+            while ShadowCache._bytes > SHADOW_CACHE_MAX_BYTES:
+                _, evicted = ShadowCache._cache.popitem(last=False)
+                ShadowCache._bytes -= evicted.width * evicted.height * len(evicted.getbands())
+
+    @staticmethod
+    def stats():
+        with ShadowCache._lock:
+            return {"entries": len(ShadowCache._cache), "bytes": ShadowCache._bytes, "max_bytes": SHADOW_CACHE_MAX_BYTES}
+
+
+def _composite_shadow(img, rects, blur, tier):
+    # rects: ((x0, y0, x1, y1), radius, fill) drawn as one layer, then blurred.
+    if not tier["shadow_cache"]:
+        shadow = Image.new("RGBA", img.size, (0, 0, 0, 0))
+        sd = ImageDraw.Draw(shadow)
+        for box, radius, fill in rects:
+            sd.rounded_rectangle([(box[0], box[1]), (box[2], box[3])], radius=radius, fill=fill)
+        return Image.alpha_composite(img, _tier_blur(shadow, blur, tier))
+    layer, (ox, oy) = ShadowCache.patch(rects, blur, tier["blur_min_radius"])
+    # alpha_composite needs a non-negative destination inside the canvas.
+    crop = (max(0, -ox), max(0, -oy), min(layer.width, img.width - ox), min(layer.height, img.height - oy))
+    if crop[2] > crop[0] and crop[3] > crop[1]:
+        img.alpha_composite(layer.crop(crop), (ox + crop[0], oy + crop[1]))
+    return img
+
+
+class StageClock:
+    # Lap timer: mark(stage) adds the milliseconds since the previous mark to
+    # timings[stage]. With timings=None every call is a no-op. When a memory dict
+    # is given, process RSS is also sampled at every mark (Linux only).
+    def __init__(self, timings=None, memory=None):
+        self.timings = timings
+        self.memory = memory
+        self._last = time.perf_counter()
+        if memory is not None:
+            rss = _current_rss_bytes()
+            if rss is not None:
+                memory.setdefault("rss_start_bytes", rss)
+                memory["rss_peak_bytes"] = max(memory.get("rss_peak_bytes", 0), rss)
+
+    def restart(self):
+        self._last = time.perf_counter()
+
+    def mark(self, stage):
+        if self.memory is not None and "rss_start_bytes" in self.memory:
+            rss = _current_rss_bytes() or 0
+            if rss > self.memory["rss_peak_bytes"]:
+                self.memory["rss_peak_bytes"] = rss
+                self.memory["rss_peak_stage"] = stage
+        if self.timings is None:
+            return
+        now = time.perf_counter()
+        self.timings[stage] = self.timings.get(stage, 0.0) + (now - self._last) * 1000.0
+        self._last = now
+
+
+def draw_poster(content, date_str, title, cfg, timings=None, fit_inputs=False, memory=None, quality="full"):
+    clock = StageClock(timings, memory)
+    tier = RENDER_QUALITY_TIERS.get(quality) or RENDER_QUALITY_TIERS["full"]
+    fit = INPUT_FIT_BOXES if fit_inputs else {}
     cfg = {**DEFAULT_CONFIG, **(cfg or {})}
     content = normalize_content_for_render(content or "")
     w, h = CANVAS_SIZE
@@ -918,7 +1204,7 @@ def draw_poster(content, date_str, title, cfg):
 
     base = None
     if cfg.get("bg_image_path"):
-        loaded_bg = _load_image(cfg.get("bg_image_path"))
+        loaded_bg = _load_image(cfg.get("bg_image_path"), fit.get("bg_image_path"))
         if loaded_bg:
             if cfg.get("bg_mode") == "preset":
                 base = loaded_bg.resize((w, h), Image.Resampling.LANCZOS)
@@ -932,9 +1218,10 @@ def draw_poster(content, date_str, title, cfg):
         base = Image.new("RGB", (w, h), "#E0E0E0")
     blur_radius = max(0.0, float(cfg.get("bg_blur_radius", 0)))
     if blur_radius > 0:
-        base = base.filter(ImageFilter.GaussianBlur(blur_radius))
+        base = _tier_blur(base, blur_radius, tier)
     base = ImageEnhance.Brightness(base).enhance(float(cfg.get("bg_brightness", 1.0)))
     img = base.convert("RGBA")
+    clock.mark("background")
 
     get_font = lambda size, bold=False: FontManager.get(FONT_CN_BOLD if bold else FONT_CN_REG, size)
     get_med_font = lambda size: FontManager.get(FONT_CN_MED, size)
@@ -950,6 +1237,7 @@ def draw_poster(content, date_str, title, cfg):
     if holiday_text_style not in {"official", "festive"}:
         holiday_text_style = "festive"
     layout_items, sim_y = _calculate_layout_lines(lines, cw, is_holiday_mode, get_font, holiday_text_style)
+    clock.mark("layout")
 
 
     ch = min(1800, max(900, 500 + sim_y - 10 + 460))
@@ -965,10 +1253,7 @@ def draw_poster(content, date_str, title, cfg):
     dc = ImageDraw.Draw(card)
     is_dark_style = False
     if style == "ticket":
-        shadow = Image.new("RGBA", (w, h), (0, 0, 0, 0))
-        sd = ImageDraw.Draw(shadow)
-        sd.rounded_rectangle([(cx + 10, cy + 14), (cx + cw + 10, cy + ch + 14)], radius=30, fill=(0, 0, 0, 66))
-        img = Image.alpha_composite(img, shadow.filter(ImageFilter.GaussianBlur(14)))
+        img = _composite_shadow(img, [((cx + 10, cy + 14, cx + cw + 10, cy + ch + 14), 30, (0, 0, 0, 66))], 14, tier)
 
         dc.rounded_rectangle(
             [(cx, cy), (cx + cw, cy + ch)],
@@ -1007,19 +1292,15 @@ def draw_poster(content, date_str, title, cfg):
     elif style == "double":
         back_dx, back_dy = 30, 34
         back_alpha = min(255, int(alpha * 0.9) + 28)
-        shadow = Image.new("RGBA", (w, h), (0, 0, 0, 0))
-        sd = ImageDraw.Draw(shadow)
-        sd.rounded_rectangle(
-            [(cx + back_dx + 8, cy + back_dy + 10), (cx + cw + back_dx + 8, cy + ch + back_dy + 10)],
-            radius=42,
-            fill=(0, 0, 0, 76),
-        )
-        sd.rounded_rectangle(
-            [(cx + 10, cy + 12), (cx + cw + 10, cy + ch + 12)],
-            radius=40,
-            fill=(0, 0, 0, 58),
+        img = _composite_shadow(
+            img,
+            [
+                ((cx + back_dx + 8, cy + back_dy + 10, cx + cw + back_dx + 8, cy + ch + back_dy + 10), 42, (0, 0, 0, 76)),
+                ((cx + 10, cy + 12, cx + cw + 10, cy + ch + 12), 40, (0, 0, 0, 58)),
+            ],
+            24,
+            tier,
         )
-        img = Image.alpha_composite(img, shadow.filter(ImageFilter.GaussianBlur(24)))
 
         dc.rounded_rectangle(
             [(cx + back_dx, cy + back_dy), (cx + cw + back_dx, cy + ch + back_dy)],
@@ -1057,7 +1338,7 @@ def draw_poster(content, date_str, title, cfg):
                 fill=(132, 140, 154, a),
                 width=2,
             )
-        flip_overlay = double_overlay.filter(ImageFilter.GaussianBlur(0.8))
+        flip_overlay = _tier_blur(double_overlay, 0.8, tier)
     elif style == "block":
         for i in range(12, 0, -1):
             ImageDraw.Draw(card).rounded_rectangle([(cx + i, cy + i), (cx + cw + i, cy + ch + i)], radius=40, fill=(230, 230, 230, alpha))
@@ -1067,19 +1348,15 @@ def draw_poster(content, date_str, title, cfg):
         back_angle = -2.8
         back_alpha = min(255, int(alpha * 0.9) + 24)
 
-        shadow = Image.new("RGBA", (w, h), (0, 0, 0, 0))
-        sd = ImageDraw.Draw(shadow)
-        sd.rounded_rectangle(
-            [(cx + back_dx + 18, cy + back_dy + 16), (cx + cw + back_dx + 18, cy + ch + back_dy + 16)],
-            radius=40,
-            fill=(0, 0, 0, 78),
-        )
-        sd.rounded_rectangle(
-            [(cx + 12, cy + 14), (cx + cw + 12, cy + ch + 14)],
-            radius=40,
-            fill=(0, 0, 0, 56),
+        img = _composite_shadow(
+            img,
+            [
+                ((cx + back_dx + 18, cy + back_dy + 16, cx + cw + back_dx + 18, cy + ch + back_dy + 16), 40, (0, 0, 0, 78)),
+                ((cx + 12, cy + 14, cx + cw + 12, cy + ch + 14), 40, (0, 0, 0, 56)),
+            ],
+            20,
+            tier,
         )
-        img = Image.alpha_composite(img, shadow.filter(ImageFilter.GaussianBlur(20)))
 
         pad = 88
         back_sheet = Image.new("RGBA", (cw + pad * 2, ch + pad * 2), (0, 0, 0, 0))
@@ -1125,11 +1402,9 @@ def draw_poster(content, date_str, title, cfg):
                 fill=(126, 136, 152, a),
                 width=2,
             )
-        flip_overlay = stack_overlay.filter(ImageFilter.GaussianBlur(0.8))
+        flip_overlay = _tier_blur(stack_overlay, 0.8, tier)
     elif style == "flip":
-        shadow = Image.new("RGBA", (w, h), (0, 0, 0, 0))
-        ImageDraw.Draw(shadow).rounded_rectangle([(cx + 14, cy + 18), (cx + cw + 14, cy + ch + 18)], radius=42, fill=(0, 0, 0, 55))
-        img = Image.alpha_composite(img, shadow.filter(ImageFilter.GaussianBlur(16)))
+        img = _composite_shadow(img, [((cx + 14, cy + 18, cx + cw + 14, cy + ch + 18), 42, (0, 0, 0, 55))], 16, tier)
         dc.rounded_rectangle([(cx, cy), (cx + cw, cy + ch)], radius=40, fill=(255, 255, 255, alpha))
         fs = 216
         dc.polygon([(cx + cw, cy + ch), (cx + cw, cy + ch - fs), (cx + cw - fs, cy + ch)], fill=(0, 0, 0, 0))
@@ -1191,18 +1466,17 @@ def draw_poster(content, date_str, title, cfg):
 
         aa_tile = hi.resize((tile_w, tile_h), Image.Resampling.LANCZOS)
         fold.alpha_composite(aa_tile, (tile_left, tile_top))
-        flip_overlay = fold.filter(ImageFilter.GaussianBlur(0.6))
+        flip_overlay = _tier_blur(fold, 0.6, tier)
     elif style == "aurora":
-        shadow = Image.new("RGBA", (w, h), (0, 0, 0, 0))
-        sd = ImageDraw.Draw(shadow)
-        sd.rounded_rectangle([(cx + 14, cy + 20), (cx + cw + 14, cy + ch + 20)], radius=44, fill=(10, 16, 28, 62))
-        img = Image.alpha_composite(img, shadow.filter(ImageFilter.GaussianBlur(14)))
+        img = _composite_shadow(img, [((cx + 14, cy + 20, cx + cw + 14, cy + ch + 20), 44, (10, 16, 28, 62))], 14, tier)
 
         # 先对卡片区域做背景模糊，强化玻璃磨砂感
         frost_mask = Image.new("L", (w, h), 0)
         ImageDraw.Draw(frost_mask).rounded_rectangle([(cx, cy), (cx + cw, cy + ch)], radius=42, fill=255)
-        blurred_bg = img.filter(ImageFilter.GaussianBlur(24))
-        frost_layer = Image.composite(blurred_bg, Image.new("RGBA", (w, h), (0, 0, 0, 0)), frost_mask)
+        # 只有卡片区域透过蒙版可见，只模糊卡片及模糊半径覆盖的范围
+        frost_box = (max(0, cx - 72), max(0, cy - 72), min(w, cx + cw + 72), min(h, cy + ch + 72))
+        frost_layer = Image.new("RGBA", (w, h), (0, 0, 0, 0))
+        frost_layer.paste(_tier_blur(img.crop(frost_box), 24, tier), frost_box[:2], frost_mask.crop(frost_box))
         img = Image.alpha_composite(img, frost_layer)
 
         # 玻璃基底：半透明，避免看起来像实体白卡
@@ -1225,7 +1499,7 @@ def draw_poster(content, date_str, title, cfg):
                 outline=col,
                 width=1,
             )
-        img = Image.alpha_composite(img, tint.filter(ImageFilter.GaussianBlur(0.8)))
+        img = Image.alpha_composite(img, _tier_blur(tint, 0.8, tier))
 
         glass = Image.new("RGBA", (w, h), (0, 0, 0, 0))
         gd = ImageDraw.Draw(glass)
@@ -1249,26 +1523,22 @@ def draw_poster(content, date_str, title, cfg):
             a = int(58 * (1 - t))
             inset = 26 + int(8 * t)
             gd.line([(cx + inset, cy + 18 + i), (cx + cw - inset, cy + 18 + i)], fill=(249, 252, 255, a), width=1)
-        # 外缘再叠一层柔光，提升“边缘模糊”观感
-        edge_glow = Image.new("RGBA", (w, h), (0, 0, 0, 0))
-        eg = ImageDraw.Draw(edge_glow)
-        for i in range(12):
-            a = int(18 * (1 - i / 12))
-            eg.rounded_rectangle(
-                [(cx - 6 - i, cy - 6 - i), (cx + cw + 6 + i, cy + ch + 6 + i)],
-                radius=46 + i,
-                outline=(edge_rgb[0], edge_rgb[1], edge_rgb[2], a),
-                width=1,
-            )
-        flip_overlay = Image.alpha_composite(
-            glass.filter(ImageFilter.GaussianBlur(1.6)),
-            edge_glow.filter(ImageFilter.GaussianBlur(1.8)),
-        )
+        flip_overlay = _tier_blur(glass, 1.6, tier)
+        if tier["edge_glow"]:
+            # 外缘再叠一层柔光，提升“边缘模糊”观感
+            edge_glow = Image.new("RGBA", (w, h), (0, 0, 0, 0))
+            eg = ImageDraw.Draw(edge_glow)
+            for i in range(12):
+                a = int(18 * (1 - i / 12))
+                eg.rounded_rectangle(
+                    [(cx - 6 - i, cy - 6 - i), (cx + cw + 6 + i, cy + ch + 6 + i)],
+                    radius=46 + i,
+                    outline=(edge_rgb[0], edge_rgb[1], edge_rgb[2], a),
+                    width=1,
+                )
+            flip_overlay = Image.alpha_composite(flip_overlay, _tier_blur(edge_glow, 1.8, tier))
     elif style == "paper_relief":
-        shadow = Image.new("RGBA", (w, h), (0, 0, 0, 0))
-        sd = ImageDraw.Draw(shadow)
-        sd.rounded_rectangle([(cx + 14, cy + 22), (cx + cw + 14, cy + ch + 22)], radius=38, fill=(52, 70, 92, 68))
-        img = Image.alpha_composite(img, shadow.filter(ImageFilter.GaussianBlur(18)))
+        img = _composite_shadow(img, [((cx + 14, cy + 22, cx + cw + 14, cy + ch + 22), 38, (52, 70, 92, 68))], 18, tier)
 
         dc.rounded_rectangle([(cx, cy), (cx + cw, cy + ch)], radius=38, fill=(255, 255, 255, min(255, alpha + 10)))
 
@@ -1298,15 +1568,16 @@ def draw_poster(content, date_str, title, cfg):
         for i in range(18):
             a = int(52 * (1 - i / 18))
             fd.line([(cx + 48, cy + ch - 18 + i), (cx + cw - 48, cy + ch - 18 + i)], fill=(68, 84, 106, a), width=1)
-        flip_overlay = frame.filter(ImageFilter.GaussianBlur(0.7))
+        flip_overlay = _tier_blur(frame, 0.7, tier)
     else:
         dc.rounded_rectangle([(cx, cy), (cx + cw, cy + ch)], radius=15, fill=(255, 255, 255, alpha))
     img = Image.alpha_composite(img, card)
     if flip_overlay is not None:
         img = Image.alpha_composite(img, flip_overlay)
     draw = ImageDraw.Draw(img)
+    clock.mark("card")
 
-    logo = _load_image(cfg.get("logo_image_path"))
+    logo = _load_image(cfg.get("logo_image_path"), fit.get("logo_image_path"))
     if logo:
         logo_size = 220
         logo_half = logo_size // 2
@@ -1322,6 +1593,7 @@ def draw_poster(content, date_str, title, cfg):
         ring.putalpha(ring_mask)
         img.alpha_composite(ring, (ring_x, ring_y))
         img.alpha_composite(logo_layer, (lx, int(ly - logo_half)))
+        clock.mark("logo")
 
     cur = cy + 190
     title_size = 81 if (is_holiday_mode and holiday_text_style == "festive") else (79 if is_holiday_mode else 75)
@@ -1447,11 +1719,12 @@ def draw_poster(content, date_str, title, cfg):
             if is_holiday_mode and not is_note:
                 cur += 6 if holiday_text_style == "festive" else 4
 
+    clock.mark("text")
     fy = footer_start_y
     for x in range(cx + 40, cx + cw - 40, 20):
         draw.line([(x, fy), (x + 10, fy)], fill=("#7F8EA3" if is_dark_style else "#DDDDDD"), width=2)
 
-    qr = _load_image(cfg.get("qrcode_image_path"))
+    qr = _load_image(cfg.get("qrcode_image_path"), fit.get("qrcode_image_path"))
     if qr:
         qr.thumbnail((260, 260))
         qx, qy = cx + 50, fy + 70
@@ -1476,7 +1749,7 @@ def draw_poster(content, date_str, title, cfg):
             draw.text((w // 2, cy2), f"地址：{cfg['address']}", font=get_font(28), fill=("#AAB6C5" if is_dark_style else "#999"), anchor="mm")
         draw.text((w // 2, cy2 + 100), cfg.get("slogan", ""), font=get_font(35, True), fill=(theme_unit if is_dark_style else "#5CAF5F"), anchor="mm")
 
-    st = _load_image(cfg.get("stamp_image_path"))
+    st = _load_image(cfg.get("stamp_image_path"), fit.get("stamp_image_path"))
     if st:
         st.thumbnail((260, 260))
         st.putalpha(ImageEnhance.Brightness(st.split()[3]).enhance(float(cfg.get("stamp_opacity", 0.85))))
@@ -1485,6 +1758,7 @@ def draw_poster(content, date_str, title, cfg):
         layer = Image.new("RGBA", (w, h), (0, 0, 0, 0))
         layer.paste(st, (sx, sy))
         img = Image.alpha_composite(img, layer)
+    clock.mark("footer")
 
     if cfg.get("watermark_enabled") and cfg.get("watermark_text"):
         img = _apply_watermark(
@@ -1493,6 +1767,7 @@ def draw_poster(content, date_str, title, cfg):
             float(cfg.get("watermark_opacity", 0.15)),
             float(cfg.get("watermark_density", 1.0)),
         )
+        clock.mark("watermark")
     return img
 
 
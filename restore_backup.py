@@ -0,0 +1,120 @@
+﻿import argparse
+import json
+import os
+import sys
+import tempfile
+import zipfile
+
+# Applies a full backup and then its incremental backups, in order, onto a data directory.
+# Stop the web service before running: the SQLite files are replaced underneath it.
+
+SKIPPED_ENTRIES = {"manifest.json", "export.json"}
+SQLITE_SIDECARS = ("-wal", "-shm")
+
+
+def _read_manifest(zf, archive_path):
+    try:
+        return json.loads(zf.read("manifest.json").decode("utf-8"))
+    except KeyError:
+        raise SystemExit(f"{archive_path}: 缺少 manifest.json，不是管理后台导出的备份")
+
+
+def _safe_target(data_dir, rel_path):
+    root = os.path.realpath(data_dir)
+    target = os.path.realpath(os.path.join(root, rel_path))
+    if os.path.isabs(rel_path) or not target.startswith(root + os.sep):
+        raise SystemExit(f"拒绝写入数据目录之外的路径：{rel_path}")
+    return target
+
+
+def _check_chain(archives):
+    manifests = []
+    for index, archive_path in enumerate(archives):
+        with zipfile.ZipFile(archive_path) as zf:
+            manifest = _read_manifest(zf, archive_path)
+        kind = manifest.get("type", "full")
+        if index == 0 and kind != "full":
+            raise SystemExit(f"{archive_path}: 第一个备份必须是完整备份")
+        if index > 0:
+            if kind != "incremental":
+                raise SystemExit(f"{archive_path}: 完整备份只能放在第一个")
+            expected = manifests[-1].get("backup_id", "")
+            if manifest.get("base_backup_id") != expected:
+                raise SystemExit(
+                    f"{archive_path}: 基于 {manifest.get('base_backup_id') or '(未知)'}，"
+                    f"但上一个备份是 {expected or '(未知)'}，备份链不连续"
+                )
+        manifests.append(manifest)
+    return manifests
+
+
+def _remove(path, dry_run):
+    if dry_run or not os.path.lexists(path):
+        return
+    os.remove(path)
+
+
+def _extract(zf, name, target, dry_run):
+    if dry_run:
+        return
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), prefix=".restore_")
+    try:
+        with os.fdopen(fd, "wb") as dest, zf.open(name) as src:
+            while True:
+                chunk = src.read(1024 * 1024)
+                if not chunk:
+                    break
+                dest.write(chunk)
+        if target.endswith(".sqlite3"):
+            # A stale WAL from the old database would be replayed onto the restored one.
+            for suffix in SQLITE_SIDECARS:
+                _remove(target + suffix, False)
+        os.replace(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _apply(archive_path, manifest, data_dir, dry_run):
+    failed = {str(item.get("path", "")) for item in manifest.get("errors") or []}
+    deleted = manifest.get("deleted") or []
+    written = 0
+    for rel_path in deleted:
+        target = _safe_target(data_dir, rel_path)
+        print(f"  删除 {rel_path}")
+        _remove(target, dry_run)
+    with zipfile.ZipFile(archive_path) as zf:
+        for info in zf.infolist():
+            name = info.filename
+            if info.is_dir() or name in SKIPPED_ENTRIES:
+                continue
+            if name in failed:
+                # Truncated entries are left alone; the previous copy (if any) is kept.
+                print(f"  跳过 {name}（备份时读取失败）")
+                continue
+            _extract(zf, name, _safe_target(data_dir, name), dry_run)
+            written += 1
+    print(f"  写入 {written} 个文件，删除 {len(deleted)} 个文件")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="按顺序恢复完整备份及其后的增量备份")
+    parser.add_argument("--data-dir", required=True, help="要恢复到的数据目录（POSTER_DATA_DIR）")
+    parser.add_argument("--dry-run", action="store_true", help="只打印操作，不修改文件")
+    parser.add_argument("archives", nargs="+", help="完整备份 zip，后接增量备份 zip（按生成顺序）")
+    args = parser.parse_args(argv)
+
+    manifests = _check_chain(args.archives)
+    if not args.dry_run:
+        os.makedirs(args.data_dir, exist_ok=True)
+    for archive_path, manifest in zip(args.archives, manifests):
+        print(f"{archive_path}: {manifest.get('type', 'full')} {manifest.get('backup_id', '')}")
+        _apply(archive_path, manifest, args.data_dir, args.dry_run)
+    print("完成" if not args.dry_run else "完成（dry run，未修改任何文件）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
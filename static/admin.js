@@ -1,5 +1,10 @@
 ﻿const TOKEN_KEY = "poster_admin_token_v1";
 const DIALOG_EMPTY = () => {};
+const USER_PAGE_SIZE = 50;
+const userListState = {
+  page: 1,
+  totalPages: 1,
+};
 const dialogState = {
   resolver: DIALOG_EMPTY,
   mode: "alert",
@@ -147,13 +152,58 @@ function renderUsers(rows) {
     .join("");
 }
 
+function buildUserListQuery() {
+  const [sort, order] = String($("userSortSelect").value || "last_active:desc").split(":");
+  const params = new URLSearchParams({
+    page: String(userListState.page),
+    page_size: String(USER_PAGE_SIZE),
+    sort,
+    order,
+    type: $("userTypeSelect").value || "all",
+  });
+  const q = ($("userSearchInput").value || "").trim();
+  if (q) params.set("q", q);
+  return params.toString();
+}
+
+function syncPager(total) {
+  userListState.totalPages = Math.max(1, Math.ceil(total / USER_PAGE_SIZE));
+  $("pageText").textContent = `第 ${userListState.page} / ${userListState.totalPages} 页`;
+  $("prevPageBtn").disabled = userListState.page <= 1;
+  $("nextPageBtn").disabled = userListState.page >= userListState.totalPages;
+}
+
 async function refreshUsers() {
   saveToken(getToken());
   setStatus("加载用户中...");
-  const data = await adminJson("/api/admin/users");
+  const data = await adminJson(`/api/admin/users?${buildUserListQuery()}`);
+  const total = Number(data.total || 0);
   renderUsers(data.users || []);
-  $("totalText").textContent = `总数 ${Number(data.total || 0)}`;
-  setStatus(`已加载 ${Number(data.total || 0)} 个用户`, "ok");
+  $("totalText").textContent = `总数 ${total}`;
+  syncPager(total);
+  if (userListState.page > userListState.totalPages) {
+    userListState.page = userListState.totalPages;
+    await refreshUsers();
+    return;
+  }
+  setStatus(`已加载 ${(data.users || []).length} / ${total} 个用户`, "ok");
+}
+
+async function reloadUsersFromFirstPage() {
+  userListState.page = 1;
+  try {
+    await refreshUsers();
+  } catch (e) {
+    setStatus(e.message || "加载失败", "err");
+  }
+}
+
+function debounce(fn, wait) {
+  let timer = 0;
+  return (...args) => {
+    window.clearTimeout(timer);
+    timer = window.setTimeout(() => fn(...args), wait);
+  };
 }
 
 function triggerDownload(blob, filename) {
@@ -174,6 +224,14 @@ async function downloadFile(path, fallbackName) {
   const m = dispo.match(/filename\*?=(?:UTF-8''|\"?)([^\";]+)/i);
   const name = m ? decodeURIComponent(m[1].replace(/"/g, "")) : fallbackName;
   triggerDownload(blob, name);
+  return resp;
+}
+
+const LAST_BACKUP_KEY = "poster_admin_last_backup_id";
+
+function rememberBackupId(resp) {
+  const backupId = String(resp.headers.get("x-backup-id") || "");
+  if (backupId) localStorage.setItem(LAST_BACKUP_KEY, backupId);
 }
 
 async function handleResetPassword(userId) {
@@ -240,17 +298,45 @@ async function handleCleanupGuests(includeOutputs) {
     ? "将清理全部访客账号（guest_ 开头）"
     : `将清理最后活跃时间早于 ${fmt(cutoff)} 的访客账号`;
   const outputsText = includeOutputs ? "会同时删除导出文件" : "会保留导出文件";
-  const ok = await appConfirm(`${scopeText}\n${outputsText}\n是否继续？`, "清理访客确认");
+  setStatus("统计待清理访客中...");
+  const preview = await adminJson("/api/admin/guests/cleanup", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ days, include_outputs: includeOutputs, dry_run: true }),
+  });
+  const candidateCount = Number(preview.candidate_count || 0);
+  if (!candidateCount) {
+    setStatus("没有符合条件的访客账号", "ok");
+    return;
+  }
+  const countText = `共 ${candidateCount} 个访客，涉及 ${Number(preview.output_count || 0)} 个导出记录`;
+  const ok = await appConfirm(`${scopeText}\n${countText}\n${outputsText}\n是否继续？`, "清理访客确认");
   if (!ok) return;
   const data = await adminJson("/api/admin/guests/cleanup", {
     method: "POST",
     headers: { "Content-Type": "application/json" },
     body: JSON.stringify({ days, include_outputs: includeOutputs }),
   });
-  setStatus(`已清理 ${data.removed_count || 0} 个访客账号`, "ok");
+  const job = await waitForJob(data.job?.job_id, (progress) => {
+    setStatus(`清理访客中... ${Number(progress.processed || 0)} / ${Number(progress.total || candidateCount)}`);
+  });
+  setStatus(`已清理 ${job.result?.removed_count || 0} 个访客账号`, "ok");
   await refreshUsers();
 }
 
+async function waitForJob(jobId, onProgress) {
+  if (!jobId) throw new Error("任务创建失败");
+  for (;;) {
+    await new Promise((resolve) => window.setTimeout(resolve, 1000));
+    const data = await adminJson(`/api/admin/jobs/${encodeURIComponent(jobId)}`);
+    const job = data.job || {};
+    if (job.state === "done") return job;
+    if (job.state === "failed") throw new Error(job.error || "任务执行失败");
+    if (job.state === "interrupted") throw new Error("任务已中断，请重新发起");
+    onProgress(job.progress || {});
+  }
+}
+
 function wireActions() {
   $("adminDialogConfirmBtn")?.addEventListener("click", () => {
     if (dialogState.mode === "prompt") {
@@ -276,6 +362,30 @@ function wireActions() {
     }
   });
 
+  $("userSearchInput").addEventListener("input", debounce(reloadUsersFromFirstPage, 300));
+  $("userTypeSelect").addEventListener("change", reloadUsersFromFirstPage);
+  $("userSortSelect").addEventListener("change", reloadUsersFromFirstPage);
+
+  $("prevPageBtn").addEventListener("click", async () => {
+    if (userListState.page <= 1) return;
+    userListState.page -= 1;
+    try {
+      await refreshUsers();
+    } catch (e) {
+      setStatus(e.message || "加载失败", "err");
+    }
+  });
+
+  $("nextPageBtn").addEventListener("click", async () => {
+    if (userListState.page >= userListState.totalPages) return;
+    userListState.page += 1;
+    try {
+      await refreshUsers();
+    } catch (e) {
+      setStatus(e.message || "加载失败", "err");
+    }
+  });
+
   $("exportJsonBtn").addEventListener("click", async () => {
     try {
       setStatus("请求导出数据中...");
@@ -300,13 +410,29 @@ function wireActions() {
   $("downloadBackupBtn").addEventListener("click", async () => {
     try {
       setStatus("准备下载完整备份...");
-      await downloadFile("/api/admin/backup", "poster_backup.zip");
+      rememberBackupId(await downloadFile("/api/admin/backup", "poster_backup.zip"));
       setStatus("完整备份下载完成", "ok");
     } catch (e) {
       setStatus(e.message || "下载失败", "err");
     }
   });
 
+  $("downloadIncrBackupBtn").addEventListener("click", async () => {
+    const since = localStorage.getItem(LAST_BACKUP_KEY) || "";
+    if (!since) {
+      setStatus("请先下载一次完整备份，再下载增量备份", "err");
+      return;
+    }
+    try {
+      setStatus("准备下载增量备份...");
+      const resp = await downloadFile(`/api/admin/backup?since=${encodeURIComponent(since)}`, "poster_backup_incr.zip");
+      rememberBackupId(resp);
+      setStatus("增量备份下载完成", "ok");
+    } catch (e) {
+      setStatus(e.message || "下载失败", "err");
+    }
+  });
+
   $("downloadLiteBackupBtn").addEventListener("click", async () => {
     try {
       setStatus("准备下载轻量备份...");
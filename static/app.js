@@ -4,6 +4,7 @@
   defaultLogos: [],
   systemTemplates: {},
   systemTemplateMeta: {},
+  customTemplates: {},
   currentUser: "",
   isGuest: true,
   guestRegisterTipShown: false,
@@ -23,6 +24,8 @@ const UPLOAD_PREVIEW_FIELDS = [
   { key: "stamp_image_path", thumbId: "stampThumb", wrapId: "stampThumbWrap", removeBtnId: "stampThumbRemoveBtn", uploadInputId: "stampUpload", label: "印章" },
   { key: "qrcode_image_path", thumbId: "qrThumb", wrapId: "qrThumbWrap", removeBtnId: "qrThumbRemoveBtn", uploadInputId: "qrUpload", label: "二维码" },
 ];
+// Kept in the template store (/api/templates), not in the render config.
+const TEMPLATE_STORE_FIELDS = ["custom_templates", "shop_name_hist", "address_hist", "phone_hist", "slogan_hist"];
 const AVAILABLE_CARD_STYLES = new Set(["single", "stack", "block", "flip", "ticket", "double", "aurora", "paper_relief"]);
 const LEGACY_CARD_STYLE_MAP = Object.freeze({
   soft: "single",
@@ -59,12 +62,17 @@ const MOBILE_DOUBLE_TAP_MAX_MOVE_PX = 24;
 const PRICE_SORT_TOUCH_DELAY_MS = 140;
 const PREVIEW_SLOW_HINT_DELAY_MS = 2500;
 const PREVIEW_SLOW_HINT_TEXT = "网络较慢，已进入后台加载，不影响后续操作";
+const PREVIEW_DEGRADED_TEXT = "预览已更新（高峰期已简化特效，下载仍为完整画质）";
+const PREVIEW_BUSY_MAX_RETRIES = 5;
+const PREVIEW_BUSY_BASE_DELAY_MS = 1000;
+const PREVIEW_BUSY_MAX_DELAY_MS = 15000;
 let templateManagerTipHideTimer = 0;
 let templateManagerTipFadeTimer = 0;
 let mobilePreviewLastTapAt = 0;
 let mobilePreviewLastTapPos = null;
 let previewFocusToastTimer = 0;
 let previewSlowHintTimer = 0;
+let previewBusyRetryTimer = 0;
 let previewRunwayMaxTravelPx = 0;
 let pageScrollSyncRaf = 0;
 let guestDraftSaveTimer = 0;
@@ -477,6 +485,8 @@ async function api(url, method = "GET", body = null) {
   if (!res.ok) {
     const err = new Error(payload.error || payload.message || `请求失败(${res.status})`);
     err.requestId = requestId || payload.request_id || "";
+    err.status = res.status;
+    err.retryAfter = Number(res.headers.get("Retry-After") || payload.retry_after || 0) || 0;
     throw err;
   }
   return payload;
@@ -1255,8 +1265,14 @@ function showSettingsFirstUseTip() {
   autoCloseTimer = window.setTimeout(closeTip, 12000);
 }
 
+function withoutTemplateStoreFields(cfg) {
+  const out = { ...(cfg || {}) };
+  TEMPLATE_STORE_FIELDS.forEach((key) => delete out[key]);
+  return out;
+}
+
 function buildConfigPayloadForSave() {
-  const payload = { ...formConfig(), custom_templates: state.config.custom_templates || {} };
+  const payload = formConfig();
   payload.last_title = $("titleInput").value.trim();
   payload.last_date = $("dateInput").value.trim();
   payload.last_content = $("contentInput").value;
@@ -1356,7 +1372,7 @@ function saveGuestDraft(options = {}) {
   if (!state.isGuest) return;
   const defer = !!options.defer;
   try {
-    const config = buildConfigPayloadForSave();
+    const config = { ...buildConfigPayloadForSave(), custom_templates: state.customTemplates };
     const snapshot = JSON.stringify(config);
     if (snapshot === lastGuestDraftConfigSnapshot) return;
     if (guestDraftSaveTimer) {
@@ -1614,7 +1630,7 @@ function closeLoginModal() {
 
 function formConfig() {
   return {
-    ...state.config,
+    ...withoutTemplateStoreFields(state.config),
     theme_color: $("themeColor").value,
     card_style: $("cardStyle").value,
     price_color_mode: $("priceColorMode").value,
@@ -1844,8 +1860,8 @@ function applyTemplateByName(name) {
     syncMainPriceEditorFromContent();
     return true;
   }
-  if (state.config.custom_templates?.[name]) {
-    $("contentInput").value = state.config.custom_templates[name] || "";
+  if (state.customTemplates[name]) {
+    $("contentInput").value = state.customTemplates[name] || "";
     syncMainPriceEditorFromContent();
     return true;
   }
@@ -2631,8 +2647,33 @@ function startPreviewSlowHintTimer(seq) {
   }, PREVIEW_SLOW_HINT_DELAY_MS);
 }
 
+function clearPreviewBusyRetryTimer() {
+  if (previewBusyRetryTimer) {
+    clearTimeout(previewBusyRetryTimer);
+    previewBusyRetryTimer = 0;
+  }
+}
+
+function schedulePreviewBusyRetry(seq, attempt, retryAfter) {
+  // Exponential backoff with jitter, never sooner than the server's Retry-After.
+  const backoff = Math.max(retryAfter * 1000, PREVIEW_BUSY_BASE_DELAY_MS * 2 ** (attempt - 1));
+  const delay = Math.round(Math.min(PREVIEW_BUSY_MAX_DELAY_MS, backoff) * (0.8 + Math.random() * 0.4));
+  const text = `当前生成人数较多，${Math.ceil(delay / 1000)} 秒后自动重试预览`;
+  $("statusText").textContent = text;
+  if (!$("previewImage").src) {
+    setPreviewLoading(text);
+  }
+  clearPreviewBusyRetryTimer();
+  previewBusyRetryTimer = setTimeout(() => {
+    previewBusyRetryTimer = 0;
+    if (seq !== state.previewSeq) return;
+    refreshPreview({ force: true, busyAttempt: attempt });
+  }, delay);
+}
+
 async function refreshPreview(options = {}) {
   const force = !!options.force;
+  const busyAttempt = Number(options.busyAttempt) || 0;
   const payload = {
     title: $("titleInput").value.trim(),
     date: $("dateInput").value.trim(),
@@ -2647,6 +2688,7 @@ async function refreshPreview(options = {}) {
   }
 
   const seq = ++state.previewSeq;
+  clearPreviewBusyRetryTimer();
   previewInFlightPayloadSnapshot = payloadSnapshot;
   $("statusText").textContent = "正在生成预览...";
   if (!$("previewImage").src) {
@@ -2669,7 +2711,8 @@ async function refreshPreview(options = {}) {
         clearPreviewSlowHintTimer();
         $("previewImage").src = preload.src;
         setPreviewLoaded();
-        $("statusText").textContent = !data.valid && data.warnings.length ? data.warnings[0] : "预览已更新";
+        const updatedText = data.quality && data.quality !== "full" ? PREVIEW_DEGRADED_TEXT : "预览已更新";
+        $("statusText").textContent = !data.valid && data.warnings.length ? data.warnings[0] : updatedText;
       };
       preload.onerror = () => {
         if (seq !== state.previewSeq) return;
@@ -2700,6 +2743,10 @@ async function refreshPreview(options = {}) {
     if (seq !== state.previewSeq) return;
     previewInFlightPayloadSnapshot = "";
     clearPreviewSlowHintTimer();
+    if (e?.status === 503 && busyAttempt < PREVIEW_BUSY_MAX_RETRIES) {
+      schedulePreviewBusyRetry(seq, busyAttempt + 1, e.retryAfter || 0);
+      return;
+    }
     if (!$("previewImage").src) {
       setPreviewLoading("预览生成失败");
     }
@@ -2743,7 +2790,18 @@ async function init() {
   setPreviewLoading("正在准备模板...");
   const remoteConfig = data.config || {};
   const guestDraft = readGuestDraft();
-  state.config = state.isGuest && guestDraft ? { ...remoteConfig, ...guestDraft } : remoteConfig;
+  state.config = withoutTemplateStoreFields(state.isGuest && guestDraft ? { ...remoteConfig, ...guestDraft } : remoteConfig);
+  if (state.isGuest) {
+    state.customTemplates = { ...(guestDraft?.custom_templates || {}) };
+  } else {
+    try {
+      const tplData = await api("/api/templates");
+      state.customTemplates = tplData.templates || {};
+    } catch (e) {
+      state.customTemplates = {};
+      showStatusError(e.message || "自定义模板加载失败");
+    }
+  }
   state.systemTemplates = data.system_templates || {};
   state.systemTemplateMeta = data.system_template_meta || {};
   state.presets = data.presets || [];
@@ -2810,7 +2868,7 @@ async function init() {
   const tplSel = $("templateSelect");
   tplSel.innerHTML = "";
   Object.keys(state.systemTemplates).forEach((name) => tplSel.add(new Option(name, name)));
-  Object.keys(state.config.custom_templates || {}).forEach((name) => tplSel.add(new Option(name, name)));
+  Object.keys(state.customTemplates).forEach((name) => tplSel.add(new Option(name, name)));
 
   const initialTemplateName = resolveInitialTemplateName(tplSel);
   if (initialTemplateName) tplSel.value = initialTemplateName;
@@ -3278,8 +3336,16 @@ async function init() {
     const trimmed = name.trim();
     if (!trimmed) return;
 
-    state.config.custom_templates ||= {};
-    state.config.custom_templates[trimmed] = $("contentInput").value;
+    const content = $("contentInput").value;
+    if (!state.isGuest) {
+      try {
+        await api(`/api/templates/${encodeURIComponent(trimmed)}`, "PUT", { content });
+      } catch (e) {
+        showStatusError(e.message || "模板保存失败");
+        return;
+      }
+    }
+    state.customTemplates[trimmed] = content;
 
     if (![...$("templateSelect").options].find((o) => o.value === trimmed)) {
       $("templateSelect").add(new Option(trimmed, trimmed));
@@ -3299,7 +3365,15 @@ async function init() {
     }
     const ok = await appConfirm(`确认删除模板“${name}”吗？此操作不可撤销。`, "删除模板");
     if (!ok) return;
-    delete state.config.custom_templates[name];
+    if (!state.isGuest) {
+      try {
+        await api(`/api/templates/${encodeURIComponent(name)}`, "DELETE");
+      } catch (e) {
+        showStatusError(e.message || "模板删除失败");
+        return;
+      }
+    }
+    delete state.customTemplates[name];
     $("templateSelect").querySelector(`option[value="${name}"]`)?.remove();
     if ($("templateSelect").options.length > 0) {
       $("templateSelect").value = $("templateSelect").options[0].value;
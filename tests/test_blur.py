@@ -0,0 +1,81 @@
+import random
+
+import pytest
+from PIL import Image, ImageChops, ImageDraw, ImageFilter, ImageStat
+
+from poster_engine import CANVAS_SIZE, gaussian_blur
+
+# Error bounds of gaussian_blur against the exact ImageFilter.GaussianBlur, in
+# 8-bit levels per channel: (max, mean).
+SMOOTH_BOUND = (4, 0.3)
+WORST_BOUND = (10, 1.5)
+RADII = [12, 16, 24, 40, 120]
+
+
+def _noise():
+    w, h = CANVAS_SIZE
+    return Image.frombytes("RGB", (w, h), random.Random(0).randbytes(w * h * 3))
+
+
+def _lines():
+    img = Image.new("RGB", CANVAS_SIZE, "white")
+    d = ImageDraw.Draw(img)
+    for y in range(0, CANVAS_SIZE[1], 7):
+        d.line([(0, y), (CANVAS_SIZE[0], y)], fill=(0, 0, 0), width=2)
+    for x in range(0, CANVAS_SIZE[0], 13):
+        d.line([(x, 0), (x, CANVAS_SIZE[1])], fill=(200, 30, 30), width=1)
+    return img
+
+
+def _shadow():
+    img = Image.new("RGBA", CANVAS_SIZE, (0, 0, 0, 0))
+    ImageDraw.Draw(img).rounded_rectangle([(100, 200), (1000, 1700)], radius=40, fill=(0, 0, 0, 76))
+    return img
+
+
+def _photo():
+    return Image.open("presets/backgrounds/preset_neon_city.png").convert("RGB").resize(CANVAS_SIZE)
+
+
+def _screenshot():
+    return Image.open("docs/screenshots/home-desktop.png").convert("RGB").resize(CANVAS_SIZE)
+
+
+INPUTS = {
+    "noise": (_noise, WORST_BOUND),
+    "lines": (_lines, WORST_BOUND),
+    "shadow": (_shadow, SMOOTH_BOUND),
+    "photo": (_photo, SMOOTH_BOUND),
+    "screenshot": (_screenshot, SMOOTH_BOUND),
+}
+
+
+@pytest.fixture(scope="module")
+def images():
+    return {name: make() for name, (make, _) in INPUTS.items()}
+
+
+def _error(img, radius):
+    diff = ImageChops.difference(img.filter(ImageFilter.GaussianBlur(radius)), gaussian_blur(img, radius))
+    return max(hi for _, hi in diff.getextrema()), max(ImageStat.Stat(diff).mean)
+
+
+@pytest.mark.parametrize("radius", RADII)
+@pytest.mark.parametrize("name", list(INPUTS))
+def test_error_within_bound(images, name, radius):
+    max_error, mean_error = _error(images[name], radius)
+    bound_max, bound_mean = INPUTS[name][1]
+    assert max_error <= bound_max
+    assert mean_error <= bound_mean
+
+
+@pytest.mark.parametrize("radius", [0.8, 4, 8, 11])
+def test_small_radius_is_exact(images, radius):
+    img = images["lines"]
+    assert ImageChops.difference(img.filter(ImageFilter.GaussianBlur(radius)), gaussian_blur(img, radius)).getbbox() is None
+
+
+def test_size_and_mode_preserved(images):
+    out = gaussian_blur(images["shadow"], 24)
+    assert out.size == CANVAS_SIZE
+    assert out.mode == "RGBA"